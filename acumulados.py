@@ -0,0 +1,145 @@
+"""Acumulados de ventas por producto y por día.
+
+Se actualizan dentro de la misma transacción que registra o cancela una venta,
+así que los reportes leen unas cuantas filas en lugar de recorrer toda la tabla
+Ventas. Para crear las tablas o recalcularlas desde cero:
+
+    python -m acumulados crear
+    python -m acumulados reconstruir
+"""
+import sys
+
+# UPDLOCK + SERIALIZABLE evita que dos primeras ventas del mismo producto o día
+# intenten insertar la misma fila a la vez
+_ACTUALIZAR_PRODUCTO = """
+UPDATE ResumenVentasProducto WITH (UPDLOCK, SERIALIZABLE)
+SET Cantidad = Cantidad + ?, Total = Total + ? WHERE NombreProducto = ?;
+IF @@ROWCOUNT = 0
+    INSERT INTO ResumenVentasProducto (NombreProducto, Cantidad, Total) VALUES (?, ?, ?);
+"""
+
+_ACTUALIZAR_DIA = """
+UPDATE ResumenVentasDia WITH (UPDLOCK, SERIALIZABLE)
+SET Cantidad = Cantidad + ?, Total = Total + ? WHERE Fecha = {fecha};
+IF @@ROWCOUNT = 0
+    INSERT INTO ResumenVentasDia (Fecha, Cantidad, Total) VALUES ({fecha}, ?, ?);
+"""
+
+# Fuera de SQL Server, una sentencia por fila con ON CONFLICT hace lo mismo sin candados explícitos
+_SUMAR_PRODUCTO = """
+INSERT INTO ResumenVentasProducto (NombreProducto, Cantidad, Total) VALUES (?, ?, ?)
+ON CONFLICT (NombreProducto) DO UPDATE SET
+    Cantidad = ResumenVentasProducto.Cantidad + excluded.Cantidad,
+    Total = ResumenVentasProducto.Total + excluded.Total;
+"""
+
+_SUMAR_DIA = """
+INSERT INTO ResumenVentasDia (Fecha, Cantidad, Total) VALUES ({fecha}, ?, ?)
+ON CONFLICT (Fecha) DO UPDATE SET
+    Cantidad = ResumenVentasDia.Cantidad + excluded.Cantidad,
+    Total = ResumenVentasDia.Total + excluded.Total;
+"""
+
+
+def _aplicar_lote(cursor, ventas, signo):
+    lote = ["SET NOCOUNT ON;", "DECLARE @hoy DATE = CAST(GETDATE() AS DATE);"]
+    params = []
+    for nombre_producto, cantidad, total, fecha in ventas:
+        cantidad, total = signo * cantidad, signo * total
+        lote.append(_ACTUALIZAR_PRODUCTO)
+        params.extend((cantidad, total, nombre_producto, nombre_producto, cantidad, total))
+        if fecha is None:
+            lote.append(_ACTUALIZAR_DIA.format(fecha="@hoy"))
+            params.extend((cantidad, total, cantidad, total))
+        else:
+            lote.append(_ACTUALIZAR_DIA.format(fecha="?"))
+            params.extend((cantidad, total, fecha, fecha, cantidad, total))
+    # Un solo viaje para todas las ventas; recorrer los resultados propaga cualquier error
+    cursor.execute("\n".join(lote), params)
+    while cursor.nextset():
+        pass
+
+
+def _aplicar(cursor, dialecto, ventas, signo):
+    if not dialecto.conflicto:
+        _aplicar_lote(cursor, ventas, signo)
+        return
+    for nombre_producto, cantidad, total, fecha in ventas:
+        cantidad, total = signo * cantidad, signo * total
+        cursor.execute(_SUMAR_PRODUCTO, (nombre_producto, cantidad, total))
+        if fecha is None:
+            cursor.execute(_SUMAR_DIA.format(fecha=dialecto.hoy), (cantidad, total))
+        else:
+            cursor.execute(_SUMAR_DIA.format(fecha="?"), (fecha, cantidad, total))
+
+
+def registrar_ventas(cursor, dialecto, ventas):
+    """Suma ventas nuevas. `ventas` es una lista de `(nombre_producto, cantidad, total)` con fecha de hoy."""
+    _aplicar(cursor, dialecto, [(nombre, cantidad, total, None) for nombre, cantidad, total in ventas], 1)
+
+
+def revertir_ventas(cursor, dialecto, ventas):
+    """Resta ventas canceladas. `ventas` es una lista de `(nombre_producto, cantidad, total, fecha)`."""
+    _aplicar(cursor, dialecto, ventas, -1)
+
+
+def reconstruir(cursor, dialecto):
+    """Recalcula ambos acumulados desde Ventas.
+
+    Las tablas quedan bloqueadas hasta el commit, así que las ventas concurrentes
+    esperan y se suman sobre el resultado recalculado.
+    """
+    dialecto.vaciar_bloqueando(cursor, "ResumenVentasProducto")
+    dialecto.vaciar_bloqueando(cursor, "ResumenVentasDia")
+    cursor.execute("""
+    INSERT INTO ResumenVentasProducto (NombreProducto, Cantidad, Total)
+    SELECT NombreProducto, SUM(Cantidad), SUM(TotalCompra)
+    FROM Ventas
+    WHERE NombreProducto IS NOT NULL
+    GROUP BY NombreProducto;
+    """)
+    fecha = dialecto.fecha("FechaVenta")
+    cursor.execute(f"""
+    INSERT INTO ResumenVentasDia (Fecha, Cantidad, Total)
+    SELECT {fecha}, SUM(Cantidad), SUM(TotalCompra)
+    FROM Ventas
+    GROUP BY {fecha};
+    """)
+
+
+QUERY_GANANCIA_TOTAL = "SELECT SUM(Total) FROM ResumenVentasProducto;"
+
+QUERY_MAS_SOLICITADOS = """
+SELECT NombreProducto, Cantidad AS TotalVendido
+FROM ResumenVentasProducto
+WHERE Cantidad > 0
+ORDER BY Cantidad DESC;
+"""
+
+QUERY_VENTAS_POR_DIA = """
+SELECT Fecha, Cantidad, Total
+FROM ResumenVentasDia
+WHERE Fecha >= ? AND Fecha <= ?
+ORDER BY Fecha;
+"""
+
+
+def main(argv):
+    import esquema
+    from main import backend, pool
+
+    if len(argv) != 1 or argv[0] not in ("crear", "reconstruir"):
+        print(__doc__)
+        return 2
+    with pool.conexion() as conn:
+        cursor = conn.cursor()
+        if argv[0] == "crear":
+            esquema.crear_tablas(backend.url, esquema.TABLAS_ACUMULADOS)
+        reconstruir(cursor, backend.dialecto)
+        conn.commit()
+    print("Acumulados de ventas reconstruidos")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
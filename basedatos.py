@@ -0,0 +1,396 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class PoolAgotado(Exception):
+    """No se consiguió una conexión libre dentro del tiempo de espera."""
+
+
+class ConexionPrestada:
+    """Envoltura de una conexión del pool: al cerrarla vuelve al pool en lugar de cerrarse."""
+
+    def __init__(self, pool, conexion):
+        self._pool = pool
+        self._conexion = conexion
+
+    def close(self):
+        if self._conexion is not None:
+            conexion, self._conexion = self._conexion, None
+            self._pool.liberar(conexion)
+
+    def __getattr__(self, nombre):
+        if self._conexion is None:
+            raise AttributeError("La conexión ya fue devuelta al pool")
+        return getattr(self._conexion, nombre)
+
+
+class PoolConexiones:
+    """Pool de conexiones DBAPI con tamaño mínimo/máximo, verificación de salud,
+    expulsión de conexiones inactivas y tiempo máximo de espera al pedir una conexión.
+
+    `fabrica` es cualquier función sin argumentos que devuelva una conexión DBAPI
+    (pyodbc.connect, sqlite3.connect, ...). Si se pasa un `observador`, recibe el
+    tiempo de espera de cada préstamo en `observar_adquisicion(segundos)`.
+    """
+
+    def __init__(
+        self,
+        fabrica,
+        minimo=1,
+        maximo=10,
+        timeout_espera=30.0,
+        max_inactividad=300.0,
+        intervalo_verificacion=30.0,
+        consulta_verificacion="SELECT 1",
+        observador=None,
+    ):
+        if minimo < 0 or maximo < 1 or minimo > maximo:
+            raise ValueError("Tamaño de pool inválido")
+        self.fabrica = fabrica
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout_espera = timeout_espera
+        self.max_inactividad = max_inactividad
+        self.intervalo_verificacion = intervalo_verificacion
+        self.consulta_verificacion = consulta_verificacion
+        self.observador = observador
+
+        self._inactivas = deque()  # (conexion, ultimo_uso)
+        self._en_uso = 0
+        self._cerrado = False
+        self._condicion = threading.Condition()
+        self._stats = {
+            "creadas": 0,
+            "descartadas": 0,
+            "expulsadas": 0,
+            "prestamos": 0,
+            "esperas": 0,
+            "timeouts": 0,
+            "verificaciones_fallidas": 0,
+            "tiempo_espera_total": 0.0,
+        }
+
+    # Creación / descarte -------------------------------------------------
+
+    def _crear(self):
+        conexion = self.fabrica()
+        with self._condicion:
+            self._stats["creadas"] += 1
+        return conexion
+
+    def _cerrar_silencioso(self, conexion):
+        try:
+            conexion.close()
+        except Exception as e:
+            logging.debug(f"Error al cerrar conexión del pool: {e}")
+
+    def _verificar(self, conexion):
+        try:
+            cursor = conexion.cursor()
+            cursor.execute(self.consulta_verificacion)
+            cursor.fetchall()
+            return True
+        except Exception as e:
+            logging.warning(f"Conexión del pool no responde, se descarta: {e}")
+            with self._condicion:
+                self._stats["verificaciones_fallidas"] += 1
+            return False
+
+    def _expulsar_inactivas(self, ahora):
+        # Se llama con el candado tomado; devuelve las conexiones a cerrar fuera del candado
+        expulsadas = []
+        while (
+            self._inactivas
+            and len(self._inactivas) + self._en_uso > self.minimo
+            and ahora - self._inactivas[0][1] > self.max_inactividad
+        ):
+            expulsadas.append(self._inactivas.popleft()[0])
+        self._stats["expulsadas"] += len(expulsadas)
+        return expulsadas
+
+    # Préstamo / devolución -----------------------------------------------
+
+    def adquirir(self, timeout=None):
+        timeout = self.timeout_espera if timeout is None else timeout
+        inicio = time.monotonic()
+        limite = inicio + timeout
+        espero = False
+
+        while True:
+            conexion = None
+            crear = False
+            with self._condicion:
+                if self._cerrado:
+                    raise PoolAgotado("El pool está cerrado")
+                expulsadas = self._expulsar_inactivas(inicio)
+                if self._inactivas:
+                    # LIFO: la conexión más reciente tiene menos probabilidad de estar caída
+                    conexion, ultimo_uso = self._inactivas.pop()
+                elif self._en_uso < self.maximo:
+                    crear = True
+                else:
+                    if not espero:
+                        espero = True
+                        self._stats["esperas"] += 1
+                    restante = limite - time.monotonic()
+                    if restante <= 0 or not self._condicion.wait(restante):
+                        if not self._inactivas and self._en_uso >= self.maximo:
+                            self._stats["timeouts"] += 1
+                            raise PoolAgotado(
+                                f"Sin conexiones disponibles tras {timeout:.1f}s (máximo {self.maximo})"
+                            )
+                    continue
+                self._en_uso += 1
+
+            for vieja in expulsadas:
+                self._cerrar_silencioso(vieja)
+
+            try:
+                if crear:
+                    conexion = self._crear()
+                elif time.monotonic() - ultimo_uso > self.intervalo_verificacion and not self._verificar(conexion):
+                    self._cerrar_silencioso(conexion)
+                    with self._condicion:
+                        self._stats["descartadas"] += 1
+                    conexion = self._crear()
+            except Exception:
+                with self._condicion:
+                    self._en_uso -= 1
+                    self._condicion.notify()
+                raise
+
+            espera = time.monotonic() - inicio
+            with self._condicion:
+                self._stats["prestamos"] += 1
+                self._stats["tiempo_espera_total"] += espera
+            if self.observador is not None:
+                self.observador.observar_adquisicion(espera)
+            return conexion
+
+    def liberar(self, conexion, descartar=False):
+        if not descartar:
+            try:
+                # Cerrar cualquier transacción abierta antes de reutilizar la conexión
+                conexion.rollback()
+            except Exception:
+                descartar = True
+
+        with self._condicion:
+            self._en_uso -= 1
+            if descartar or self._cerrado:
+                self._stats["descartadas"] += 1
+            else:
+                self._inactivas.append((conexion, time.monotonic()))
+                conexion = None
+            self._condicion.notify()
+
+        if conexion is not None:
+            self._cerrar_silencioso(conexion)
+
+    @contextmanager
+    def conexion(self, timeout=None):
+        conexion = self.adquirir(timeout)
+        try:
+            yield conexion
+        finally:
+            self.liberar(conexion)
+
+    def prestada(self):
+        """Conexión envuelta cuyo close() la devuelve al pool (para el `creator` de SQLAlchemy)."""
+        return ConexionPrestada(self, self.adquirir())
+
+    # Mantenimiento -------------------------------------------------------
+
+    def precalentar(self):
+        """Abre conexiones hasta alcanzar el mínimo configurado."""
+        while True:
+            with self._condicion:
+                if self._cerrado or len(self._inactivas) + self._en_uso >= self.minimo:
+                    return
+                self._en_uso += 1
+            try:
+                conexion = self._crear()
+            except Exception:
+                with self._condicion:
+                    self._en_uso -= 1
+                raise
+            self.liberar(conexion)
+
+    def estadisticas(self):
+        with self._condicion:
+            stats = dict(self._stats)
+            stats.update(
+                minimo=self.minimo,
+                maximo=self.maximo,
+                en_uso=self._en_uso,
+                inactivas=len(self._inactivas),
+            )
+        prestamos = stats["prestamos"]
+        stats["tiempo_espera_promedio"] = stats["tiempo_espera_total"] / prestamos if prestamos else 0.0
+        return stats
+
+    def cerrar(self):
+        with self._condicion:
+            self._cerrado = True
+            inactivas = [conexion for conexion, _ in self._inactivas]
+            self._inactivas.clear()
+            self._condicion.notify_all()
+        for conexion in inactivas:
+            self._cerrar_silencioso(conexion)
+
+
+class BaseDatosAsincrona:
+    """Acceso a datos awaitable: cada operación corre en un pool de hilos acotado
+    para que las llamadas bloqueantes del driver no detengan el event loop.
+
+    El número de hilos por defecto coincide con el máximo del pool de conexiones,
+    así que nunca hay más hilos esperando conexión que conexiones posibles. Si se
+    pasa un `observador`, cada operación le reporta duración, filas y errores con
+    `observar_consulta(...)`; el tiempo de espera por conexión no se cuenta ahí.
+    """
+
+    def __init__(self, pool, max_hilos=None, observador=None):
+        self.pool = pool
+        self.observador = observador
+        self._ejecutor = ThreadPoolExecutor(max_workers=max_hilos or pool.maximo, thread_name_prefix="bd")
+
+    async def en_hilo(self, funcion, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._ejecutor, functools.partial(funcion, *args, **kwargs))
+
+    @contextmanager
+    def _medir(self, operacion, consulta, params=None, nombre=None):
+        """Reporta al observador lo que dure el bloque; dentro se anota `medicion["filas"]`."""
+        medicion = {"filas": None}
+        if self.observador is None:
+            yield medicion
+            return
+        inicio = time.perf_counter()
+        error = False
+        try:
+            yield medicion
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.observador.observar_consulta(
+                operacion, consulta, time.perf_counter() - inicio, medicion["filas"], params, error, nombre
+            )
+
+    def _consultar(self, query, params):
+        with self.pool.conexion() as conn, self._medir("consultar", query, params) as medicion:
+            cursor = conn.cursor()
+            cursor.execute(query, params or ())
+            filas = cursor.fetchall()
+            medicion["filas"] = len(filas)
+            return filas
+
+    def _ejecutar(self, query, params):
+        with self.pool.conexion() as conn, self._medir("ejecutar", query, params) as medicion:
+            cursor = conn.cursor()
+            cursor.execute(query, params or ())
+            filas_afectadas = cursor.rowcount
+            conn.commit()
+            medicion["filas"] = filas_afectadas
+            return filas_afectadas
+
+    def _transaccion(self, funcion):
+        nombre = getattr(funcion, "__qualname__", "transaccion")
+        with self.pool.conexion() as conn, self._medir("transaccion", nombre, nombre=nombre):
+            cursor = conn.cursor()
+            try:
+                resultado = funcion(cursor)
+                conn.commit()
+                return resultado
+            except Exception:
+                conn.rollback()
+                raise
+
+    def _correr(self, consulta, params):
+        with self.pool.conexion() as conn, self._medir("correr", consulta.sql, params, consulta.nombre) as medicion:
+            resultado = consulta.ejecutar(conn, params)
+            medicion["filas"] = consulta.contar(resultado)
+            return resultado
+
+    async def consultar(self, query, params=None):
+        """Ejecuta una consulta y devuelve todas las filas."""
+        return await self.en_hilo(self._consultar, query, params)
+
+    async def correr(self, consulta, params=None):
+        """Ejecuta una `consultas.Consulta` registrada; el resultado depende de su forma."""
+        return await self.en_hilo(self._correr, consulta, params)
+
+    async def ejecutar(self, query, params=None):
+        """Ejecuta una sentencia de escritura, confirma y devuelve las filas afectadas."""
+        return await self.en_hilo(self._ejecutar, query, params)
+
+    def _consultar_conjuntos(self, query, params):
+        with self.pool.conexion() as conn, self._medir("consultar_conjuntos", query, params) as medicion:
+            cursor = conn.cursor()
+            cursor.execute(query, params or ())
+            conjuntos = [cursor.fetchall()]
+            while cursor.nextset():
+                conjuntos.append(cursor.fetchall())
+            medicion["filas"] = sum(len(filas) for filas in conjuntos)
+            return conjuntos
+
+    async def consultar_conjuntos(self, query, params=None):
+        """Ejecuta un lote con varias consultas en un solo viaje y devuelve una lista de resultados por consulta."""
+        return await self.en_hilo(self._consultar_conjuntos, query, params)
+
+    def _consultar_varias(self, consultas):
+        with self.pool.conexion() as conn, self._medir("consultar_varias", "\n".join(consultas)) as medicion:
+            cursor = conn.cursor()
+            conjuntos = []
+            for consulta in consultas:
+                cursor.execute(consulta)
+                conjuntos.append(cursor.fetchall())
+            medicion["filas"] = sum(len(filas) for filas in conjuntos)
+            return conjuntos
+
+    async def consultar_varias(self, consultas):
+        """Como `consultar_conjuntos` para motores sin lotes: una consulta por viaje, misma conexión y mismo hilo."""
+        return await self.en_hilo(self._consultar_varias, consultas)
+
+    async def consultar_en_lotes(self, query, params=None, tamano_lote=1000):
+        """Generador asíncrono que entrega las filas en lotes de `fetchmany`.
+
+        La conexión queda prestada mientras dure el recorrido y se devuelve al pool
+        al terminar o si el consumidor abandona la iteración.
+        """
+        conn = await self.en_hilo(self.pool.adquirir)
+        # Sólo se mide el tiempo en la base, no el que tarda el consumidor entre lotes
+        duracion, total_filas, error = 0.0, 0, False
+        try:
+            cursor = conn.cursor()
+            inicio = time.perf_counter()
+            await self.en_hilo(cursor.execute, query, params or ())
+            duracion += time.perf_counter() - inicio
+            while True:
+                inicio = time.perf_counter()
+                filas = await self.en_hilo(cursor.fetchmany, tamano_lote)
+                duracion += time.perf_counter() - inicio
+                if not filas:
+                    break
+                total_filas += len(filas)
+                yield filas
+        except Exception:
+            error = True
+            raise
+        finally:
+            await self.en_hilo(self.pool.liberar, conn)
+            if self.observador is not None:
+                self.observador.observar_consulta("consultar_en_lotes", query, duracion, total_filas, params, error)
+
+    async def transaccion(self, funcion):
+        """Ejecuta `funcion(cursor)` en una sola transacción: commit si termina, rollback si falla."""
+        return await self.en_hilo(self._transaccion, funcion)
+
+    def cerrar(self):
+        self._ejecutor.shutdown(wait=False)
@@ -0,0 +1,387 @@
+"""Prueba de carga de main:app contra una base local.
+
+Con DATABASE_URL la base puede ser SQLite o PostgreSQL, lo más rápido para CI:
+
+    export DATABASE_URL=sqlite:///bench.db
+    python -m benchmarks.carga_mixta sembrar --productos 50000 --pedidos 1000000
+
+Para medir con el mismo dialecto que Azure SQL, un SQL Server en contenedor:
+
+    docker run -d --name tienda-bench -e ACCEPT_EULA=Y -e MSSQL_SA_PASSWORD='Bench_12345' \\
+        -p 1433:1433 mcr.microsoft.com/mssql/server:2022-latest
+
+    export DB_SERVER=localhost DB_DATABASE=TiendaBench DB_USERNAME=sa DB_PASSWORD='Bench_12345'
+    export DB_TRUST_SERVER_CERTIFICATE=yes
+
+    python -m benchmarks.carga_mixta sembrar --productos 50000 --pedidos 1000000
+    python -m benchmarks.carga_mixta correr --usuarios 50 --duracion 60 --salida base.json
+    python -m benchmarks.carga_mixta correr --usuarios 50 --duracion 60 --referencia base.json
+
+Requiere las dependencias de desarrollo (`pip install -r requirements-dev.txt`).
+
+`correr` levanta `uvicorn main:app` con esas variables (o usa `--url` para un
+servidor ya levantado) y mezcla navegación del catálogo, login, checkout,
+cancelaciones y el panel de administración. Reporta p50/p95/p99 y throughput
+por endpoint; con `--referencia` termina con código 1 si algún p95 empeora más
+que `--tolerancia`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import httpx
+
+CONTRASENA_CLIENTES = "bench-cliente"
+ADMIN = ("admin_bench", "bench-admin")
+
+# Peso de cada escenario en la mezcla de tráfico
+ESCENARIOS = {
+    "navegar": 55,
+    "login": 10,
+    "checkout": 12,
+    "cancelar": 8,
+    "panel": 15,
+}
+
+
+# Siembra -----------------------------------------------------------------
+
+SERVIDORES_LOCALES = ("localhost", "127.0.0.1")
+TAMANO_LOTE = 10000
+
+
+def insertar_en_lotes(cursor, sql, filas):
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) == TAMANO_LOTE:
+            cursor.executemany(sql, lote)
+            lote = []
+    if lote:
+        cursor.executemany(sql, lote)
+
+
+def recrear_base_sqlserver(base):
+    import pyodbc
+
+    from main import get_connect_string
+
+    with pyodbc.connect(get_connect_string(database="master"), autocommit=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"IF DB_ID(N'{base}') IS NOT NULL DROP DATABASE [{base}];")
+        cursor.execute(f"CREATE DATABASE [{base}];")
+
+
+def sembrar(args):
+    import acumulados
+    import esquema
+    from credenciales import ServicioHash
+    from dialectos import Backend
+    from main import url_base_datos
+
+    # La siembra borra y recrea la base: nunca contra el servidor de producción por omisión
+    url = url_base_datos()
+    backend = Backend(url)
+    if backend.dialecto.nombre == "mssql":
+        base = os.getenv("DB_DATABASE")
+        servidor = os.getenv("DB_SERVER", "")
+        if not base or (servidor.split(",")[0] not in SERVIDORES_LOCALES and not args.forzar):
+            raise SystemExit("Definir DB_SERVER=localhost y DB_DATABASE (o usar --forzar con un servidor de pruebas)")
+        recrear_base_sqlserver(base)
+    else:
+        base = backend.url.database
+        if backend.dialecto.nombre != "sqlite" and backend.url.host not in SERVIDORES_LOCALES and not args.forzar:
+            raise SystemExit("DATABASE_URL debe apuntar a un servidor local (o usar --forzar con un servidor de pruebas)")
+        esquema.borrar(url)
+    esquema.crear(url)
+
+    hash_clientes = asyncio.run(ServicioHash().hashear(CONTRASENA_CLIENTES))
+    inicio = time.perf_counter()
+    ahora = datetime.now().replace(microsecond=0)
+    conn = backend.conectar()
+    try:
+        cursor = conn.cursor()
+        if hasattr(cursor, "fast_executemany"):
+            cursor.fast_executemany = True
+        insertar_en_lotes(
+            cursor,
+            "INSERT INTO Productos (Nombre, Precio, Stock, Imagen) VALUES (?, ?, ?, NULL);",
+            ((f"Producto {i}", 10 + (i * 37) % 5000, 1000000) for i in range(1, args.productos + 1)),
+        )
+        insertar_en_lotes(
+            cursor,
+            "INSERT INTO Clientes (Nombre, Apellido, CorreoElectronico, NombreUsuario, Contrasena) VALUES (?, 'Bench', ?, ?, ?);",
+            (
+                (f"Cliente {i}", f"cliente{i}@bench.local", f"cliente{i}", hash_clientes)
+                for i in range(1, args.clientes + 1)
+            ),
+        )
+        cursor.execute("INSERT INTO Administradores (NombreUsuario, Contrasena) VALUES (?, ?);", ADMIN)
+        insertar_en_lotes(
+            cursor,
+            "INSERT INTO Pedidos (ClienteID, ProductoID, Cantidad, FechaCompra) VALUES (?, ?, ?, ?);",
+            (
+                (1 + i % args.clientes, 1 + (i * 7919) % args.productos, 1 + i % 3, ahora - timedelta(minutes=i))
+                for i in range(1, args.pedidos + 1)
+            ),
+        )
+        cursor.execute("""
+        INSERT INTO Ventas (PedidoID, ClienteID, NombreUsuario, NombreProducto, Cantidad, TotalCompra, FechaVenta)
+        SELECT p.PedidoID, p.ClienteID, c.NombreUsuario, pr.Nombre, p.Cantidad, pr.Precio * p.Cantidad, p.FechaCompra
+        FROM Pedidos p
+        JOIN Clientes c ON c.ClienteID = p.ClienteID
+        JOIN Productos pr ON pr.ProductoID = p.ProductoID;
+        """)
+        acumulados.reconstruir(cursor, backend.dialecto)
+        conn.commit()
+    finally:
+        conn.close()
+    print(
+        f"Base {base} sembrada en {time.perf_counter() - inicio:.0f}s: {args.productos} productos, "
+        f"{args.clientes} clientes, {args.pedidos} pedidos y ventas"
+    )
+
+
+# Tráfico -----------------------------------------------------------------
+
+class Resultados:
+    def __init__(self):
+        self.latencias = defaultdict(list)
+        self.errores = defaultdict(int)
+
+    def registrar(self, nombre, segundos, exito):
+        self.latencias[nombre].append(segundos)
+        if not exito:
+            self.errores[nombre] += 1
+
+
+def percentil(ordenados, p):
+    if not ordenados:
+        return 0.0
+    indice = min(len(ordenados) - 1, max(0, int(round(p / 100 * len(ordenados))) - 1))
+    return ordenados[indice]
+
+
+async def medir(cliente, resultados, nombre, metodo, ruta, esperados=(200,), **kwargs):
+    inicio = time.perf_counter()
+    try:
+        respuesta = await cliente.request(metodo, ruta, **kwargs)
+    except httpx.HTTPError:
+        resultados.registrar(nombre, time.perf_counter() - inicio, False)
+        return None
+    resultados.registrar(nombre, time.perf_counter() - inicio, respuesta.status_code in esperados)
+    return respuesta
+
+
+async def iniciar_sesion(cliente, resultados, usuario, contrasena):
+    respuesta = await medir(
+        cliente, resultados, "POST /login", "POST", "/login",
+        json={"nombre_usuario": usuario, "contrasena": contrasena},
+    )
+    return respuesta is not None and respuesta.status_code == 200
+
+
+async def navegar(cliente, resultados, args):
+    if random.random() < 0.1:
+        await medir(cliente, resultados, "GET /productos (completo)", "GET", "/productos")
+        return
+    # El cursor de una página sólo vale para el mismo orden
+    orden = random.choice(["id", "precio", "-precio", "nombre"])
+    siguiente = None
+    for _ in range(random.randint(1, 3)):
+        params = {"limit": 50, "orden": orden}
+        if siguiente:
+            params["after"] = siguiente
+        respuesta = await medir(cliente, resultados, "GET /productos?limit", "GET", "/productos", params=params)
+        if respuesta is None or respuesta.status_code != 200:
+            return
+        siguiente = respuesta.json().get("siguiente")
+        if not siguiente:
+            return
+
+
+async def checkout(cliente, resultados, args):
+    lineas = [
+        {"nombre_producto": f"Producto {random.randint(1, args.productos)}", "cantidad": random.randint(1, 3)}
+        for _ in range(random.randint(1, 4))
+    ]
+    if random.random() < 0.3:
+        await medir(cliente, resultados, "POST /comprar-producto", "POST", "/comprar-producto", json=lineas[0])
+    else:
+        await medir(cliente, resultados, "POST /checkout", "POST", "/checkout", json={"productos": lineas})
+
+
+async def cancelar(cliente, resultados, args):
+    respuesta = await medir(cliente, resultados, "GET /mis-pedidos", "GET", "/mis-pedidos")
+    if respuesta is None or respuesta.status_code != 200 or not respuesta.json():
+        return
+    pedido = random.choice(respuesta.json())["pedido_id"]
+    # 403 si otro usuario virtual con la misma cuenta lo canceló antes
+    await medir(cliente, resultados, "DELETE /pedido/{id}", "DELETE", f"/pedido/{pedido}", esperados=(200, 403))
+
+
+async def panel(cliente, resultados, args):
+    for ruta in ("/datos-panel", "/datos-graficas", "/ganancia-total", "/productos-mas-solicitados"):
+        await medir(cliente, resultados, f"GET {ruta}", "GET", ruta)
+    await medir(cliente, resultados, "GET /ventas?limit", "GET", "/ventas", params={"limit": 100, "orden": "-fecha"})
+
+
+async def usuario_virtual(numero, args, resultados, fin):
+    async with httpx.AsyncClient(base_url=args.url, timeout=30) as cliente_http, \
+            httpx.AsyncClient(base_url=args.url, timeout=30) as admin_http:
+        usuario = f"cliente{1 + numero % args.clientes}"
+        await iniciar_sesion(cliente_http, resultados, usuario, CONTRASENA_CLIENTES)
+        await iniciar_sesion(admin_http, resultados, *ADMIN)
+
+        nombres = list(ESCENARIOS)
+        pesos = [ESCENARIOS[nombre] for nombre in nombres]
+        while time.perf_counter() < fin:
+            escenario = random.choices(nombres, pesos)[0]
+            if escenario == "navegar":
+                await navegar(cliente_http, resultados, args)
+            elif escenario == "login":
+                await iniciar_sesion(cliente_http, resultados, usuario, CONTRASENA_CLIENTES)
+            elif escenario == "checkout":
+                await checkout(cliente_http, resultados, args)
+            elif escenario == "cancelar":
+                await cancelar(cliente_http, resultados, args)
+            else:
+                await panel(admin_http, resultados, args)
+
+
+async def generar_trafico(args):
+    resultados = Resultados()
+    inicio = time.perf_counter()
+    fin = inicio + args.duracion
+    await asyncio.gather(*(usuario_virtual(n, args, resultados, fin) for n in range(args.usuarios)))
+    return resultados, time.perf_counter() - inicio
+
+
+def resumen(resultados, segundos):
+    filas = {}
+    for nombre, latencias in sorted(resultados.latencias.items()):
+        ordenadas = sorted(latencias)
+        filas[nombre] = {
+            "peticiones": len(ordenadas),
+            "por_segundo": len(ordenadas) / segundos,
+            "p50_ms": percentil(ordenadas, 50) * 1000,
+            "p95_ms": percentil(ordenadas, 95) * 1000,
+            "p99_ms": percentil(ordenadas, 99) * 1000,
+            "errores": resultados.errores[nombre],
+        }
+    return filas
+
+
+def imprimir(filas, segundos):
+    print(f"{'endpoint':<34} {'n':>7} {'pet/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errores':>8}")
+    for nombre, fila in filas.items():
+        print(
+            f"{nombre:<34} {fila['peticiones']:>7} {fila['por_segundo']:>8.1f} {fila['p50_ms']:>8.1f} "
+            f"{fila['p95_ms']:>8.1f} {fila['p99_ms']:>8.1f} {fila['errores']:>8}"
+        )
+    total = sum(fila["peticiones"] for fila in filas.values())
+    print(f"Total: {total} peticiones en {segundos:.1f}s ({total / segundos:.1f} pet/s)")
+
+
+def comparar(filas, referencia, tolerancia):
+    """Endpoints cuyo p95 empeoró más que `tolerancia` (fracción) respecto a la referencia."""
+    regresiones = []
+    for nombre, fila in filas.items():
+        anterior = referencia.get(nombre)
+        if anterior and anterior["p95_ms"] > 0 and fila["p95_ms"] > anterior["p95_ms"] * (1 + tolerancia):
+            regresiones.append((nombre, anterior["p95_ms"], fila["p95_ms"]))
+    return regresiones
+
+
+def esperar_servidor(url, proceso, timeout=60):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if proceso is not None and proceso.poll() is not None:
+            raise RuntimeError("uvicorn terminó antes de aceptar peticiones")
+        try:
+            if httpx.get(url + "/", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"El servidor no respondió en {timeout}s")
+
+
+def correr(args):
+    proceso = None
+    if not args.url:
+        args.url = f"http://127.0.0.1:{args.puerto}"
+        entorno = dict(os.environ, SESSION_COOKIE_SECURE="0")
+        entorno.setdefault("SESSION_SECRET", "bench")
+        # Todo el tráfico sale de una IP: sin esto el límite de logins por IP domina la medición
+        entorno.setdefault("LOGIN_INTENTOS_IP", "1000000")
+        if args.workers > 1 and entorno.get("SESSION_BACKEND", "memoria") == "memoria":
+            # Con sesiones en memoria cada worker sólo conoce las suyas y la medición serían 401
+            print("--workers > 1: usando SESSION_BACKEND=sqlite para compartir las sesiones entre workers")
+            entorno["SESSION_BACKEND"] = "sqlite"
+        proceso = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.puerto), "--workers", str(args.workers),
+             "--log-level", "warning"],
+            env=entorno,
+        )
+    try:
+        esperar_servidor(args.url, proceso)
+        resultados, segundos = asyncio.run(generar_trafico(args))
+    finally:
+        if proceso is not None:
+            proceso.terminate()
+            proceso.wait()
+
+    filas = resumen(resultados, segundos)
+    imprimir(filas, segundos)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump(filas, archivo, indent=2, ensure_ascii=False)
+    if args.referencia:
+        with open(args.referencia, encoding="utf-8") as archivo:
+            regresiones = comparar(filas, json.load(archivo), args.tolerancia)
+        for nombre, antes, ahora in regresiones:
+            print(f"REGRESIÓN {nombre}: p95 {antes:.1f} ms -> {ahora:.1f} ms")
+        if regresiones:
+            return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    siembra = comandos.add_parser("sembrar", help="Crea la base local y la llena con datos de prueba")
+    siembra.add_argument("--productos", type=int, default=50000)
+    siembra.add_argument("--clientes", type=int, default=10000)
+    siembra.add_argument("--pedidos", type=int, default=1000000)
+    siembra.add_argument("--forzar", action="store_true", help="Permitir un servidor que no sea local")
+
+    carga = comandos.add_parser("correr", help="Levanta main:app y genera tráfico mixto")
+    carga.add_argument("--url", help="Servidor ya levantado; si se omite se arranca uvicorn")
+    carga.add_argument("--puerto", type=int, default=8765)
+    carga.add_argument("--workers", type=int, default=1, help="Con más de uno las sesiones van a SQLite")
+    carga.add_argument("--usuarios", type=int, default=50, help="Usuarios virtuales concurrentes")
+    carga.add_argument("--duracion", type=float, default=60, help="Segundos de tráfico")
+    carga.add_argument("--productos", type=int, default=50000, help="Los mismos que en la siembra")
+    carga.add_argument("--clientes", type=int, default=10000, help="Los mismos que en la siembra")
+    carga.add_argument("--salida", help="Guardar el resumen en JSON")
+    carga.add_argument("--referencia", help="Resumen JSON anterior contra el que comparar")
+    carga.add_argument("--tolerancia", type=float, default=0.2, help="Aumento de p95 permitido (0.2 = 20%%)")
+
+    args = parser.parse_args()
+    if args.comando == "sembrar":
+        sembrar(args)
+        return 0
+    return correr(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
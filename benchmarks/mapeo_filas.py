@@ -0,0 +1,153 @@
+"""CPU y memoria al convertir a JSON un listado grande de ventas, pedidos y sesiones.
+
+Compara tres caminos sobre las mismas filas generadas en memoria:
+
+- `pydantic`: un modelo por fila validado contra `response_model` (sólo ventas, que
+  tiene modelo) y serializado por pydantic.
+- `dicts`: una función que arma un dict por fila con `strftime`, como hacían los
+  listados antes de `MapeoFilas`, codificado con `a_json`.
+- `columnas`: `MapeoFilas.bloques_json` de main.py, recorrido como lo haría el
+  StreamingResponse del listado.
+
+    python -m benchmarks.mapeo_filas --filas 100000 --repeticiones 5
+
+El tiempo es CPU del proceso (el mejor de las repeticiones) y la memoria es el pico
+que registra tracemalloc durante una conversión aparte; las filas de entrada ya
+existen y no cuentan.
+"""
+import argparse
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import List
+
+import orjson
+from pydantic import TypeAdapter
+
+from main import Venta, mapeo_pedidos, mapeo_sesiones, mapeo_ventas
+from respuestas import a_json
+
+
+def filas_ventas(n):
+    inicio = datetime(2024, 1, 1)
+    return [
+        (i, i, i % 300, f"usuario{i % 300}", f"Producto {i % 800}", 1 + i % 4, Decimal("399.80") + i,
+         inicio + timedelta(minutes=i, microseconds=i % 1000))
+        for i in range(1, n + 1)
+    ]
+
+
+def filas_pedidos(n):
+    inicio = datetime(2024, 1, 1)
+    return [(i, f"Cliente {i % 300}", f"Producto {i % 800}", 1 + i % 4, inicio + timedelta(minutes=i)) for i in range(1, n + 1)]
+
+
+def filas_sesiones(n):
+    inicio = datetime(2024, 1, 1)
+    return [
+        (i, i % 300, f"Cliente {i % 300}", f"usuario{i % 300}", inicio + timedelta(minutes=i),
+         None if i % 3 else inicio + timedelta(minutes=i + 30), f"10.0.{i % 256}.{i % 100}")
+        for i in range(1, n + 1)
+    ]
+
+
+# Conversión por fila anterior a MapeoFilas
+def venta_por_fila(venta):
+    return {
+        "venta_id": venta[0],
+        "pedido_id": venta[1],
+        "cliente_id": venta[2],
+        "nombre_usuario": venta[3],
+        "nombre_producto": venta[4],
+        "cantidad": venta[5],
+        "total_compra": float(venta[6]),
+        "fecha_venta": venta[7].strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+
+def pedido_por_fila(pedido):
+    return {
+        "pedido_id": pedido[0],
+        "cliente_nombre": pedido[1],
+        "producto_nombre": pedido[2],
+        "cantidad": pedido[3],
+        "fecha_compra": pedido[4].strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+
+def sesion_por_fila(sesion):
+    return {
+        "SesionID": sesion[0],
+        "ClienteID": sesion[1],
+        "NombreCliente": sesion[2],
+        "NombreUsuario": sesion[3],
+        "FechaInicio": sesion[4],
+        "FechaCierre": sesion[5],
+        "IP": sesion[6]
+    }
+
+
+ventas_pydantic = TypeAdapter(List[Venta])
+
+
+def caminos(filas, por_fila, mapeo, con_pydantic):
+    """Cada camino devuelve las partes del cuerpo de la respuesta."""
+    resultado = {}
+    if con_pydantic:
+        resultado["pydantic"] = lambda: [ventas_pydantic.dump_json(ventas_pydantic.validate_python(list(map(por_fila, filas))))]
+    resultado["dicts"] = lambda: [a_json([por_fila(fila) for fila in filas])]
+    resultado["columnas"] = lambda: mapeo.bloques_json(filas)
+    return resultado
+
+
+def enviar(partes):
+    # Como el servidor: cada parte se escribe y se suelta antes de pedir la siguiente
+    return sum(len(parte) for parte in partes)
+
+
+def medir(funcion, repeticiones):
+    enviar(funcion())  # calentamiento
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        cpu = time.process_time()
+        enviar(funcion())
+        mejor = min(mejor, time.process_time() - cpu)
+    tracemalloc.start()
+    enviar(funcion())
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return mejor, pico, b"".join(funcion())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=100000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    listados = [
+        ("ventas", filas_ventas(args.filas), venta_por_fila, mapeo_ventas, True),
+        ("pedidos", filas_pedidos(args.filas), pedido_por_fila, mapeo_pedidos, False),
+        ("sesiones", filas_sesiones(args.filas), sesion_por_fila, mapeo_sesiones, False),
+    ]
+    print(f"{args.filas} filas por listado")
+    print(f"{'listado':<9} {'camino':<9} {'ms CPU':>8} {'µs/fila':>8} {'pico MB':>8}")
+    for nombre, filas, por_fila, mapeo, con_pydantic in listados:
+        base = None
+        referencia = None
+        for camino, funcion in caminos(filas, por_fila, mapeo, con_pydantic).items():
+            cpu, pico, cuerpo = medir(funcion, args.repeticiones)
+            # Todos los caminos deben producir el mismo JSON
+            datos = orjson.loads(cuerpo)
+            referencia = referencia if referencia is not None else datos
+            assert datos == referencia, f"{nombre}: {camino} produce otro JSON"
+            base = base or cpu
+            print(
+                f"{nombre:<9} {camino:<9} {cpu * 1000:>8.1f} {cpu / len(filas) * 1e6:>8.2f} "
+                f"{pico / 1e6:>8.1f}  ({base / cpu:.1f}x)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Prueba de carga del ReservadorStock contra un archivo SQLite local.
+
+Lanza muchas compras concurrentes del mismo producto y verifica que nunca se
+venda más stock del que había:
+
+    python -m benchmarks.reservas_concurrentes --compradores 500 --stock 100
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+
+from basedatos import BaseDatosAsincrona, PoolConexiones
+from inventario import ReservadorStock, StockInsuficiente
+
+ESQUEMA = """
+CREATE TABLE Productos (ProductoID INTEGER PRIMARY KEY, Nombre TEXT, Precio REAL, Stock INTEGER);
+CREATE TABLE Pedidos (PedidoID INTEGER PRIMARY KEY AUTOINCREMENT, ClienteID INTEGER, ProductoID INTEGER, Cantidad INTEGER, FechaCompra TEXT);
+"""
+
+
+def preparar_base(ruta, stock):
+    with sqlite3.connect(ruta) as conn:
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.executescript(ESQUEMA)
+        conn.execute("INSERT INTO Productos VALUES (1, 'Producto de prueba', 10.0, ?);", (stock,))
+
+
+async def comprar(reservador, cliente_id, cantidad):
+    def registrar(cursor):
+        cursor.execute(
+            "INSERT INTO Pedidos (ClienteID, ProductoID, Cantidad, FechaCompra) VALUES (?, 1, ?, CURRENT_TIMESTAMP);",
+            (cliente_id, cantidad),
+        )
+        return cursor.lastrowid
+
+    try:
+        await reservador.reservar(1, cantidad, registrar)
+        return True
+    except StockInsuficiente:
+        return False
+
+
+async def ejecutar(args):
+    ruta = os.path.join(tempfile.mkdtemp(), "reservas.db")
+    preparar_base(ruta, args.stock)
+
+    pool = PoolConexiones(
+        lambda: sqlite3.connect(ruta, check_same_thread=False, timeout=args.timeout_bloqueo),
+        maximo=args.conexiones,
+    )
+    bd = BaseDatosAsincrona(pool)
+    reservador = ReservadorStock(bd, max_reintentos=args.reintentos)
+
+    inicio = time.perf_counter()
+    resultados = await asyncio.gather(
+        *(comprar(reservador, cliente_id, args.cantidad) for cliente_id in range(args.compradores))
+    )
+    duracion = time.perf_counter() - inicio
+
+    stock_final = (await bd.consultar("SELECT Stock FROM Productos WHERE ProductoID = 1;"))[0][0]
+    vendido = (await bd.consultar("SELECT COALESCE(SUM(Cantidad), 0) FROM Pedidos;"))[0][0]
+    bd.cerrar()
+    pool.cerrar()
+
+    exitosas = sum(resultados)
+    sobreventa = max(0, vendido - args.stock)
+    print(f"Compradores:        {args.compradores} (cantidad {args.cantidad} c/u, {args.conexiones} conexiones)")
+    print(f"Compras exitosas:   {exitosas}")
+    print(f"Rechazadas:         {len(resultados) - exitosas}")
+    print(f"Stock inicial/final:{args.stock} / {stock_final}")
+    print(f"Unidades vendidas:  {vendido}")
+    print(f"Sobreventas:        {sobreventa}")
+    print(f"Duración:           {duracion:.3f}s  ({len(resultados) / duracion:.0f} compras/s)")
+    print(f"Contención:         {reservador.estadisticas()}")
+    return 0 if sobreventa == 0 and stock_final == args.stock - vendido else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--compradores", type=int, default=500)
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--cantidad", type=int, default=1)
+    parser.add_argument("--conexiones", type=int, default=8)
+    parser.add_argument("--reintentos", type=int, default=10)
+    parser.add_argument("--timeout-bloqueo", type=float, default=0.05)
+    raise SystemExit(asyncio.run(ejecutar(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""CPU por petición al serializar /productos y /ventas con 10k filas.
+
+Compara el camino anterior (lista de dicts validada contra `response_model` y
+codificada por FastAPI) con `RespuestaJSON`, sin y con compresión:
+
+    python -m benchmarks.serializacion_json --filas 10000 --peticiones 20
+
+Las filas se generan en memoria con los mismos convertidores que usa main.py,
+así que se mide sólo el trabajo de la capa de respuesta.
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import List
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from main import Producto, Venta, mapeo_productos, mapeo_ventas
+from respuestas import CompresionMiddleware, RespuestaJSON
+
+
+def filas_productos(n):
+    return [(i, f"Producto {i}", Decimal("199.90") + i, i % 50, f"producto_{i}.webp") for i in range(1, n + 1)]
+
+
+def filas_ventas(n):
+    inicio = datetime(2024, 1, 1)
+    return [
+        (i, i, i % 300, f"usuario{i % 300}", f"Producto {i % 800}", 1 + i % 4, Decimal("399.80") + i, inicio + timedelta(minutes=i))
+        for i in range(1, n + 1)
+    ]
+
+
+def crear_app(modo, productos, ventas):
+    app = FastAPI(default_response_class=JSONResponse if modo == "antes" else RespuestaJSON)
+    if modo == "comprimido":
+        app.add_middleware(CompresionMiddleware)
+
+    if modo == "antes":
+        @app.get("/productos", response_model=List[Producto])
+        async def listar_productos():
+            return [mapeo_productos(fila) for fila in productos]
+
+        @app.get("/ventas", response_model=List[Venta])
+        async def listar_ventas():
+            return [mapeo_ventas(fila) for fila in ventas]
+    else:
+        @app.get("/productos", response_model=List[Producto])
+        async def listar_productos():
+            return RespuestaJSON([mapeo_productos(fila) for fila in productos])
+
+        @app.get("/ventas", response_model=List[Venta])
+        async def listar_ventas():
+            return RespuestaJSON([mapeo_ventas(fila) for fila in ventas])
+
+    return app
+
+
+def medir(cliente, ruta, peticiones, encabezados):
+    cliente.get(ruta, headers=encabezados)  # calentamiento
+    cpu = time.process_time()
+    for _ in range(peticiones):
+        respuesta = cliente.get(ruta, headers=encabezados)
+    cpu = (time.process_time() - cpu) / peticiones
+    # Content-Length es el tamaño enviado; httpx ya descomprimió `content`
+    tamano = int(respuesta.headers.get("content-length", len(respuesta.content)))
+    return cpu, tamano, respuesta.headers.get("content-encoding", "-")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=10000)
+    parser.add_argument("--peticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    productos, ventas = filas_productos(args.filas), filas_ventas(args.filas)
+    casos = [
+        ("antes", {"accept-encoding": "identity"}),
+        ("despues", {"accept-encoding": "identity"}),
+        ("comprimido", {"accept-encoding": "gzip"}),
+        ("comprimido", {"accept-encoding": "br"}),
+    ]
+    print(f"{'ruta':<11} {'modo':<11} {'codif.':<7} {'ms CPU/pet':>11} {'bytes':>10}")
+    for ruta in ("/productos", "/ventas"):
+        base = None
+        for modo, encabezados in casos:
+            cliente = TestClient(crear_app(modo, productos, ventas))
+            cpu, tamano, codificacion = medir(cliente, ruta, args.peticiones, encabezados)
+            base = base or cpu
+            print(f"{ruta:<11} {modo:<11} {codificacion:<7} {cpu * 1000:>11.1f} {tamano:>10}  ({base / cpu:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
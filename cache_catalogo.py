@@ -0,0 +1,72 @@
+import asyncio
+import hashlib
+import time
+
+
+class CacheCatalogo:
+    """Caché read-through del catálogo ya serializado a JSON.
+
+    `cargar` es una corrutina que devuelve el cuerpo de la respuesta en bytes. Las
+    peticiones concurrentes durante un fallo comparten una sola carga, y las rutas
+    que modifican productos o stock llaman a `invalidar()`.
+
+    La invalidación es local al proceso; con varios workers el TTL acota cuánto
+    tiempo puede servir otro worker una versión anterior.
+    """
+
+    def __init__(self, cargar, ttl=30.0):
+        self.cargar = cargar
+        self.ttl = ttl
+        self._cuerpo = None
+        self._etag = None
+        self._expira = 0.0
+        self._version = 0
+        # Se crea en el primer uso, dentro del event loop que lo usa (ver `_candado_del_loop`)
+        self._candado = None
+        self._loop_candado = None
+        self.aciertos = 0
+        self.fallos = 0
+
+    @staticmethod
+    def calcular_etag(cuerpo):
+        return '"' + hashlib.blake2b(cuerpo, digest_size=16).hexdigest() + '"'
+
+    def _candado_del_loop(self):
+        # La caché se construye al importar main; en Python 3.9 un asyncio.Lock creado ahí
+        # queda ligado a otro loop y falla al esperarlo desde el de uvicorn
+        loop = asyncio.get_running_loop()
+        if self._loop_candado is not loop:
+            self._candado = asyncio.Lock()
+            self._loop_candado = loop
+        return self._candado
+
+    def _vigente(self):
+        return self._cuerpo is not None and time.monotonic() < self._expira
+
+    async def obtener(self):
+        """Devuelve `(cuerpo, etag)`, cargando desde la base sólo si hace falta."""
+        if self._vigente():
+            self.aciertos += 1
+            return self._cuerpo, self._etag
+
+        async with self._candado_del_loop():
+            # Otra petición pudo haber recargado mientras esperábamos el candado
+            if self._vigente():
+                self.aciertos += 1
+                return self._cuerpo, self._etag
+
+            self.fallos += 1
+            version = self._version
+            cuerpo = await self.cargar()
+            etag = self.calcular_etag(cuerpo)
+            # Si hubo una invalidación durante la carga, no guardar un resultado que pudo quedar viejo
+            if version == self._version:
+                self._cuerpo, self._etag = cuerpo, etag
+                self._expira = time.monotonic() + self.ttl
+            return cuerpo, etag
+
+    def invalidar(self):
+        self._version += 1
+        self._cuerpo = None
+        self._etag = None
+        self._expira = 0.0
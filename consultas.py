@@ -0,0 +1,188 @@
+"""Consultas con nombre: cada sentencia fija de la aplicación se declara una vez, con
+los tipos de sus parámetros y la forma de su resultado.
+
+Como el texto de una consulta registrada es siempre el mismo objeto, el driver puede
+reutilizar la sentencia preparada: cada conexión del pool (`ConexionPreparada`)
+guarda un cursor por consulta y pyodbc no vuelve a preparar un SQL que ese cursor ya
+ejecutó, así que SQL Server recibe sólo el handle y los parámetros. Los tipos
+declarados se pasan a `setinputsizes` en los motores que lo usan, para que la
+declaración de parámetros, y con ella el plan en caché, no cambie con el largo de
+cada texto. Las filas se entregan como `namedtuple` con los nombres de `columnas`.
+
+    consultas = RegistroConsultas(dialecto)
+    consultas.declarar("producto_por_id", "SELECT ... WHERE ProductoID = ?;",
+                       [productos.c.ProductoID], UNA, ["ProductoID", "Nombre", ...])
+    fila = await bd.correr(consultas.producto_por_id, (producto_id,))
+    fila.Nombre
+
+Las consultas que se arman según los filtros de la petición (`ConsultaPaginada`, las
+listas `IN (...)` del carrito) siguen construyéndose en su módulo.
+"""
+from collections import OrderedDict, namedtuple
+
+# Forma del resultado
+UNA = "una"              # la primera fila o None
+VARIAS = "varias"        # todas las filas
+EJECUTAR = "ejecutar"    # sin filas: devuelve las filas afectadas y confirma
+DEVUELVE = "devuelve"    # escribe y devuelve filas (EXEC, INSERT ... OUTPUT/RETURNING) y confirma
+
+FORMAS = (UNA, VARIAS, EJECUTAR, DEVUELVE)
+
+
+def contar_marcadores(sql):
+    """Número de marcadores `?` fuera de las cadenas literales."""
+    return sum(parte.count("?") for parte in sql.split("'")[::2])
+
+
+class Consulta:
+    """Sentencia registrada; se ejecuta con `BaseDatosAsincrona.correr` o, dentro de una
+    transacción, con `en(cursor, params)`."""
+
+    def __init__(self, nombre, sql, parametros=(), forma=VARIAS, columnas=(), tamanos=None):
+        if forma not in FORMAS:
+            raise ValueError(f"Forma de resultado desconocida para {nombre}: {forma}")
+        if contar_marcadores(sql) != len(parametros):
+            raise ValueError(f"{nombre}: {contar_marcadores(sql)} marcadores y {len(parametros)} parámetros declarados")
+        if columnas and forma == EJECUTAR:
+            raise ValueError(f"{nombre}: una consulta sin filas no declara columnas")
+        self.nombre = nombre
+        self.sql = sql
+        self.parametros = tuple(parametros)
+        self.forma = forma
+        self.fila = namedtuple(f"Fila_{nombre}", columnas) if columnas else None
+        # Declaración para cursor.setinputsizes; None si el motor no la usa
+        self.tamanos = tamanos
+
+    @property
+    def escribe(self):
+        return self.forma in (EJECUTAR, DEVUELVE)
+
+    def _resultado(self, cursor):
+        if self.forma == EJECUTAR:
+            return cursor.rowcount
+        if self.forma == DEVUELVE:
+            # Un EXEC puede producir conteos de filas antes del resultado con columnas
+            while cursor.description is None and cursor.nextset():
+                pass
+        # También para UNA se leen todas: un resultado a medias deja ocupada la conexión
+        filas = cursor.fetchall()
+        if self.fila is not None:
+            filas = list(map(self.fila._make, filas))
+        if self.forma == UNA:
+            return filas[0] if filas else None
+        return filas
+
+    def contar(self, resultado):
+        """Filas del resultado, para las métricas."""
+        if self.forma == EJECUTAR:
+            return resultado
+        if self.forma == UNA:
+            return 0 if resultado is None else 1
+        return len(resultado)
+
+    def en(self, cursor, params=None):
+        """Ejecuta en `cursor` sin confirmar, para usarla dentro de `BaseDatosAsincrona.transaccion`."""
+        if self.tamanos is None:
+            cursor.execute(self.sql, params or ())
+            return self._resultado(cursor)
+        cursor.setinputsizes(self.tamanos)
+        try:
+            cursor.execute(self.sql, params or ())
+            return self._resultado(cursor)
+        finally:
+            # El cursor de la transacción sigue con otras sentencias
+            cursor.setinputsizes(None)
+
+    def ejecutar(self, conexion, params=None):
+        """Ejecuta en `conexion` (prestada del pool) y confirma si la consulta escribe."""
+        if hasattr(conexion, "cursor_de"):
+            cursor = conexion.cursor_de(self)
+        else:
+            cursor = conexion.cursor()
+            if self.tamanos is not None:
+                cursor.setinputsizes(self.tamanos)
+        cursor.execute(self.sql, params or ())
+        resultado = self._resultado(cursor)
+        if self.escribe:
+            conexion.commit()
+        return resultado
+
+    def __repr__(self):
+        return f"<Consulta {self.nombre} ({self.forma})>"
+
+
+class RegistroConsultas:
+    """Consultas de la aplicación por nombre: `consultas.producto_por_id`."""
+
+    def __init__(self, dialecto):
+        self.dialecto = dialecto
+        self._consultas = {}
+
+    def declarar(self, nombre, sql, parametros=(), forma=VARIAS, columnas=()):
+        """Registra una consulta. `parametros` son columnas de `esquema` o tipos de SQLAlchemy."""
+        if nombre in self._consultas:
+            raise ValueError(f"Consulta declarada dos veces: {nombre}")
+        tipos = [getattr(parametro, "type", parametro) for parametro in parametros]
+        consulta = Consulta(nombre, sql, tipos, forma, columnas, self.dialecto.tamanos_parametros(tipos))
+        self._consultas[nombre] = consulta
+        return consulta
+
+    def __getattr__(self, nombre):
+        try:
+            return self.__dict__["_consultas"][nombre]
+        except KeyError:
+            raise AttributeError(f"Consulta no declarada: {nombre}") from None
+
+    def __iter__(self):
+        return iter(self._consultas.values())
+
+    def __len__(self):
+        return len(self._consultas)
+
+
+class ConexionPreparada:
+    """Conexión que conserva un cursor por consulta registrada, con su sentencia ya
+    preparada y sus tipos fijados, mientras la conexión viva en el pool.
+
+    Se guardan a lo más `maximo` cursores; al pasar de ahí se cierra el usado hace más
+    tiempo. Todo lo demás pasa directo a la conexión del driver.
+    """
+
+    def __init__(self, conexion, maximo=64):
+        self._conexion = conexion
+        self.maximo = maximo
+        self._cursores = OrderedDict()
+
+    def cursor_de(self, consulta):
+        cursor = self._cursores.get(consulta.nombre)
+        if cursor is not None:
+            self._cursores.move_to_end(consulta.nombre)
+            return cursor
+        cursor = self._conexion.cursor()
+        if consulta.tamanos is not None:
+            cursor.setinputsizes(consulta.tamanos)
+        self._cursores[consulta.nombre] = cursor
+        if len(self._cursores) > self.maximo:
+            _, viejo = self._cursores.popitem(last=False)
+            viejo.close()
+        return cursor
+
+    def cursor(self):
+        return self._conexion.cursor()
+
+    def close(self):
+        for cursor in self._cursores.values():
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        self._cursores.clear()
+        self._conexion.close()
+
+    def __getattr__(self, nombre):
+        return getattr(self._conexion, nombre)
+
+
+def con_sentencias(fabrica, maximo=64):
+    """Fábrica para `PoolConexiones` cuyas conexiones reutilizan las sentencias preparadas."""
+    return lambda: ConexionPreparada(fabrica(), maximo)
@@ -0,0 +1,139 @@
+import asyncio
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import bcrypt
+
+
+class HashSaturado(Exception):
+    """Demasiadas operaciones de hashing en espera; conviene responder 503."""
+
+
+def _hashear(contrasena, rondas):
+    return bcrypt.hashpw(contrasena.encode('utf-8'), bcrypt.gensalt(rondas)).decode('utf-8')
+
+
+def _verificar(contrasena, hashed_password):
+    return bcrypt.checkpw(contrasena.encode('utf-8'), hashed_password.encode('utf-8'))
+
+
+class ServicioHash:
+    """Hashing de contraseñas con bcrypt fuera del event loop.
+
+    bcrypt libera el GIL mientras calcula, así que un pool de hilos acotado basta
+    para repartir el trabajo entre núcleos sin bloquear otras peticiones; con
+    `procesos` se usa un pool de procesos en su lugar. Si ya hay `max_pendientes`
+    operaciones en curso o en cola, las nuevas fallan con HashSaturado en lugar
+    de formarse detrás de una tormenta de logins.
+
+    Las verificaciones exitosas se recuerdan `ttl_cache` segundos bajo un HMAC de
+    la contraseña y el hash guardado con una llave aleatoria del proceso: un login
+    repetido no vuelve a pagar bcrypt, nunca se guarda la contraseña y cambiar la
+    contraseña (otro hash) invalida la entrada.
+    """
+
+    def __init__(self, max_hilos=2, rondas=12, procesos=0, max_pendientes=64, ttl_cache=300.0, max_cache=10000):
+        self.rondas = rondas
+        self.max_pendientes = max_pendientes
+        self.ttl_cache = ttl_cache
+        self.max_cache = max_cache
+        if procesos:
+            self._ejecutor = ProcessPoolExecutor(max_workers=procesos)
+        else:
+            self._ejecutor = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix="hash")
+        self._pendientes = 0
+        self._llave = secrets.token_bytes(32)
+        self._verificadas = OrderedDict()  # token -> expira
+        self._stats = {"rechazadas": 0, "aciertos_cache": 0}
+
+    def _token(self, contrasena, hashed_password):
+        mensaje = hashed_password.encode('utf-8') + b"\0" + contrasena.encode('utf-8')
+        return hmac.new(self._llave, mensaje, hashlib.sha256).digest()
+
+    def _en_cache(self, token):
+        expira = self._verificadas.get(token)
+        if expira is None:
+            return False
+        if time.monotonic() >= expira:
+            del self._verificadas[token]
+            return False
+        self._verificadas.move_to_end(token)
+        return True
+
+    def _recordar(self, token):
+        self._verificadas[token] = time.monotonic() + self.ttl_cache
+        self._verificadas.move_to_end(token)
+        while len(self._verificadas) > self.max_cache:
+            self._verificadas.popitem(last=False)
+
+    async def _ejecutar(self, funcion, *args):
+        if self._pendientes >= self.max_pendientes:
+            self._stats["rechazadas"] += 1
+            raise HashSaturado("Demasiadas operaciones de contraseña en curso")
+        self._pendientes += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._ejecutor, funcion, *args)
+        finally:
+            self._pendientes -= 1
+
+    async def hashear(self, contrasena):
+        return await self._ejecutar(_hashear, contrasena, self.rondas)
+
+    async def verificar(self, contrasena, hashed_password):
+        token = self._token(contrasena, hashed_password)
+        if self.ttl_cache and self._en_cache(token):
+            self._stats["aciertos_cache"] += 1
+            return True
+        valida = await self._ejecutar(_verificar, contrasena, hashed_password)
+        if valida and self.ttl_cache:
+            self._recordar(token)
+        return valida
+
+    def olvidar(self):
+        """Vacía la caché de verificaciones (por ejemplo, tras un cambio masivo de contraseñas)."""
+        self._verificadas.clear()
+
+    def estadisticas(self):
+        return dict(self._stats, pendientes=self._pendientes, en_cache=len(self._verificadas))
+
+    def cerrar(self):
+        # Los procesos se esperan para no dejarlos huérfanos al apagar
+        self._ejecutor.shutdown(wait=isinstance(self._ejecutor, ProcessPoolExecutor))
+
+
+class LimitadorIntentos:
+    """Cubeta de fichas por llave (usuario, IP): `capacidad` intentos seguidos y
+    `por_minuto` fichas repuestas. Guarda a lo más `max_llaves` llaves, las menos
+    recientes se olvidan primero.
+    """
+
+    def __init__(self, capacidad, por_minuto, max_llaves=100000):
+        self.capacidad = capacidad
+        self.por_segundo = por_minuto / 60.0
+        self.max_llaves = max_llaves
+        self._cubetas = OrderedDict()  # llave -> [fichas, ultima_actualizacion]
+        self._candado = threading.Lock()
+
+    def consumir(self, llave):
+        """Toma una ficha; devuelve 0 si el intento se permite o los segundos a esperar."""
+        ahora = time.monotonic()
+        with self._candado:
+            cubeta = self._cubetas.get(llave)
+            if cubeta is None:
+                cubeta = self._cubetas[llave] = [float(self.capacidad), ahora]
+                while len(self._cubetas) > self.max_llaves:
+                    self._cubetas.popitem(last=False)
+            else:
+                self._cubetas.move_to_end(llave)
+                cubeta[0] = min(self.capacidad, cubeta[0] + (ahora - cubeta[1]) * self.por_segundo)
+                cubeta[1] = ahora
+            if cubeta[0] >= 1:
+                cubeta[0] -= 1
+                return 0
+            return (1 - cubeta[0]) / self.por_segundo
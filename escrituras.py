@@ -0,0 +1,297 @@
+"""Escrituras diferidas para la bitácora (auditoría, sesiones de clientes).
+
+Cada registro se agrega primero a un archivo de spool local y después se escribe
+en la base por lotes desde una tarea de fondo, así que la petición no espera a la
+base y un reinicio no pierde lo pendiente: al arrancar se reenvían los segmentos
+que dejó un proceso que ya no existe. La entrega es "al menos una vez": si el
+proceso muere entre el commit y el borrado del segmento, ese lote se repite.
+
+Un segmento que falla `max_fallos` veces por un error que no es de conexión (una
+restricción violada, un valor demasiado largo) se aparta a un archivo `.muerto` en
+el mismo directorio, para que no detenga a los que vienen detrás; sus líneas son los
+mismos registros JSON y pueden revisarse y reencolarse a mano.
+"""
+import asyncio
+import glob
+import itertools
+import json
+import logging
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin candados, un solo proceso por directorio de spool
+    fcntl = None
+
+from basedatos import PoolAgotado
+from inventario import es_reintentable
+
+# SQL Server acepta hasta 2100 parámetros por sentencia
+MAX_PARAMETROS = 2000
+
+# Clases de error DB-API de conexión o de concurrencia; las demás (IntegrityError, DataError,
+# ProgrammingError, errores al armar las filas) se repetirían igual en cada intento
+ERRORES_TRANSITORIOS = ("OperationalError", "InterfaceError")
+
+
+def es_transitorio(error):
+    """El error es de la base o de la conexión, no de los registros: vale la pena esperar y reintentar."""
+    if isinstance(error, (PoolAgotado, OSError, TimeoutError)) or es_reintentable(error):
+        return True
+    return type(error).__name__ in ERRORES_TRANSITORIOS
+
+
+def insertar_filas(cursor, tabla, columnas, filas, max_parametros=MAX_PARAMETROS):
+    """INSERT de varias filas por sentencia (`VALUES (...), (...)`) en tramos que respetan el límite de parámetros."""
+    por_sentencia = max(1, max_parametros // len(columnas))
+    marcadores = "(" + ", ".join("?" for _ in columnas) + ")"
+    for inicio in range(0, len(filas), por_sentencia):
+        tramo = filas[inicio:inicio + por_sentencia]
+        cursor.execute(
+            f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES {', '.join(marcadores for _ in tramo)};",
+            [valor for fila in tramo for valor in fila],
+        )
+
+
+class _Segmento:
+    """Archivo de spool abierto y con candado exclusivo mientras tenga registros sin escribir."""
+
+    def __init__(self, ruta, fd, registros=None):
+        self.ruta = ruta
+        self.fd = fd
+        self.registros = registros or []
+        self.fallos = 0  # intentos fallidos por errores no transitorios
+
+    @classmethod
+    def nuevo(cls, ruta):
+        fd = os.open(ruta, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        return cls(ruta, fd)
+
+    @classmethod
+    def huerfano(cls, ruta):
+        """Segmento de un proceso terminado, o None si su dueño sigue vivo."""
+        try:
+            fd = os.open(ruta, os.O_RDWR)
+        except FileNotFoundError:
+            return None
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return None
+        registros = []
+        with open(ruta, encoding="utf-8") as archivo:
+            for linea in archivo:
+                try:
+                    registros.append(json.loads(linea))
+                except ValueError:
+                    # Última línea a medio escribir cuando el proceso murió
+                    logging.warning(f"Registro ilegible en {ruta}, se omite")
+        return cls(ruta, fd, registros)
+
+    def agregar(self, registro):
+        # Sin fsync el write sólo copia a la caché del kernel: no espera al disco y ya
+        # sobrevive a la caída del proceso
+        os.write(self.fd, (json.dumps(registro, separators=(",", ":")) + "\n").encode("utf-8"))
+        self.registros.append(registro)
+
+    def descartar(self):
+        os.unlink(self.ruta)
+        os.close(self.fd)
+
+    def apartar(self):
+        """Renombra el segmento a `.muerto` (fuera del glob de recuperación) y lo suelta; devuelve la ruta nueva."""
+        ruta = os.path.splitext(self.ruta)[0] + ".muerto"
+        os.replace(self.ruta, ruta)
+        os.close(self.fd)
+        return ruta
+
+
+class ColaEscrituras:
+    """Cola de escrituras no críticas con spool en disco y vaciado por lotes.
+
+    Cada tipo de registro se asocia con `registrar_tipo(tipo, aplicar)`, donde
+    `aplicar(cursor, filas)` escribe una lista de filas con sentencias de varias
+    filas. El vaciado corre cada `intervalo` segundos o en cuanto haya
+    `tamano_lote` registros; todos los registros de un segmento se escriben en una
+    transacción y en el orden en que se encolaron. Si la base no responde el vaciado
+    se detiene y reintenta en el siguiente ciclo; si un segmento falla `max_fallos`
+    veces por sus datos, se aparta y el vaciado sigue con el resto.
+
+    Con `sincronizar` los segmentos se llevan a disco con fsync en un hilo, poco
+    después de encolar y con un solo fsync para los registros que lleguen mientras
+    tanto; la petición no espera al disco.
+    """
+
+    def __init__(self, bd, directorio, tamano_lote=500, intervalo=1.0, sincronizar=False, max_fallos=5):
+        self.bd = bd
+        self.directorio = directorio
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        self.sincronizar = sincronizar
+        self.max_fallos = max_fallos
+        self._tipos = {}
+        self._numeros = itertools.count()
+        self._actual = None
+        self._por_escribir = []  # segmentos cerrados, del más viejo al más nuevo
+        self._despertar = None
+        self._tarea = None
+        self._cerrando = False
+        self._sin_sincronizar = set()
+        self._fsync = None
+        self._stats = {
+            "encolados": 0,
+            "escritos": 0,
+            "vaciados": 0,
+            "fallos": 0,
+            "recuperados": 0,
+            "apartados": 0,
+            "segundos_vaciado": 0.0,
+            "ultimo_vaciado": 0.0,
+        }
+
+    def registrar_tipo(self, tipo, aplicar):
+        self._tipos[tipo] = aplicar
+
+    def _ruta_nueva(self):
+        return os.path.join(self.directorio, f"{os.getpid()}-{next(self._numeros)}.spool")
+
+    # Encolado ------------------------------------------------------------
+
+    def encolar(self, tipo, *datos):
+        """Guarda el registro en el spool y lo deja para el siguiente vaciado. `datos` debe ser serializable a JSON."""
+        if tipo not in self._tipos:
+            raise ValueError(f"Tipo de escritura no registrado: {tipo}")
+        if self._actual is None:
+            self._actual = _Segmento.nuevo(self._ruta_nueva())
+        self._actual.agregar([tipo, list(datos)])
+        self._stats["encolados"] += 1
+        if self.sincronizar:
+            self._sin_sincronizar.add(self._actual)
+            if self._fsync is None or self._fsync.done():
+                self._fsync = asyncio.get_running_loop().create_task(self._sincronizar())
+        if len(self._actual.registros) >= self.tamano_lote and self._despertar is not None:
+            self._despertar.set()
+
+    async def _sincronizar(self):
+        loop = asyncio.get_running_loop()
+        while self._sin_sincronizar:
+            segmentos, self._sin_sincronizar = self._sin_sincronizar, set()
+            for segmento in segmentos:
+                try:
+                    await loop.run_in_executor(None, os.fsync, segmento.fd)
+                except OSError as e:
+                    logging.warning(f"No se pudo sincronizar {segmento.ruta}: {e}")
+
+    async def _esperar_fsync(self):
+        # Antes de cerrar el archivo de un segmento: el hilo del fsync puede estar usándolo
+        if self._fsync is not None:
+            await self._fsync
+
+    def profundidad(self):
+        pendientes = sum(len(segmento.registros) for segmento in self._por_escribir)
+        return pendientes + (len(self._actual.registros) if self._actual else 0)
+
+    # Vaciado -------------------------------------------------------------
+
+    def _aplicar_segmento(self, cursor, registros):
+        # Tramos consecutivos del mismo tipo, para respetar el orden entre tipos
+        for tipo, grupo in itertools.groupby(registros, key=lambda registro: registro[0]):
+            aplicar = self._tipos.get(tipo)
+            if aplicar is None:
+                logging.warning(f"Se omiten registros de tipo desconocido en el spool: {tipo}")
+                continue
+            filas = [datos for _, datos in grupo]
+            for inicio in range(0, len(filas), self.tamano_lote):
+                aplicar(cursor, filas[inicio:inicio + self.tamano_lote])
+
+    async def vaciar(self):
+        """Escribe todo lo pendiente; si la base falla, los segmentos se conservan para el siguiente intento."""
+        if self._actual is not None and self._actual.registros:
+            self._por_escribir.append(self._actual)
+            self._actual = None
+        while self._por_escribir:
+            segmento = self._por_escribir[0]
+            inicio = time.perf_counter()
+            try:
+                await self.bd.transaccion(lambda cursor: self._aplicar_segmento(cursor, segmento.registros))
+            except Exception as e:
+                self._stats["fallos"] += 1
+                if es_transitorio(e):
+                    logging.warning(f"No se pudieron escribir {len(segmento.registros)} registros diferidos: {e}")
+                    return False
+                segmento.fallos += 1
+                if segmento.fallos < self.max_fallos:
+                    logging.warning(
+                        f"Fallo {segmento.fallos} de {self.max_fallos} al escribir {segmento.ruta}: {e}"
+                    )
+                    return False
+                self._por_escribir.pop(0)
+                await self._esperar_fsync()
+                ruta = segmento.apartar()
+                self._stats["apartados"] += len(segmento.registros)
+                logging.error(
+                    f"Se apartaron {len(segmento.registros)} registros diferidos en {ruta} "
+                    f"tras {segmento.fallos} fallos: {e}"
+                )
+                continue
+            duracion = time.perf_counter() - inicio
+            self._por_escribir.pop(0)
+            await self._esperar_fsync()
+            segmento.descartar()
+            self._stats["escritos"] += len(segmento.registros)
+            self._stats["vaciados"] += 1
+            self._stats["segundos_vaciado"] += duracion
+            self._stats["ultimo_vaciado"] = duracion
+        return True
+
+    async def _ciclo(self):
+        while not self._cerrando:
+            try:
+                await asyncio.wait_for(self._despertar.wait(), timeout=self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._despertar.clear()
+            try:
+                await self.vaciar()
+            except Exception as e:
+                logging.error(f"Error en el vaciado de escrituras diferidas: {e}")
+
+    # Ciclo de vida -------------------------------------------------------
+
+    def iniciar(self):
+        """Recupera los segmentos huérfanos y arranca el vaciado de fondo; llamar dentro del event loop."""
+        os.makedirs(self.directorio, exist_ok=True)
+        for ruta in sorted(glob.glob(os.path.join(self.directorio, "*.spool")), key=os.path.getmtime):
+            segmento = _Segmento.huerfano(ruta)
+            if segmento is None:
+                continue
+            if segmento.registros:
+                self._por_escribir.append(segmento)
+                self._stats["recuperados"] += len(segmento.registros)
+            else:
+                segmento.descartar()
+        if self._stats["recuperados"]:
+            logging.info(f"Se recuperaron {self._stats['recuperados']} escrituras diferidas del spool")
+        self._despertar = asyncio.Event()
+        self._tarea = asyncio.get_running_loop().create_task(self._ciclo())
+
+    async def cerrar(self):
+        """Detiene el vaciado de fondo y hace un último intento; lo que no se escriba queda en el spool."""
+        self._cerrando = True
+        if self._tarea is not None:
+            self._despertar.set()
+            await self._tarea
+        await self.vaciar()
+        await self._esperar_fsync()
+        for segmento in self._por_escribir + ([self._actual] if self._actual else []):
+            os.close(segmento.fd)
+        self._por_escribir = []
+        self._actual = None
+
+    def estadisticas(self):
+        return dict(self._stats, pendientes=self.profundidad())
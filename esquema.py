@@ -0,0 +1,215 @@
+"""Esquema de la tienda para cualquier motor soportado por `dialectos`.
+
+Las tablas se declaran con SQLAlchemy Core y se crean con los tipos de cada motor
+(IDENTITY en SQL Server, SERIAL en PostgreSQL, INTEGER PRIMARY KEY en SQLite). En
+SQL Server también se crea el procedimiento RegistrarPedido; en los demás motores
+lo reemplaza `pedidos.registrar_pedido`.
+
+    DATABASE_URL=sqlite:///tienda.db python -m esquema crear
+"""
+import sys
+
+from sqlalchemy import (
+    Column, Date, DateTime, Float, Index, Integer, MetaData, Numeric, Table, Unicode, create_engine, func, text,
+)
+from sqlalchemy.pool import NullPool
+
+from paginacion import INDICES_RECOMENDADOS
+
+metadata = MetaData()
+
+
+def _tabla(nombre, *columnas, **opciones):
+    # Sin comillas: las consultas usan los nombres sin comillas y PostgreSQL los pasa a minúsculas
+    return Table(nombre, metadata, *columnas, quote=False, sqlite_autoincrement=True, **opciones)
+
+
+def _columna(nombre, tipo, **opciones):
+    opciones.setdefault("nullable", False)
+    return Column(nombre, tipo, quote=False, **opciones)
+
+
+productos = _tabla(
+    "Productos",
+    _columna("ProductoID", Integer, primary_key=True),
+    _columna("Nombre", Unicode(100)),
+    _columna("Precio", Numeric(10, 2)),
+    _columna("Stock", Integer),
+    _columna("Imagen", Unicode(255), nullable=True),
+)
+
+clientes = _tabla(
+    "Clientes",
+    _columna("ClienteID", Integer, primary_key=True),
+    _columna("Nombre", Unicode(100)),
+    _columna("Apellido", Unicode(100), nullable=True),
+    _columna("CorreoElectronico", Unicode(255), nullable=True),
+    _columna("NombreUsuario", Unicode(100)),
+    _columna("Contrasena", Unicode(255)),
+)
+
+administradores = _tabla(
+    "Administradores",
+    _columna("AdministradorID", Integer, primary_key=True),
+    _columna("NombreUsuario", Unicode(100)),
+    _columna("Contrasena", Unicode(255)),
+)
+
+pedidos = _tabla(
+    "Pedidos",
+    _columna("PedidoID", Integer, primary_key=True),
+    _columna("ClienteID", Integer),
+    _columna("ProductoID", Integer, nullable=True),
+    _columna("Cantidad", Integer),
+    _columna("FechaCompra", DateTime),
+)
+
+ventas = _tabla(
+    "Ventas",
+    _columna("VentaID", Integer, primary_key=True),
+    _columna("PedidoID", Integer),
+    _columna("ClienteID", Integer),
+    _columna("NombreUsuario", Unicode(100)),
+    _columna("NombreProducto", Unicode(100), nullable=True),
+    _columna("Cantidad", Integer),
+    _columna("TotalCompra", Numeric(18, 2)),
+    _columna("FechaVenta", DateTime),
+)
+
+pedidos_cancelados = _tabla(
+    "PedidosCancelados",
+    _columna("PedidoID", Integer),
+    _columna("ClienteID", Integer),
+    _columna("ProductoID", Integer, nullable=True),
+    _columna("Cantidad", Integer),
+    _columna("FechaCancelacion", DateTime),
+)
+
+sesiones_clientes = _tabla(
+    "SesionesClientes",
+    _columna("SesionID", Integer, primary_key=True),
+    _columna("ClienteID", Integer),
+    _columna("FechaInicio", DateTime),
+    _columna("FechaCierre", DateTime, nullable=True),
+    _columna("IP", Unicode(64), nullable=True),
+)
+
+auditoria = _tabla(
+    "AuditoriaCRUD",
+    _columna("AuditoriaID", Integer, primary_key=True),
+    _columna("TipoOperacion", Unicode(20)),
+    _columna("Tabla", Unicode(100)),
+    _columna("RegistroID", Integer, nullable=True),
+    _columna("Usuario", Unicode(100), nullable=True),
+    _columna("Fecha", DateTime, server_default=func.current_timestamp()),
+)
+
+resumen_producto = _tabla(
+    "ResumenVentasProducto",
+    _columna("NombreProducto", Unicode(100), primary_key=True),
+    _columna("Cantidad", Integer),
+    _columna("Total", Numeric(18, 2)),
+)
+
+resumen_dia = _tabla(
+    "ResumenVentasDia",
+    _columna("Fecha", Date, primary_key=True),
+    _columna("Cantidad", Integer),
+    _columna("Total", Numeric(18, 2)),
+)
+
+# Sesiones web de SESSION_BACKEND=sql (sesiones.AlmacenSQL)
+sesiones_web = _tabla(
+    "SesionesWeb",
+    _columna("Token", Unicode(64), primary_key=True),
+    _columna("Datos", Unicode(1000)),
+    _columna("Expira", Float),
+)
+
+# Marca de tiempo que la primaria renueva y las réplicas reciben; su atraso es el retraso de la réplica
+latido_replicacion = _tabla(
+    "LatidoReplicacion",
+    _columna("LatidoID", Integer, primary_key=True, autoincrement=False),
+    _columna("Marca", Float),
+)
+
+Index("IX_Productos_NombreUnico", productos.c.Nombre, unique=True)
+Index("IX_Clientes_NombreUsuario", clientes.c.NombreUsuario, unique=True)
+Index("IX_Pedidos_Cliente", pedidos.c.ClienteID, pedidos.c.PedidoID)
+Index("IX_Ventas_Pedido", ventas.c.PedidoID)
+
+# Índices de la paginación por llave
+for _nombre, _tabla_indice, _columnas in INDICES_RECOMENDADOS:
+    Index(_nombre, *(metadata.tables[_tabla_indice].c[columna] for columna in _columnas))
+
+TABLAS_ACUMULADOS = [resumen_producto, resumen_dia]
+
+# Registra un pedido y su venta, y descuenta el stock (sólo SQL Server)
+PROCEDIMIENTO_REGISTRAR_PEDIDO = """
+CREATE OR ALTER PROCEDURE RegistrarPedido @ClienteID INT, @ProductoID INT, @Cantidad INT
+AS
+BEGIN
+    SET NOCOUNT ON;
+    DECLARE @PedidoID INT;
+    INSERT INTO Pedidos (ClienteID, ProductoID, Cantidad, FechaCompra)
+    VALUES (@ClienteID, @ProductoID, @Cantidad, GETDATE());
+    SET @PedidoID = SCOPE_IDENTITY();
+
+    INSERT INTO Ventas (PedidoID, ClienteID, NombreUsuario, NombreProducto, Cantidad, TotalCompra, FechaVenta)
+    SELECT @PedidoID, c.ClienteID, c.NombreUsuario, p.Nombre, @Cantidad, p.Precio * @Cantidad, GETDATE()
+    FROM Clientes c CROSS JOIN Productos p
+    WHERE c.ClienteID = @ClienteID AND p.ProductoID = @ProductoID;
+
+    UPDATE Productos SET Stock = Stock - @Cantidad WHERE ProductoID = @ProductoID;
+END;
+"""
+
+
+def crear_tablas(url, tablas=None):
+    """Crea las tablas que falten (todas, o sólo `tablas`)."""
+    motor = create_engine(url, poolclass=NullPool)
+    metadata.create_all(motor, tables=tablas)
+    motor.dispose()
+
+
+def crear(url):
+    """Esquema completo: tablas, índices y procedimiento. Se puede repetir sobre una base
+    existente; sólo crea lo que falte."""
+    motor = create_engine(url, poolclass=NullPool)
+    metadata.create_all(motor)
+    with motor.begin() as conexion:
+        # create_all no agrega índices nuevos a tablas que ya existían
+        for tabla in metadata.sorted_tables:
+            for indice in tabla.indexes:
+                indice.create(conexion, checkfirst=True)
+        if motor.dialect.name == "mssql":
+            conexion.exec_driver_sql(PROCEDIMIENTO_REGISTRAR_PEDIDO)
+    motor.dispose()
+
+
+def borrar(url):
+    motor = create_engine(url, poolclass=NullPool)
+    with motor.begin() as conexion:
+        if motor.dialect.name == "mssql":
+            conexion.execute(text("DROP PROCEDURE IF EXISTS RegistrarPedido;"))
+    metadata.drop_all(motor)
+    motor.dispose()
+
+
+def main(argv):
+    from main import url_base_datos
+
+    if len(argv) != 1 or argv[0] not in ("crear", "borrar"):
+        print(__doc__)
+        return 2
+    if argv[0] == "crear":
+        crear(url_base_datos())
+        print("Esquema creado")
+    else:
+        borrar(url_base_datos())
+        print("Esquema borrado")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,176 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # Sin brotli se sirve sólo gzip
+    brotli = None
+
+CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+CACHE_REVALIDAR = "no-cache"
+# Archivos de texto que se guardan en memoria ya comprimidos
+EXTENSIONES_TEXTO = {".html", ".css", ".js", ".svg", ".json", ".txt"}
+TAMANO_MINIMO_COMPRESION = 256
+
+# Referencias absolutas dentro de HTML y CSS: src="/..", href="/..", url(/..)
+_REFERENCIA = re.compile(r"""((?:src|href)\s*=\s*["']|url\(\s*["']?)(/[^"')\s?#]+)""")
+
+
+def _extension(ruta):
+    return os.path.splitext(ruta)[1].lower()
+
+
+def codificaciones_aceptadas(accept_encoding):
+    """Codificaciones que acepta el cliente, sin las marcadas con q=0."""
+    aceptadas = set()
+    for parte in (accept_encoding or "").split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        if parametros.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        if nombre:
+            aceptadas.add(nombre.strip().lower())
+    return aceptadas
+
+
+class Recurso:
+    """Un archivo de texto en memoria con sus copias gzip/brotli precalculadas."""
+
+    __slots__ = ("cuerpo", "tipo", "huella", "comprimidos")
+
+    def __init__(self, cuerpo, tipo):
+        self.cuerpo = cuerpo
+        self.tipo = tipo
+        self.huella = hashlib.blake2b(cuerpo, digest_size=8).hexdigest()
+        self.comprimidos = {}
+        if len(cuerpo) >= TAMANO_MINIMO_COMPRESION:
+            if brotli is not None:
+                self.comprimidos["br"] = brotli.compress(cuerpo, quality=11)
+            self.comprimidos["gzip"] = gzip.compress(cuerpo, compresslevel=9, mtime=0)
+
+    def _etag(self, codificacion):
+        # Cada representación lleva su propio ETag fuerte
+        return f'"{self.huella}-{codificacion}"' if codificacion else f'"{self.huella}"'
+
+    def respuesta(self, headers, cache_control):
+        aceptadas = codificaciones_aceptadas(headers.get("accept-encoding"))
+        codificacion = next((c for c in ("br", "gzip") if c in self.comprimidos and c in aceptadas), None)
+        cabeceras = {
+            "ETag": self._etag(codificacion),
+            "Cache-Control": cache_control,
+            "Vary": "Accept-Encoding",
+        }
+
+        if_none_match = headers.get("if-none-match")
+        if if_none_match:
+            etiquetas = {etiqueta.strip().replace("W/", "", 1) for etiqueta in if_none_match.split(",")}
+            if "*" in etiquetas or cabeceras["ETag"] in etiquetas:
+                return Response(status_code=304, headers=cabeceras)
+
+        cuerpo = self.cuerpo
+        if codificacion:
+            cuerpo = self.comprimidos[codificacion]
+            cabeceras["Content-Encoding"] = codificacion
+        return Response(content=cuerpo, media_type=self.tipo, headers=cabeceras)
+
+
+class ManifiestoEstaticos:
+    """Huellas de los archivos estáticos, calculadas una vez al arrancar.
+
+    Cada archivo que no es HTML recibe una URL con su huella (`estilo.css` →
+    `estilo.<huella>.css`) que puede guardarse en caché para siempre, y las
+    referencias absolutas en HTML y CSS se reescriben a esas URLs. Las páginas
+    HTML conservan su URL y se revalidan con ETag. Los archivos de texto quedan en
+    memoria junto con sus copias comprimidas.
+
+    `montajes` asocia cada prefijo de URL con su directorio; `archivos` asocia URLs
+    sueltas (como `/`) con un archivo.
+    """
+
+    def __init__(self, montajes, archivos=None):
+        self.montajes = montajes
+        self.archivos = archivos or {}
+        self.huellas = {}
+        self._originales = {}
+        self._recursos = {}
+        self.construir()
+
+    def _recorrer(self):
+        for prefijo, directorio in self.montajes.items():
+            for raiz, _, nombres in os.walk(directorio):
+                for nombre in sorted(nombres):
+                    ruta = os.path.join(raiz, nombre)
+                    relativa = os.path.relpath(ruta, directorio).replace(os.sep, "/")
+                    yield f"{prefijo}/{relativa}", ruta
+        yield from self.archivos.items()
+
+    def reescribir(self, texto):
+        return _REFERENCIA.sub(lambda m: m.group(1) + self.huellas.get(m.group(2), m.group(2)), texto)
+
+    def construir(self):
+        # Primero binarios, luego CSS/JS (que pueden apuntar a imágenes) y al final HTML
+        orden = {".html": 2, ".css": 1, ".js": 1}
+        archivos = sorted(self._recorrer(), key=lambda par: orden.get(_extension(par[1]), 0))
+
+        for url, ruta in archivos:
+            with open(ruta, "rb") as archivo:
+                contenido = archivo.read()
+            ext = _extension(ruta)
+            if ext in (".html", ".css"):
+                contenido = self.reescribir(contenido.decode("utf-8")).encode("utf-8")
+            if ext in EXTENSIONES_TEXTO:
+                tipo = mimetypes.guess_type(ruta)[0] or "text/plain"
+                if tipo.startswith("text/") or tipo in ("application/javascript", "image/svg+xml"):
+                    tipo += "; charset=utf-8"
+                self._recursos[url] = Recurso(contenido, tipo)
+            if ext != ".html" and url not in self.archivos:
+                base, _ = os.path.splitext(url)
+                huella = hashlib.blake2b(contenido, digest_size=5).hexdigest()
+                self.huellas[url] = f"{base}.{huella}{ext}"
+                self._originales[self.huellas[url]] = url
+
+    def original(self, url):
+        """URL original para una URL con huella, o `None`."""
+        return self._originales.get(url)
+
+    def recurso(self, url):
+        return self._recursos.get(url)
+
+
+class EstaticosInmutables(StaticFiles):
+    """StaticFiles que sirve URLs con huella como inmutables y usa las copias comprimidas del manifiesto.
+
+    Lo que no está en el manifiesto (por ejemplo imágenes subidas después del
+    arranque) se sirve como siempre, con `no-cache` para que el navegador revalide;
+    las rutas que empiezan con `prefijos_inmutables` ya son únicas por contenido.
+    """
+
+    def __init__(self, *args, prefijo, manifiesto=None, prefijos_inmutables=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prefijo = prefijo
+        self.manifiesto = manifiesto
+        self.prefijos_inmutables = tuple(prefijos_inmutables)
+
+    async def get_response(self, path, scope):
+        relativa = path.replace(os.sep, "/")
+        url = f"{self.prefijo}/{relativa}"
+        inmutable = relativa.startswith(self.prefijos_inmutables) if self.prefijos_inmutables else False
+
+        if self.manifiesto is not None:
+            original = self.manifiesto.original(url)
+            if original:
+                url, inmutable = original, True
+                path = os.path.join(*original[len(self.prefijo) + 1:].split("/"))
+            recurso = self.manifiesto.recurso(url)
+            if recurso is not None and scope["method"] in ("GET", "HEAD"):
+                return recurso.respuesta(Headers(scope=scope), CACHE_INMUTABLE if inmutable else CACHE_REVALIDAR)
+
+        respuesta = await super().get_response(path, scope)
+        respuesta.headers["Cache-Control"] = CACHE_INMUTABLE if inmutable else CACHE_REVALIDAR
+        return respuesta
@@ -0,0 +1,157 @@
+"""Flujo de cambios del catálogo y de los pedidos para WebSocket y SSE.
+
+Las rutas publican en `BusEventos` después de confirmar su transacción y cada
+conexión abierta recibe los eventos de los temas a los que se suscribió. El bus es
+local al proceso: con varios workers cada uno entrega sólo lo que publicó él.
+"""
+import asyncio
+import itertools
+from collections import deque
+
+from respuestas import a_json
+
+
+class Evento:
+    """Evento ya serializado una sola vez, sin importar cuántos suscriptores lo reciban."""
+
+    __slots__ = ("id", "tema", "datos", "clave", "_json")
+
+    def __init__(self, id, tema, datos, clave=None):
+        self.id = id
+        self.tema = tema
+        self.datos = datos
+        # Eventos con la misma clave describen el mismo estado: sólo importa el último
+        self.clave = clave
+        self._json = None
+
+    def json(self):
+        if self._json is None:
+            self._json = a_json({"id": self.id, "tema": self.tema, **self.datos})
+        return self._json
+
+    def sse(self):
+        return b"id: %d\nevent: %s\ndata: %s\n\n" % (self.id, self.tema.encode(), self.json())
+
+
+def resincronizar(id):
+    """Aviso de que se perdieron eventos: el cliente debe volver a consultar el estado completo."""
+    return Evento(id, "sistema", {"tipo": "resincronizar"})
+
+
+class Suscripcion:
+    """Cola acotada de eventos pendientes de una conexión.
+
+    Si el cliente no lee al ritmo en que se publica y la cola llega a `maximo`, primero
+    se descartan los eventos superados por otro más nuevo con la misma clave (el stock
+    de un producto) y, si aun así no cabe, se vacía la cola y se manda un solo
+    `resincronizar` en lugar de seguir acumulando.
+    """
+
+    def __init__(self, temas, filtro=None, maximo=256):
+        self.temas = set(temas)
+        self.filtro = filtro
+        self.maximo = maximo
+        self.descartados = 0
+        self._pendientes = deque()
+        self._senal = asyncio.Event()
+        self._cerrada = False
+
+    def acepta(self, evento):
+        if evento.tema == "sistema":
+            return True
+        return evento.tema in self.temas and (self.filtro is None or self.filtro(evento))
+
+    def _compactar(self):
+        vistas = set()
+        conservados = deque()
+        for evento in reversed(self._pendientes):
+            if evento.clave is not None:
+                if evento.clave in vistas:
+                    continue
+                vistas.add(evento.clave)
+            conservados.appendleft(evento)
+        self.descartados += len(self._pendientes) - len(conservados)
+        self._pendientes = conservados
+
+    def entregar(self, evento):
+        if not self.acepta(evento):
+            return
+        if len(self._pendientes) >= self.maximo:
+            self._compactar()
+        if len(self._pendientes) >= self.maximo:
+            self.descartados += len(self._pendientes) + 1
+            self._pendientes.clear()
+            evento = resincronizar(evento.id)
+        self._pendientes.append(evento)
+        self._senal.set()
+
+    async def siguiente(self, espera):
+        """Siguiente evento, o None si pasan `espera` segundos sin eventos o si se cerró."""
+        while not self._pendientes and not self._cerrada:
+            self._senal.clear()
+            try:
+                await asyncio.wait_for(self._senal.wait(), timeout=espera)
+            except asyncio.TimeoutError:
+                return None
+        if self._cerrada:
+            return None
+        return self._pendientes.popleft()
+
+    def cerrar(self):
+        self._cerrada = True
+        self._senal.set()
+
+    @property
+    def cerrada(self):
+        return self._cerrada
+
+
+class BusEventos:
+    """Publica eventos numerados a las suscripciones abiertas y guarda los últimos
+    `historial` para que un cliente que se reconecta (`Last-Event-ID`) reciba lo que
+    se perdió. Se usa sólo desde el event loop.
+    """
+
+    def __init__(self, historial=1000, max_pendientes=256):
+        self.max_pendientes = max_pendientes
+        self._ids = itertools.count(1)
+        self._ultimo = 0
+        self._historial = deque(maxlen=historial)
+        self._suscripciones = set()
+        self._stats = {"publicados": 0, "descartados": 0}
+
+    def publicar(self, tema, tipo, clave=None, **datos):
+        self._ultimo = next(self._ids)
+        evento = Evento(self._ultimo, tema, {"tipo": tipo, **datos}, clave)
+        self._historial.append(evento)
+        self._stats["publicados"] += 1
+        for suscripcion in self._suscripciones:
+            suscripcion.entregar(evento)
+        return evento
+
+    def suscribir(self, temas, filtro=None, desde=None):
+        """Abre una suscripción; con `desde` se reenvían primero los eventos posteriores a ese id."""
+        suscripcion = Suscripcion(temas, filtro, self.max_pendientes)
+        if desde is not None and desde < self._ultimo:
+            if self._historial and self._historial[0].id <= desde + 1:
+                for evento in self._historial:
+                    if evento.id > desde:
+                        suscripcion.entregar(evento)
+            else:
+                suscripcion.entregar(resincronizar(self._ultimo))
+        elif desde is not None and desde > self._ultimo:
+            # Id de otro proceso o de antes de un reinicio
+            suscripcion.entregar(resincronizar(self._ultimo))
+        self._suscripciones.add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        if suscripcion in self._suscripciones:
+            self._suscripciones.remove(suscripcion)
+            self._stats["descartados"] += suscripcion.descartados
+        suscripcion.cerrar()
+
+    def estadisticas(self):
+        stats = dict(self._stats, suscripciones=len(self._suscripciones))
+        stats["descartados"] += sum(suscripcion.descartados for suscripcion in self._suscripciones)
+        return stats
@@ -0,0 +1,44 @@
+import csv
+import io
+
+from fastapi.responses import StreamingResponse
+
+TIPOS_CONTENIDO = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+async def lineas_ndjson(lotes, mapeo):
+    async for filas in lotes:
+        yield mapeo.ndjson(filas)
+
+
+async def lineas_csv(lotes, mapeo):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(mapeo.claves)
+    # El encabezado sale de inmediato, antes de esperar el primer lote
+    yield buffer.getvalue().encode("utf-8")
+    async for filas in lotes:
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerows(mapeo.valores(filas))
+        yield buffer.getvalue().encode("utf-8")
+
+
+def respuesta_exportacion(formato, lotes, mapeo, nombre):
+    """StreamingResponse que serializa cada lote en cuanto llega de la base.
+
+    `mapeo` es el `MapeoFilas` del listado; sus claves son las columnas del CSV. La
+    memoria usada depende del tamaño del lote, no del de la tabla.
+    """
+    if formato == "csv":
+        cuerpo = lineas_csv(lotes, mapeo)
+    else:
+        cuerpo = lineas_ndjson(lotes, mapeo)
+    return StreamingResponse(
+        cuerpo,
+        media_type=TIPOS_CONTENIDO[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nombre}.{formato}"'},
+    )
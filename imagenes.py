@@ -0,0 +1,160 @@
+import asyncio
+import glob
+import hashlib
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps, features
+
+# Ancho máximo de cada variante; la altura se ajusta para conservar la proporción
+VARIANTES = {"thumb": 160, "card": 480, "full": 1200}
+CALIDAD = {"webp": 80, "avif": 55}
+EXTENSIONES_PERMITIDAS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".avif"}
+DIRECTORIO_CAS = "cas"
+
+
+class ImagenInvalida(ValueError):
+    pass
+
+
+def formatos_disponibles():
+    formatos = ["webp"]
+    # Sólo los módulos que esta versión de Pillow conoce; `features.check("avif")` advierte
+    # en cada importación en las versiones que no tienen el módulo
+    if "avif" in features.get_supported_modules():
+        formatos.append("avif")
+    return formatos
+
+
+class PipelineImagenes:
+    """Guarda imágenes por contenido y genera variantes redimensionadas.
+
+    Cada archivo se guarda como `cas/<ab>/<sha256>.<ext>` (subir dos veces la misma
+    imagen no ocupa más espacio ni choca con otro archivo del mismo nombre) y sus
+    variantes en `cas/<ab>/<sha256>/<variante>.<formato>`. Las variantes se generan en un
+    pool de hilos propio, fuera de la petición que subió la imagen.
+    """
+
+    def __init__(self, directorio="imgs", prefijo_url="/imgs", max_hilos=2):
+        self.directorio = directorio
+        self.prefijo_url = prefijo_url
+        self.formatos = formatos_disponibles()
+        self._ejecutor = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix="imagenes")
+
+    # Rutas ---------------------------------------------------------------
+
+    def _ruta(self, relativa):
+        return os.path.join(self.directorio, *relativa.split("/"))
+
+    def _base_variantes(self, clave):
+        return os.path.splitext(clave)[0]
+
+    def es_contenido(self, clave):
+        return bool(clave) and clave.startswith(DIRECTORIO_CAS + "/")
+
+    # Ingesta -------------------------------------------------------------
+
+    def guardar(self, origen, nombre_original):
+        """Copia `origen` calculando su hash y lo deja en su ruta por contenido. Devuelve la clave."""
+        extension = os.path.splitext(nombre_original or "")[1].lower()
+        if extension not in EXTENSIONES_PERMITIDAS:
+            raise ImagenInvalida(f"Tipo de imagen no permitido: {extension or 'sin extensión'}")
+
+        os.makedirs(self.directorio, exist_ok=True)
+        resumen = hashlib.sha256()
+        descriptor, temporal = tempfile.mkstemp(dir=self.directorio, suffix=extension)
+        try:
+            with os.fdopen(descriptor, "wb") as destino:
+                while True:
+                    bloque = origen.read(1024 * 1024)
+                    if not bloque:
+                        break
+                    resumen.update(bloque)
+                    destino.write(bloque)
+            try:
+                with Image.open(temporal) as imagen:
+                    imagen.verify()
+            except Exception:
+                raise ImagenInvalida("El archivo no es una imagen válida")
+
+            digest = resumen.hexdigest()
+            clave = f"{DIRECTORIO_CAS}/{digest[:2]}/{digest}{extension}"
+            ruta = self._ruta(clave)
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            if os.path.exists(ruta):
+                os.remove(temporal)
+            else:
+                os.replace(temporal, ruta)
+            return clave
+        except BaseException:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+
+    def generar_variantes(self, clave):
+        base = self._ruta(self._base_variantes(clave))
+        os.makedirs(base, exist_ok=True)
+        with Image.open(self._ruta(clave)) as original:
+            original = ImageOps.exif_transpose(original)
+            if original.mode not in ("RGB", "RGBA"):
+                original = original.convert("RGBA" if "transparency" in original.info else "RGB")
+            for variante, ancho in VARIANTES.items():
+                copia = original.copy()
+                copia.thumbnail((ancho, ancho * 4), Image.LANCZOS)
+                for formato in self.formatos:
+                    destino = os.path.join(base, f"{variante}.{formato}")
+                    if os.path.exists(destino):
+                        continue
+                    # Escribir a un temporal y renombrar: nunca se sirve una variante a medias
+                    temporal = destino + ".tmp"
+                    copia.save(temporal, format=formato.upper(), quality=CALIDAD[formato])
+                    os.replace(temporal, destino)
+
+    async def ingerir(self, upload, al_terminar=None):
+        """Guarda un UploadFile y programa sus variantes. Devuelve la clave sin esperar a las variantes."""
+        loop = asyncio.get_running_loop()
+        clave = await loop.run_in_executor(self._ejecutor, self.guardar, upload.file, upload.filename)
+
+        def terminado(futuro):
+            if futuro.exception():
+                logging.error(f"No se pudieron generar las variantes de {clave}: {futuro.exception()}")
+            elif al_terminar and not loop.is_closed():
+                loop.call_soon_threadsafe(al_terminar)
+
+        self._ejecutor.submit(self.generar_variantes, clave).add_done_callback(terminado)
+        return clave
+
+    # URLs ----------------------------------------------------------------
+
+    def urls(self, clave):
+        """URLs de las variantes ya generadas; `None` si la imagen no pasó por el pipeline o aún no termina."""
+        if not self.es_contenido(clave):
+            return None
+        base = self._base_variantes(clave)
+        formato = self.formatos[0]
+        if not os.path.exists(self._ruta(f"{base}/full.{formato}")):
+            return None
+        urls = {"original": f"{self.prefijo_url}/{clave}"}
+        for variante in VARIANTES:
+            for formato in self.formatos:
+                urls[f"{variante}_{formato}"] = f"{self.prefijo_url}/{base}/{variante}.{formato}"
+        return urls
+
+    def cerrar(self):
+        self._ejecutor.shutdown(wait=False)
+
+
+def main():
+    """Genera las variantes que falten para todas las imágenes por contenido de `imgs/`."""
+    pipeline = PipelineImagenes()
+    for ruta in sorted(glob.glob(os.path.join(pipeline.directorio, DIRECTORIO_CAS, "*", "*.*"))):
+        if os.path.splitext(ruta)[1].lower() in EXTENSIONES_PERMITIDAS:
+            clave = os.path.relpath(ruta, pipeline.directorio).replace(os.sep, "/")
+            pipeline.generar_variantes(clave)
+            print(f"Variantes listas: {clave}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Importación masiva de productos desde CSV o JSON.
+
+Cada fila trae `nombre`, `precio`, `stock` y opcionalmente `imagen` (el nombre de
+uno de los archivos subidos junto con el catálogo). Los productos se identifican
+por nombre: los que ya existen se actualizan y los demás se insertan. Las filas
+con errores se reportan una por una y no detienen al resto.
+"""
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+
+from escrituras import MAX_PARAMETROS
+
+LARGO_NOMBRE = 100
+TAMANO_LOTE = 500
+COLUMNAS_INSERTAR = ["Nombre", "Precio", "Stock", "Imagen"]
+# SQL Server acepta hasta 1000 filas en un VALUES y 2100 parámetros por sentencia
+MAX_FILAS_VALUES = 1000
+
+
+class ArchivoInvalido(ValueError):
+    pass
+
+
+def leer_filas(contenido, nombre_archivo="", tipo_contenido=""):
+    """Lista de dicts a partir de un CSV con encabezados o de un JSON (lista de objetos o `{"productos": [...]}`)."""
+    try:
+        texto = contenido.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise ArchivoInvalido("El archivo debe estar en UTF-8")
+    if nombre_archivo.lower().endswith(".json") or "json" in (tipo_contenido or ""):
+        try:
+            datos = json.loads(texto)
+        except ValueError as e:
+            raise ArchivoInvalido(f"JSON inválido: {e}")
+        if isinstance(datos, dict):
+            datos = datos.get("productos")
+        if not isinstance(datos, list) or not all(isinstance(fila, dict) for fila in datos):
+            raise ArchivoInvalido("El JSON debe ser una lista de productos")
+        return datos
+    lector = csv.DictReader(io.StringIO(texto))
+    if not lector.fieldnames or "nombre" not in [campo.strip().lower() for campo in lector.fieldnames]:
+        raise ArchivoInvalido("El CSV debe tener encabezados nombre, precio, stock e imagen (opcional)")
+    return [{(campo or "").strip().lower(): valor for campo, valor in fila.items()} for fila in lector]
+
+
+def validar(filas, imagenes_disponibles=()):
+    """Separa las filas válidas de las erróneas.
+
+    Devuelve `(validas, errores)`: `validas` es una lista de
+    `(numero_fila, nombre, precio, stock, imagen)` y `errores` una lista de dicts
+    `{fila, nombre, error}`. Las filas se numeran desde 1.
+    """
+    validas, errores, vistos = [], [], {}
+    for numero, fila in enumerate(filas, start=1):
+        nombre = str(fila.get("nombre") or "").strip()
+
+        def error(mensaje):
+            errores.append({"fila": numero, "nombre": nombre, "error": mensaje})
+
+        if not nombre:
+            error("Falta el nombre")
+            continue
+        if len(nombre) > LARGO_NOMBRE:
+            error(f"El nombre excede {LARGO_NOMBRE} caracteres")
+            continue
+        if nombre.casefold() in vistos:
+            error(f"Nombre repetido en la fila {vistos[nombre.casefold()]}")
+            continue
+        try:
+            precio = Decimal(str(fila.get("precio")).strip())
+            if not precio.is_finite() or precio < 0:
+                raise InvalidOperation
+        except (InvalidOperation, ValueError):
+            error("Precio inválido")
+            continue
+        try:
+            stock = int(str(fila.get("stock")).strip())
+            if stock < 0:
+                raise ValueError
+        except ValueError:
+            error("Stock inválido")
+            continue
+        imagen = str(fila.get("imagen") or "").strip() or None
+        if imagen is not None and imagen not in imagenes_disponibles:
+            error(f"La imagen {imagen} no se incluyó en la carga")
+            continue
+        vistos[nombre.casefold()] = numero
+        validas.append((numero, nombre, precio.quantize(Decimal("0.01")), stock, imagen))
+    return validas, errores
+
+
+class ImportadorProductos:
+    """Escribe lotes de filas validadas: un SELECT para saber cuáles existen, un
+    `executemany` para las actualizaciones y un INSERT de varias filas que devuelve
+    los ProductoID generados (`OUTPUT INSERTED` en SQL Server, `RETURNING` en los demás).
+    """
+
+    def __init__(self, dialecto, tamano_lote=TAMANO_LOTE, max_parametros=MAX_PARAMETROS):
+        self.dialecto = dialecto
+        # Cada lote es un solo IN (...) y un solo INSERT de varias filas: se acota a lo que cabe en una sentencia
+        self.tamano_lote = max(1, min(tamano_lote, MAX_FILAS_VALUES, max_parametros // len(COLUMNAS_INSERTAR)))
+
+    def lotes(self, filas):
+        for inicio in range(0, len(filas), self.tamano_lote):
+            yield filas[inicio:inicio + self.tamano_lote]
+
+    def aplicar(self, cursor, filas):
+        """Inserta o actualiza `filas` (`(numero, nombre, precio, stock, imagen)`) y devuelve un resultado por fila."""
+        if hasattr(cursor, "fast_executemany"):
+            # pyodbc manda todos los parámetros del executemany en un solo viaje
+            cursor.fast_executemany = True
+        marcadores = ", ".join("?" for _ in filas)
+        cursor.execute(
+            f"SELECT ProductoID, Nombre FROM Productos WHERE Nombre IN ({marcadores});",
+            [fila[1] for fila in filas],
+        )
+        existentes = {nombre.casefold(): producto_id for producto_id, nombre in cursor.fetchall()}
+
+        actualizar = [fila for fila in filas if fila[1].casefold() in existentes]
+        insertar = [fila for fila in filas if fila[1].casefold() not in existentes]
+        resultados = []
+        if actualizar:
+            cursor.executemany(
+                "UPDATE Productos SET Precio = ?, Stock = ?, Imagen = COALESCE(?, Imagen) WHERE ProductoID = ?;",
+                [(precio, stock, imagen, existentes[nombre.casefold()]) for _, nombre, precio, stock, imagen in actualizar],
+            )
+            resultados.extend(
+                {"fila": numero, "id": existentes[nombre.casefold()], "nombre": nombre, "accion": "actualizado"}
+                for numero, nombre, _, _, _ in actualizar
+            )
+        if insertar:
+            cursor.execute(
+                self.dialecto.insertar_filas_devolviendo(
+                    "Productos", COLUMNAS_INSERTAR, ["ProductoID", "Nombre"], len(insertar)
+                ),
+                [valor for fila in insertar for valor in fila[1:]],
+            )
+            # El orden de OUTPUT/RETURNING no está garantizado: se asocian por nombre
+            generados = {nombre.casefold(): producto_id for producto_id, nombre in cursor.fetchall()}
+            resultados.extend(
+                {"fila": numero, "id": generados[nombre.casefold()], "nombre": nombre, "accion": "insertado"}
+                for numero, nombre, _, _, _ in insertar
+            )
+        return resultados
@@ -0,0 +1,240 @@
+import asyncio
+import bisect
+import heapq
+import logging
+import math
+import re
+import time
+import unicodedata
+
+
+def normalizar(texto):
+    """Minúsculas, sin acentos y con los espacios colapsados: "  Teléfono  ROJO" -> "telefono rojo"."""
+    descompuesto = unicodedata.normalize("NFKD", texto.casefold())
+    return " ".join("".join(c for c in descompuesto if not unicodedata.combining(c)).split())
+
+
+def palabras(normalizado):
+    return re.findall(r"\w+", normalizado)
+
+
+def trigramas(normalizado):
+    relleno = f"  {normalizado} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+class _Datos:
+    """Estructuras del índice; se arman completas en un hilo y se reemplazan de una vez."""
+
+    def __init__(self):
+        self.productos = {}     # id -> (id, nombre, precio, stock, imagen)
+        self.por_nombre = {}    # nombre exacto -> id
+        self.normalizados = {}  # id -> nombre normalizado
+        self.textos = {}        # id -> " palabra palabra ...", para comprobar prefijos con `in`
+        self.palabras = []      # [(palabra, id)] ordenada, para búsqueda por prefijo
+        self.trigramas = {}     # trigrama -> {id}
+
+    def poner(self, fila):
+        self.quitar(fila[0])
+        producto_id, nombre = fila[0], fila[1]
+        normalizado = normalizar(nombre)
+        self.productos[producto_id] = tuple(fila)
+        self.por_nombre[nombre] = producto_id
+        self.normalizados[producto_id] = normalizado
+        self.textos[producto_id] = texto = " " + " ".join(palabras(normalizado))
+        for palabra in set(texto.split()):
+            bisect.insort(self.palabras, (palabra, producto_id))
+        for trigrama in trigramas(normalizado):
+            self.trigramas.setdefault(trigrama, set()).add(producto_id)
+
+    def quitar(self, producto_id):
+        fila = self.productos.pop(producto_id, None)
+        if fila is None:
+            return
+        if self.por_nombre.get(fila[1]) == producto_id:
+            del self.por_nombre[fila[1]]
+        normalizado = self.normalizados.pop(producto_id)
+        for palabra in set(self.textos.pop(producto_id).split()):
+            posicion = bisect.bisect_left(self.palabras, (palabra, producto_id))
+            if posicion < len(self.palabras) and self.palabras[posicion] == (palabra, producto_id):
+                del self.palabras[posicion]
+        for trigrama in trigramas(normalizado):
+            ids = self.trigramas.get(trigrama)
+            if ids is not None:
+                ids.discard(producto_id)
+                if not ids:
+                    del self.trigramas[trigrama]
+
+    def fijar_stock(self, producto_id, stock):
+        fila = self.productos.get(producto_id)
+        if fila is not None:
+            self.productos[producto_id] = fila[:3] + (stock,) + fila[4:]
+
+    @classmethod
+    def construir(cls, filas):
+        datos = cls()
+        for fila in filas:
+            producto_id, nombre = fila[0], fila[1]
+            normalizado = normalizar(nombre)
+            datos.productos[producto_id] = tuple(fila)
+            datos.por_nombre[nombre] = producto_id
+            datos.normalizados[producto_id] = normalizado
+            datos.textos[producto_id] = texto = " " + " ".join(palabras(normalizado))
+            datos.palabras.extend((palabra, producto_id) for palabra in set(texto.split()))
+            for trigrama in trigramas(normalizado):
+                datos.trigramas.setdefault(trigrama, set()).add(producto_id)
+        datos.palabras.sort()
+        return datos
+
+
+class IndiceProductos:
+    """Índice en memoria de los productos por ID, por nombre exacto y por texto.
+
+    `cargar` es una corrutina que devuelve las filas `(id, nombre, precio, stock,
+    imagen)` de Productos. Las rutas que modifican el catálogo llaman a `poner`,
+    `quitar` o `fijar_stock` en el mismo proceso; cada `ttl` segundos el índice
+    se vuelve a cargar en segundo plano, lo que acota cuánto tiempo puede ver un
+    worker los cambios hechos por otro. Quien necesite el dato exacto (el stock
+    al comprar) lo sigue validando en la base.
+    """
+
+    def __init__(self, cargar, ttl=300.0, umbral_similitud=0.5):
+        self.cargar = cargar
+        self.ttl = ttl
+        self.umbral_similitud = umbral_similitud
+        self._datos = _Datos()
+        self._cargado = False
+        self._expira = 0.0
+        self._recarga = None
+        self._cambios = None  # cambios recibidos durante una recarga, para aplicarlos después
+        self.recargas = 0
+        self.busquedas = 0
+
+    # Carga -----------------------------------------------------------------
+
+    async def recargar(self):
+        self._cambios = []
+        try:
+            filas = await self.cargar()
+            datos = await asyncio.to_thread(_Datos.construir, filas)
+            for cambio, argumentos in self._cambios:
+                getattr(datos, cambio)(*argumentos)
+        finally:
+            self._cambios = None
+        self._datos = datos
+        self._cargado = True
+        self._expira = time.monotonic() + self.ttl
+        self.recargas += 1
+        logging.info(f"Índice de productos cargado: {len(datos.productos)} productos")
+
+    async def asegurar(self):
+        """Carga el índice si nunca se cargó y programa la recarga si ya venció."""
+        if not self._cargado:
+            # Tras una carga fallida se espera antes de reintentar; mientras, quien
+            # pregunta recibe un índice vacío y consulta la base
+            if time.monotonic() >= self._expira:
+                await self._recargar_una_vez()
+        elif time.monotonic() >= self._expira and self._recarga is None:
+            self._recarga = asyncio.get_running_loop().create_task(self._recargar_una_vez())
+
+    async def _recargar_una_vez(self):
+        try:
+            await self.recargar()
+        except Exception as e:
+            logging.error(f"No se pudo cargar el índice de productos: {e}")
+            self._expira = time.monotonic() + min(self.ttl, 5.0)
+        finally:
+            self._recarga = None
+
+    # Cambios ---------------------------------------------------------------
+
+    def _cambiar(self, cambio, *argumentos):
+        getattr(self._datos, cambio)(*argumentos)
+        if self._cambios is not None:
+            self._cambios.append((cambio, argumentos))
+
+    def poner(self, producto_id, nombre, precio, stock, imagen):
+        self._cambiar("poner", (producto_id, nombre, precio, stock, imagen))
+
+    def quitar(self, producto_id):
+        self._cambiar("quitar", producto_id)
+
+    def fijar_stock(self, producto_id, stock):
+        self._cambiar("fijar_stock", producto_id, stock)
+
+    # Consultas -------------------------------------------------------------
+
+    def por_id(self, producto_id):
+        return self._datos.productos.get(producto_id)
+
+    def por_nombre(self, nombre):
+        producto_id = self._datos.por_nombre.get(nombre)
+        return None if producto_id is None else self._datos.productos[producto_id]
+
+    def buscar(self, texto, limite=20):
+        """Productos cuyo nombre coincide con `texto`, del más al menos parecido.
+
+        Primero el nombre exacto, luego los que empiezan con el texto y luego los que
+        tienen, para cada palabra del texto, una palabra que empieza con ella. Si eso
+        no llena `limite`, se completan con los que comparten al menos
+        `umbral_similitud` de los trigramas del texto (tolera errores de dedo).
+        """
+        self.busquedas += 1
+        consulta = normalizar(texto)
+        buscadas = palabras(consulta)
+        if not buscadas:
+            return []
+        datos = self._datos
+        rangos = {}
+
+        # Se recorre sólo el tramo de la palabra más rara; las demás se comprueban por producto
+        tramos = [self._tramo(palabra) for palabra in buscadas]
+        inicio, fin = min(tramos, key=lambda tramo: tramo[1] - tramo[0])
+        inicios = [" " + palabra for palabra in buscadas]
+        for posicion in range(inicio, fin):
+            producto_id = datos.palabras[posicion][1]
+            if producto_id in rangos:
+                continue
+            texto = datos.textos[producto_id]
+            if all(palabra in texto for palabra in inicios):
+                normalizado = datos.normalizados[producto_id]
+                rangos[producto_id] = (0,) if normalizado == consulta else (1,) if normalizado.startswith(consulta) else (2,)
+
+        if len(rangos) < limite:
+            rangos.update(
+                (producto_id, (3, -similitud))
+                for producto_id, similitud in self._parecidos(consulta)
+                if producto_id not in rangos
+            )
+
+        orden = heapq.nsmallest(
+            limite, rangos, key=lambda producto_id: (rangos[producto_id], len(datos.normalizados[producto_id]), producto_id)
+        )
+        return [datos.productos[producto_id] for producto_id in orden]
+
+    def _tramo(self, palabra):
+        """Posiciones `[inicio, fin)` de las palabras del índice que empiezan con `palabra`."""
+        lista = self._datos.palabras
+        return bisect.bisect_left(lista, (palabra,)), bisect.bisect_left(lista, (palabra + "\U0010ffff",))
+
+    def _parecidos(self, consulta):
+        """`(id, similitud)` de los nombres que comparten al menos `umbral_similitud` de los trigramas de `consulta`.
+
+        Un nombre que alcanza el umbral tiene por fuerza alguno de los
+        `n - ceil(umbral * n) + 1` trigramas más raros del texto, así que sólo esos
+        se usan para juntar candidatos y la similitud se calcula después por candidato.
+        """
+        datos = self._datos
+        buscados = trigramas(consulta)
+        necesarios = math.ceil(self.umbral_similitud * len(buscados))
+        raros = sorted(buscados, key=lambda trigrama: len(datos.trigramas.get(trigrama, ())))
+        candidatos = set()
+        for trigrama in raros[:len(buscados) - necesarios + 1]:
+            candidatos.update(datos.trigramas.get(trigrama, ()))
+        for producto_id in candidatos:
+            comunes = len(buscados & trigramas(datos.normalizados[producto_id]))
+            if comunes >= necesarios:
+                yield producto_id, comunes / len(buscados)
+
+    def __len__(self):
+        return len(self._datos.productos)
@@ -0,0 +1,125 @@
+import asyncio
+import random
+import re
+import sqlite3
+import threading
+import time
+
+# SQLSTATE de interbloqueo y de conflicto de serialización
+SQLSTATE_REINTENTABLES = ("40001", "40P01")
+# Errores nativos de SQL Server que algunos drivers reportan con el SQLSTATE genérico HY000
+NATIVOS_REINTENTABLES = {1205}  # elegido como víctima de un interbloqueo
+# pyodbc deja el error nativo entre paréntesis justo antes de la función ODBC: "... (1205) (SQLExecDirectW)"
+_NATIVO_ODBC = re.compile(r"\((\d+)\) \(SQL\w+\)")
+# SQLITE_BUSY y SQLITE_LOCKED
+SQLITE_REINTENTABLES = (5, 6)
+
+
+class StockInsuficiente(Exception):
+    pass
+
+
+class ProductoNoEncontrado(Exception):
+    """El producto a reservar ya no existe (p. ej. lo borró otro worker)."""
+
+
+def es_reintentable(error):
+    """Interbloqueos y conflictos de serialización que conviene reintentar.
+
+    Se decide por el código del driver, nunca por el texto del mensaje (que puede
+    incluir ids o valores): pyodbc deja el SQLSTATE en `args[0]` y SQL Server
+    reporta el interbloqueo 1205 con 40001, o con HY000 y el nativo en el mensaje
+    del driver; psycopg2 deja el SQLSTATE en `pgcode`; sqlite3 usa
+    `sqlite_errorcode` (antes de Python 3.11, el mensaje fijo "database is locked").
+    """
+    args = getattr(error, "args", ())
+    sqlstate = args[0] if args and isinstance(args[0], str) else None
+    if sqlstate in SQLSTATE_REINTENTABLES or getattr(error, "pgcode", None) in SQLSTATE_REINTENTABLES:
+        return True
+    if sqlstate == "HY000" and len(args) > 1:
+        nativo = _NATIVO_ODBC.search(str(args[1]))
+        if nativo and int(nativo.group(1)) in NATIVOS_REINTENTABLES:
+            return True
+    if isinstance(error, sqlite3.OperationalError):
+        codigo = getattr(error, "sqlite_errorcode", None)
+        if codigo is not None:
+            return codigo & 0xFF in SQLITE_REINTENTABLES
+        return str(error).startswith(("database is locked", "database table is locked"))
+    return False
+
+
+class ReservadorStock:
+    """Descuenta stock y registra el pedido en una misma transacción.
+
+    El descuento es condicional (`UPDATE ... WHERE Stock >= ?`), así que la base
+    decide de forma atómica si alcanza el stock: dos compradores concurrentes no
+    pueden vender la misma unidad. Los interbloqueos se reintentan con espera
+    exponencial y las métricas de contención quedan en `estadisticas()`.
+    """
+
+    QUERY_DESCONTAR = "UPDATE Productos SET Stock = Stock - ? WHERE ProductoID = ? AND Stock >= ?;"
+    QUERY_EXISTE = "SELECT 1 FROM Productos WHERE ProductoID = ?;"
+
+    def __init__(self, bd, max_reintentos=5, espera_base=0.02, espera_maxima=1.0):
+        self.bd = bd
+        self.max_reintentos = max_reintentos
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self._candado = threading.Lock()
+        self._stats = {
+            "reservas": 0,
+            "stock_insuficiente": 0,
+            "reintentos": 0,
+            "interbloqueos": 0,
+            "fallidas": 0,
+            "tiempo_total": 0.0,
+        }
+
+    def _contar(self, **incrementos):
+        with self._candado:
+            for clave, valor in incrementos.items():
+                self._stats[clave] += valor
+
+    async def reservar(self, producto_id, cantidad, registrar):
+        """Descuenta `cantidad` de `producto_id` y ejecuta `registrar(cursor)` en la misma transacción.
+
+        Devuelve lo que devuelva `registrar`. Lanza StockInsuficiente si no alcanza y
+        ProductoNoEncontrado si el producto no existe.
+        """
+
+        def transaccion(cursor):
+            cursor.execute(self.QUERY_DESCONTAR, (cantidad, producto_id, cantidad))
+            if cursor.rowcount == 0:
+                cursor.execute(self.QUERY_EXISTE, (producto_id,))
+                if cursor.fetchone() is None:
+                    raise ProductoNoEncontrado(f"No existe el producto {producto_id}")
+                raise StockInsuficiente(f"Stock insuficiente para el producto {producto_id}")
+            return registrar(cursor)
+
+        inicio = time.monotonic()
+        intento = 0
+        while True:
+            try:
+                resultado = await self.bd.transaccion(transaccion)
+                self._contar(reservas=1, tiempo_total=time.monotonic() - inicio)
+                return resultado
+            except StockInsuficiente:
+                self._contar(stock_insuficiente=1)
+                raise
+            except ProductoNoEncontrado:
+                raise
+            except Exception as e:
+                if not es_reintentable(e) or intento >= self.max_reintentos:
+                    self._contar(fallidas=1)
+                    raise
+                self._contar(interbloqueos=1, reintentos=1)
+                # Espera exponencial con jitter para que los reintentos no choquen de nuevo
+                espera = min(self.espera_maxima, self.espera_base * (2 ** intento))
+                await asyncio.sleep(espera * random.uniform(0.5, 1.5))
+                intento += 1
+
+    def estadisticas(self):
+        with self._candado:
+            stats = dict(self._stats)
+        stats["tiempo_promedio"] = stats["tiempo_total"] / stats["reservas"] if stats["reservas"] else 0.0
+        return stats
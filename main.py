@@ -1,28 +1,57 @@
+import asyncio
+import json
+import math
 import os
-from fastapi import FastAPI, HTTPException, Request, File, UploadFile, Form, status, Depends
-import pyodbc
+import secrets
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+from urllib.parse import quote_plus
+from fastapi import FastAPI, HTTPException, Request, Response, File, UploadFile, Form, Query, status, Depends, WebSocket, WebSocketDisconnect
 import uvicorn
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from typing import List, Optional, Union
 from fastapi.middleware.cors import CORSMiddleware
-import shutil
-from fastapi.staticfiles import StaticFiles
 from starlette.middleware.base import BaseHTTPMiddleware
-from fastapi.responses import FileResponse, RedirectResponse, JSONResponse
+from starlette.websockets import WebSocketState
+from fastapi.responses import RedirectResponse, JSONResponse, PlainTextResponse, StreamingResponse
 import logging
-import bcrypt
 from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
 from dotenv import load_dotenv
+import acumulados
+import esquema
+from basedatos import PoolConexiones, BaseDatosAsincrona
+from consultas import DEVUELVE, EJECUTAR, UNA, VARIAS, RegistroConsultas, con_sentencias
+from credenciales import HashSaturado, LimitadorIntentos, ServicioHash
+from dialectos import Backend
+from escrituras import ColaEscrituras, insertar_filas
+from eventos import BusEventos, Evento
+from cache_catalogo import CacheCatalogo
+from estaticos import CACHE_REVALIDAR, EstaticosInmutables, ManifiestoEstaticos
+from exportacion import respuesta_exportacion
+from imagenes import ImagenInvalida, PipelineImagenes
+from importacion import ArchivoInvalido, ImportadorProductos, leer_filas, validar
+from indice_productos import IndiceProductos
+from inventario import ProductoNoEncontrado, ReservadorStock, StockInsuficiente
+from mapeo_filas import MapeoFilas, a_float, fecha_hora_texto
+from metricas import Metricas, MetricasMiddleware
+from paginacion import LIMITE_MAXIMO, LIMITE_POR_DEFECTO, ConsultaPaginada, CursorInvalido, filtro_prefijo
+from panel import ServicioPanel
+from pedidos import registrar_pedido
+from replicas import LecturasEnrutadas
+from respuestas import CompresionMiddleware, RespuestaJSON
+from sesiones import COOKIE_SESION, AlmacenMemoria, AlmacenSQL, GestorSesiones, token_de_peticion
 
 
 load_dotenv()
-app = FastAPI()
+app = FastAPI(default_response_class=RespuestaJSON)
 
 # Configuración de conexión a la base de datos
-def get_connect_string():
+def get_connect_string(database=None, solo_lectura=False):
     server = os.getenv('DB_SERVER', 'inovabyte2.database.windows.net')
     port = os.getenv('DB_PORT', '1433')
-    database = os.getenv('DB_DATABASE', 'TiendaOnline32')
+    database = database or os.getenv('DB_DATABASE', 'TiendaOnline32')
     username = os.getenv('DB_USERNAME', 'geovanydominguez')
     password = os.getenv('DB_PASSWORD', 'Flacodeoro55')
 
@@ -33,9 +62,213 @@ def get_connect_string():
         f"UID={username};"
         f"PWD={password};"
         f"Encrypt=yes;"
-        f"TrustServerCertificate=no;"
-        
+        # 'yes' sólo para servidores locales con certificado autofirmado (pruebas de carga)
+        f"TrustServerCertificate={os.getenv('DB_TRUST_SERVER_CERTIFICATE', 'no')};"
+        # Réplica de sólo lectura de Azure SQL (read scale-out) en el mismo servidor
+        + ("ApplicationIntent=ReadOnly;" if solo_lectura else "")
+    )
+
+def url_base_datos():
+    """URL de SQLAlchemy del motor; sin DATABASE_URL se usa Azure SQL por ODBC con las variables DB_*."""
+    return os.getenv('DATABASE_URL') or "mssql+pyodbc:///?odbc_connect=" + quote_plus(get_connect_string())
+
+def url_replica():
+    """URL de la réplica para reportes: DATABASE_URL_LECTURA o, con DB_LECTURA_ESCALADO=1 y sin
+    DATABASE_URL, la misma base de Azure SQL con ApplicationIntent=ReadOnly. None si no hay réplica."""
+    if os.getenv('DATABASE_URL_LECTURA'):
+        return os.getenv('DATABASE_URL_LECTURA')
+    if os.getenv('DB_LECTURA_ESCALADO') == '1' and not os.getenv('DATABASE_URL'):
+        return "mssql+pyodbc:///?odbc_connect=" + quote_plus(get_connect_string(solo_lectura=True))
+    return None
+
+# Métricas de peticiones y consultas para /metrics. CONSULTAS_LENTAS_MS activa el log
+# de consultas lentas (texto SQL y tipos de los parámetros, nunca sus valores)
+umbral_lentas = os.getenv('CONSULTAS_LENTAS_MS')
+metricas = Metricas(umbral_lentas=float(umbral_lentas) / 1000 if umbral_lentas else None)
+
+# Motor de base de datos (SQL Server, SQLite o PostgreSQL) y su dialecto de SQL
+backend = Backend(url_base_datos())
+dialecto = backend.dialecto
+
+# Cursores con sus sentencias preparadas que cada conexión conserva, uno por consulta registrada
+sentencias_por_conexion = int(os.getenv('DB_SENTENCIAS_POR_CONEXION', '64'))
+
+# Pool de conexiones compartido por todos los endpoints
+pool = PoolConexiones(
+    con_sentencias(backend.conectar, sentencias_por_conexion),
+    minimo=int(os.getenv('DB_POOL_MIN', '1')),
+    maximo=int(os.getenv('DB_POOL_MAX', '10')),
+    timeout_espera=float(os.getenv('DB_POOL_TIMEOUT', '30')),
+    max_inactividad=float(os.getenv('DB_POOL_INACTIVIDAD', '300')),
+    intervalo_verificacion=float(os.getenv('DB_POOL_VERIFICACION', '30')),
+    observador=metricas,
+)
+
+# SQLAlchemy toma sus conexiones del mismo pool (NullPool evita un segundo pool encima)
+engine = create_engine(backend.url, creator=pool.prestada, poolclass=NullPool)
+
+# Acceso a datos asíncrono y hashing de contraseñas, cada uno con su propio pool de hilos
+bd = BaseDatosAsincrona(pool, max_hilos=int(os.getenv('DB_HILOS', '0')) or None, observador=metricas)
+
+# Reportes: conexiones e hilos propios hacia la primaria, para que nunca ocupen los de las
+# compras, y otro pool hacia la réplica si la hay. Cada reporte lee de la réplica mientras
+# su retraso quepa en el desfase que tolera (DESFASE_REPORTES) y si no, de la primaria
+pool_reportes = PoolConexiones(
+    con_sentencias(backend.conectar, sentencias_por_conexion),
+    minimo=0,
+    maximo=int(os.getenv('REPORTES_POOL_MAX', '4')),
+    timeout_espera=float(os.getenv('DB_POOL_TIMEOUT', '30')),
+    observador=metricas,
+)
+bd_reportes = BaseDatosAsincrona(pool_reportes, observador=metricas)
+pool_replica = bd_replica = None
+if url_replica():
+    pool_replica = PoolConexiones(
+        con_sentencias(Backend(url_replica()).conectar, sentencias_por_conexion),
+        minimo=0,
+        maximo=int(os.getenv('REPLICA_POOL_MAX', '10')),
+        timeout_espera=float(os.getenv('DB_POOL_TIMEOUT', '30')),
+        observador=metricas,
     )
+    bd_replica = BaseDatosAsincrona(pool_replica, observador=metricas)
+lecturas = LecturasEnrutadas(
+    bd_reportes,
+    bd_replica,
+    intervalo=float(os.getenv('REPLICA_LATIDO', '5')),
+    pausa_fallo=float(os.getenv('REPLICA_PAUSA_FALLO', '30')),
+)
+# Desfase máximo, en segundos, que tolera cada reporte
+DESFASE_REPORTES = {
+    "pedidos": 30,
+    "ventas": 60,
+    "panel": 60,
+    "sesiones": 120,
+    "acumulados": 300,
+}
+
+# Consultas con nombre: cada sentencia fija se declara una vez con los tipos de sus
+# parámetros (las columnas del esquema) y la forma de su resultado
+consultas = RegistroConsultas(dialecto)
+_clientes, _administradores = esquema.clientes.c, esquema.administradores.c
+_productos, _pedidos, _ventas = esquema.productos.c, esquema.pedidos.c, esquema.ventas.c
+_cancelados, _sesiones = esquema.pedidos_cancelados.c, esquema.sesiones_clientes.c
+COLUMNAS_PRODUCTO = ["ProductoID", "Nombre", "Precio", "Stock", "Imagen"]
+
+# Cliente o administrador en un solo viaje; si el nombre existe en ambas tablas se
+# prueba primero como cliente, igual que antes
+consultas.declarar("identidad", """
+SELECT 0 AS Orden, 'cliente' AS TipoUsuario, ClienteID, Contrasena FROM Clientes WHERE NombreUsuario = ?
+UNION ALL
+SELECT 1, 'administrador', AdministradorID, Contrasena FROM Administradores WHERE NombreUsuario = ?
+ORDER BY Orden;
+""", [_clientes.NombreUsuario, _administradores.NombreUsuario], VARIAS, ["Orden", "TipoUsuario", "UsuarioID", "Contrasena"])
+consultas.declarar("insertar_cliente", """
+INSERT INTO Clientes (Nombre, Apellido, CorreoElectronico, NombreUsuario, Contrasena)
+VALUES (?, ?, ?, ?, ?);
+""", [_clientes.Nombre, _clientes.Apellido, _clientes.CorreoElectronico, _clientes.NombreUsuario, _clientes.Contrasena], EJECUTAR)
+consultas.declarar("actualizar_inicio_sesion", "UPDATE SesionesClientes SET FechaInicio = ?, IP = ? WHERE ClienteID = ?;",
+                   [_sesiones.FechaInicio, _sesiones.IP, _sesiones.ClienteID], EJECUTAR)
+consultas.declarar("cerrar_sesion_cliente", "UPDATE SesionesClientes SET FechaCierre = ? WHERE ClienteID = ? AND FechaCierre IS NULL;",
+                   [_sesiones.FechaCierre, _sesiones.ClienteID], EJECUTAR)
+
+consultas.declarar("todos_los_productos", "SELECT ProductoID, Nombre, Precio, Stock, Imagen FROM Productos;",
+                   [], VARIAS, COLUMNAS_PRODUCTO)
+consultas.declarar("producto_por_id", "SELECT ProductoID, Nombre, Precio, Stock, Imagen FROM Productos WHERE ProductoID = ?;",
+                   [_productos.ProductoID], UNA, COLUMNAS_PRODUCTO)
+consultas.declarar("producto_por_nombre", "SELECT ProductoID, Nombre, Precio, Stock, Imagen FROM Productos WHERE Nombre = ?;",
+                   [_productos.Nombre], UNA, COLUMNAS_PRODUCTO)
+consultas.declarar("existe_producto", "SELECT ProductoID FROM Productos WHERE ProductoID = ?;",
+                   [_productos.ProductoID], UNA, ["ProductoID"])
+consultas.declarar("stock_producto", "SELECT Nombre, Stock, Precio FROM Productos WHERE ProductoID = ?;",
+                   [_productos.ProductoID], UNA, ["Nombre", "Stock", "Precio"])
+consultas.declarar("insertar_producto", dialecto.insertar_devolviendo("Productos", ["Nombre", "Precio", "Stock", "Imagen"], "ProductoID"),
+                   [_productos.Nombre, _productos.Precio, _productos.Stock, _productos.Imagen], DEVUELVE, ["ProductoID"])
+consultas.declarar("actualizar_producto", "UPDATE Productos SET Nombre = ?, Precio = ?, Stock = ? WHERE ProductoID = ?;",
+                   [_productos.Nombre, _productos.Precio, _productos.Stock, _productos.ProductoID], EJECUTAR)
+consultas.declarar("devolver_stock", "UPDATE Productos SET Stock = Stock + ? WHERE ProductoID = ?;",
+                   [_productos.Stock, _productos.ProductoID], EJECUTAR)
+consultas.declarar("eliminar_producto", "DELETE FROM Productos WHERE ProductoID = ?;", [_productos.ProductoID], EJECUTAR)
+consultas.declarar("desvincular_pedidos", "UPDATE Pedidos SET ProductoID = NULL WHERE ProductoID = ?;",
+                   [_pedidos.ProductoID], EJECUTAR)
+consultas.declarar("desvincular_pedidos_cancelados", "UPDATE PedidosCancelados SET ProductoID = NULL WHERE ProductoID = ?;",
+                   [_cancelados.ProductoID], EJECUTAR)
+
+consultas.declarar("pedido_por_id", "SELECT PedidoID, ClienteID, ProductoID, Cantidad FROM Pedidos WHERE PedidoID = ?;",
+                   [_pedidos.PedidoID], UNA, ["PedidoID", "ClienteID", "ProductoID", "Cantidad"])
+consultas.declarar("pedidos_de_cliente", """
+SELECT p.PedidoID, p.Cantidad, p.FechaCompra, pr.Nombre, pr.Precio * p.Cantidad AS PrecioTotal
+FROM Pedidos p
+JOIN Productos pr ON p.ProductoID = pr.ProductoID
+WHERE p.ClienteID = ?;
+""", [_pedidos.ClienteID], VARIAS, ["PedidoID", "Cantidad", "FechaCompra", "NombreProducto", "PrecioTotal"])
+consultas.declarar("insertar_pedido_cancelado", """
+INSERT INTO PedidosCancelados (PedidoID, ClienteID, ProductoID, Cantidad, FechaCancelacion)
+VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP);
+""", [_cancelados.PedidoID, _cancelados.ClienteID, _cancelados.ProductoID, _cancelados.Cantidad], EJECUTAR)
+consultas.declarar("ventas_de_pedido", "SELECT NombreProducto, Cantidad, TotalCompra, FechaVenta FROM Ventas WHERE PedidoID = ?;",
+                   [_ventas.PedidoID], VARIAS, ["NombreProducto", "Cantidad", "TotalCompra", "FechaVenta"])
+consultas.declarar("eliminar_ventas_de_pedido", "DELETE FROM Ventas WHERE PedidoID = ?;", [_ventas.PedidoID], EJECUTAR)
+consultas.declarar("eliminar_pedido", "DELETE FROM Pedidos WHERE PedidoID = ?;", [_pedidos.PedidoID], EJECUTAR)
+
+consultas.declarar("ganancia_total", acumulados.QUERY_GANANCIA_TOTAL, [], UNA, ["GananciaTotal"])
+consultas.declarar("mas_solicitados", acumulados.QUERY_MAS_SOLICITADOS, [], VARIAS, ["NombreProducto", "TotalVendido"])
+consultas.declarar("ventas_por_dia", acumulados.QUERY_VENTAS_POR_DIA,
+                   [esquema.resumen_dia.c.Fecha, esquema.resumen_dia.c.Fecha], VARIAS, ["Fecha", "Cantidad", "Total"])
+servicio_hash = ServicioHash(
+    max_hilos=int(os.getenv('HASH_HILOS', '2')),
+    rondas=int(os.getenv('HASH_RONDAS', '12')),
+    # HASH_PROCESOS > 0 usa un pool de procesos en lugar de hilos
+    procesos=int(os.getenv('HASH_PROCESOS', '0')),
+    max_pendientes=int(os.getenv('HASH_MAX_PENDIENTES', '64')),
+    ttl_cache=float(os.getenv('LOGIN_CACHE_TTL', '300')),
+)
+# Intentos de login por minuto por IP y por nombre de usuario
+intentos_ip = int(os.getenv('LOGIN_INTENTOS_IP', '60'))
+intentos_usuario = int(os.getenv('LOGIN_INTENTOS_USUARIO', '10'))
+limite_login_ip = LimitadorIntentos(capacidad=intentos_ip, por_minuto=intentos_ip)
+limite_login_usuario = LimitadorIntentos(capacidad=intentos_usuario, por_minuto=intentos_usuario)
+# Auditoría y bitácora de sesiones: se escriben por lotes desde un spool local, fuera de la petición
+cola_escrituras = ColaEscrituras(
+    bd,
+    os.getenv('ESCRITURAS_DIR', 'spool'),
+    tamano_lote=int(os.getenv('ESCRITURAS_LOTE', '500')),
+    intervalo=float(os.getenv('ESCRITURAS_INTERVALO', '1')),
+    sincronizar=os.getenv('ESCRITURAS_FSYNC', '0') == '1',
+    max_fallos=int(os.getenv('ESCRITURAS_MAX_FALLOS', '5')),
+)
+# Imágenes por contenido; las variantes se generan en hilos propios, fuera de la petición
+pipeline_imagenes = PipelineImagenes(max_hilos=int(os.getenv('IMAGENES_HILOS', '2')))
+# Cambios de stock, productos y pedidos en vivo por /eventos (SSE) y /ws/eventos (WebSocket)
+bus_eventos = BusEventos(
+    historial=int(os.getenv('EVENTOS_HISTORIAL', '1000')),
+    max_pendientes=int(os.getenv('EVENTOS_MAX_PENDIENTES', '256')),
+)
+latido_eventos = float(os.getenv('EVENTOS_LATIDO', '15'))
+# Cada conexión se cierra tras EVENTOS_DURACION segundos y el cliente se reconecta sin perder
+# eventos; así un apagado no espera indefinidamente a los flujos abiertos
+duracion_eventos = float(os.getenv('EVENTOS_DURACION', '300'))
+
+# Sesiones por petición. Con varios workers o réplicas usar SESSION_BACKEND=sql (tabla
+# SesionesWeb en la base principal) o sqlite (archivo local compartido por los workers)
+# y fijar SESSION_SECRET para que todos validen las mismas firmas.
+def crear_almacen_sesiones():
+    backend = os.getenv('SESSION_BACKEND', 'memoria')
+    ttl = int(os.getenv('SESSION_TTL', str(8 * 3600)))
+    purga = float(os.getenv('SESSION_PURGA', '600'))
+    if backend == 'sql':
+        return AlmacenSQL(bd, ttl=ttl, intervalo_purga=purga)
+    if backend == 'sqlite':
+        ruta = os.getenv('SESSION_SQLITE', 'sesiones.db')
+        pool_sesiones = PoolConexiones(lambda: sqlite3.connect(ruta, check_same_thread=False, timeout=10), maximo=4)
+        return AlmacenSQL(BaseDatosAsincrona(pool_sesiones), ttl=ttl, intervalo_purga=purga)
+    return AlmacenMemoria(max_sesiones=int(os.getenv('SESSION_MAX', '10000')), ttl=ttl)
+
+secreto_sesiones = os.getenv('SESSION_SECRET')
+if not secreto_sesiones:
+    logging.warning("SESSION_SECRET no definido; las sesiones no sobrevivirán reinicios ni se compartirán entre workers")
+    secreto_sesiones = secrets.token_hex(32)
+sesiones = GestorSesiones(crear_almacen_sesiones(), secreto_sesiones)
+cookie_segura = os.getenv('SESSION_COOKIE_SECURE', '1') == '1'
 
 
 # Configuración de CORS
@@ -46,11 +279,17 @@ app.add_middleware(
     allow_methods=["*"],  # Permite todos los métodos HTTP
     allow_headers=["*"],  # Permite todas las cabeceras
 )
+# Compresión gzip/brotli negociada para respuestas de texto por encima del umbral
+app.add_middleware(CompresionMiddleware, minimo=int(os.getenv('COMPRESION_MINIMO', '1024')))
+# Latencia, conteo y errores por ruta; va por fuera para medir también la compresión
+app.add_middleware(MetricasMiddleware, metricas=metricas)
 
 class AuthMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         # Definir rutas que no requieren autenticación
         allowed_paths = ["/", "/login", "/cliente/registrar", "/CargaLogin.html", "/productos"]
+        # Resolver la identidad a partir del token de sesión de esta petición
+        usuario_actual = await obtener_usuario_actual(request)
         # Permitir acceso público a las rutas permitidas
         if request.url.path not in allowed_paths and not usuario_actual.get("nombre_usuario"):
             return RedirectResponse(url='/CargaLogin.html')
@@ -58,20 +297,18 @@ class AuthMiddleware(BaseHTTPMiddleware):
         response = await call_next(request)
         return response
 
-def ejecutar_consulta(query, params=None):
-    connect_string = get_connect_string()  # Obtener la cadena de conexión
-    with pyodbc.connect(connect_string) as conn:
-        cursor = conn.cursor()
-        if params:
-            cursor.execute(query, params)
-        else:
-            cursor.execute(query)
-        if query.strip().upper().startswith("SELECT"):
-            rows = cursor.fetchall()
-            return rows
-        else:
-            conn.commit()
-            return True
+# Versión síncrona, para código que corre fuera del event loop (scripts, tareas en hilos).
+# Recibe una consulta registrada o su nombre; su forma decide si se leen filas o se confirma
+def ejecutar_consulta(consulta, params=None):
+    if isinstance(consulta, str):
+        consulta = getattr(consultas, consulta)
+    with pool.conexion() as conn:
+        inicio = time.perf_counter()
+        resultado = consulta.ejecutar(conn, params)
+        metricas.observar_consulta(
+            "correr", consulta.sql, time.perf_counter() - inicio, consulta.contar(resultado), params, nombre=consulta.nombre
+        )
+        return resultado
 
 
 
@@ -80,30 +317,115 @@ def ejecutar_consulta(query, params=None):
 current_dir = os.path.dirname(os.path.abspath(__file__))
 
 
-# Montar directorios necesarios
-app.mount("/Login", StaticFiles(directory="Login"), name="Login")
-app.mount("/PaginasDeInicio", StaticFiles(directory="PaginasDeInicio"), name="PaginasDeInicio")
-app.mount("/PaginasNav", StaticFiles(directory="PaginasNav"), name="PaginasNav")
-app.mount("/PanelAdministracion", StaticFiles(directory="PanelAdministracion"), name="PanelAdministracion")
-app.mount("/images", StaticFiles(directory="images"), name="images")
-app.mount("/imgs", StaticFiles(directory="imgs"), name="imgs")
+# Montar directorios necesarios. Las huellas de los archivos se calculan al arrancar:
+# los recursos se sirven inmutables bajo su URL con huella y las páginas se revalidan con ETag
+directorios_estaticos = {
+    "/Login": "Login",
+    "/PaginasDeInicio": "PaginasDeInicio",
+    "/PaginasNav": "PaginasNav",
+    "/PanelAdministracion": "PanelAdministracion",
+    "/images": "images",
+}
+manifiesto_estaticos = ManifiestoEstaticos(
+    {prefijo: os.path.join(current_dir, directorio) for prefijo, directorio in directorios_estaticos.items()},
+    archivos={"/": os.path.join(current_dir, "Index.html")},
+)
+for prefijo, directorio in directorios_estaticos.items():
+    app.mount(prefijo, EstaticosInmutables(directory=directorio, prefijo=prefijo, manifiesto=manifiesto_estaticos), name=directorio)
+# Las imágenes de productos cambian en tiempo de ejecución; las que están bajo cas/ ya son únicas por contenido
+app.mount("/imgs", EstaticosInmutables(directory="imgs", prefijo="/imgs", prefijos_inmutables=("cas/",)), name="imgs")
 
 
+@app.on_event("startup")
+def iniciar_pool():
+    try:
+        pool.precalentar()
+    except Exception as e:
+        logging.warning(f"No se pudo precalentar el pool de conexiones: {e}")
+
+@app.on_event("startup")
+async def iniciar_escrituras():
+    cola_escrituras.iniciar()
+
+@app.on_event("startup")
+async def iniciar_lecturas():
+    lecturas.iniciar()
+
+@app.on_event("startup")
+async def iniciar_sesiones():
+    await sesiones.iniciar()
+
+@app.on_event("startup")
+async def cargar_indice_productos():
+    await indice_productos.asegurar()
+
+@app.on_event("shutdown")
+async def cerrar_escrituras():
+    # Antes que cerrar_pool: el último vaciado todavía necesita la base
+    await cola_escrituras.cerrar()
+
+@app.on_event("shutdown")
+async def cerrar_lecturas():
+    await lecturas.cerrar()
+
+@app.on_event("shutdown")
+async def cerrar_sesiones():
+    await sesiones.detener()
+
+@app.on_event("shutdown")
+def cerrar_pool():
+    bd.cerrar()
+    bd_reportes.cerrar()
+    servicio_hash.cerrar()
+    pipeline_imagenes.cerrar()
+    pool.cerrar()
+    pool_reportes.cerrar()
+    if bd_replica is not None:
+        bd_replica.cerrar()
+        pool_replica.cerrar()
+
 @app.get("/")
-def read_root():
-    return FileResponse(os.path.join(current_dir, 'Index.html'))
+async def read_root(request: Request):
+    return manifiesto_estaticos.recurso("/").respuesta(request.headers, CACHE_REVALIDAR)
     
 
 
 
 
-def registrar_auditoria(tipo_operacion, tabla, registro_id, usuario):
-    query = """
-    INSERT INTO AuditoriaCRUD (TipoOperacion, Tabla, RegistroID, Usuario)
-    VALUES (?, ?, ?, ?);
-    """
-    params = (tipo_operacion, tabla, registro_id, usuario)
-    ejecutar_consulta(query, params)
+def escribir_auditoria(cursor, filas):
+    insertar_filas(
+        cursor, "AuditoriaCRUD", ["TipoOperacion", "Tabla", "RegistroID", "Usuario", "Fecha"],
+        [(tipo, tabla, registro_id, usuario, datetime.fromisoformat(fecha)) for tipo, tabla, registro_id, usuario, fecha in filas],
+    )
+
+def escribir_inicios_sesion(cursor, filas):
+    # Una fila por cliente: se actualizan las que existen y el resto se inserta en bloque
+    ultimas = {cliente_id: (ip, datetime.fromisoformat(fecha)) for cliente_id, ip, fecha in filas}
+    marcadores = ", ".join("?" for _ in ultimas)
+    cursor.execute(f"SELECT ClienteID FROM SesionesClientes WHERE ClienteID IN ({marcadores});", list(ultimas))
+    existentes = {fila[0] for fila in cursor.fetchall()}
+    actualizar = [(fecha, ip, cliente_id) for cliente_id, (ip, fecha) in ultimas.items() if cliente_id in existentes]
+    if actualizar:
+        cursor.executemany(consultas.actualizar_inicio_sesion.sql, actualizar)
+    nuevas = [(cliente_id, fecha, ip) for cliente_id, (ip, fecha) in ultimas.items() if cliente_id not in existentes]
+    if nuevas:
+        insertar_filas(cursor, "SesionesClientes", ["ClienteID", "FechaInicio", "IP"], nuevas)
+
+def escribir_cierres_sesion(cursor, filas):
+    cursor.executemany(
+        consultas.cerrar_sesion_cliente.sql,
+        [(datetime.fromisoformat(fecha), cliente_id) for cliente_id, fecha in filas],
+    )
+
+cola_escrituras.registrar_tipo("auditoria", escribir_auditoria)
+cola_escrituras.registrar_tipo("inicio_sesion", escribir_inicios_sesion)
+cola_escrituras.registrar_tipo("cierre_sesion", escribir_cierres_sesion)
+
+def ahora_iso():
+    return datetime.now().isoformat(" ", "seconds")
+
+async def registrar_auditoria(tipo_operacion, tabla, registro_id, usuario):
+    cola_escrituras.encolar("auditoria", tipo_operacion, tabla, registro_id, usuario, ahora_iso())
     
 class ClienteCreate(BaseModel):
     nombre: str
@@ -115,10 +437,14 @@ class ClienteCreate(BaseModel):
 class LoginRequest(BaseModel):
     nombre_usuario: str
     contrasena: str
+    # Clientes de API que mandan `Authorization: Bearer`: reciben el token en la respuesta
+    # en lugar de la cookie HttpOnly, que los scripts de la página no pueden leer
+    bearer: bool = False
     
 class LoginResponse(BaseModel):
     mensaje: str
     tipo_usuario: Optional[str] = None
+    token: Optional[str] = None
 
 class Producto(BaseModel):
     id: Optional[int]
@@ -126,6 +452,7 @@ class Producto(BaseModel):
     precio: float
     stock: int
     imagen: Optional[str] = None
+    imagenes: Optional[dict] = None
     
 class ProductoCreateUpdate(BaseModel):
     nombre: str
@@ -136,6 +463,9 @@ class CompraRequest(BaseModel):
     nombre_producto: str
     cantidad: int
 
+class CheckoutRequest(BaseModel):
+    productos: List[CompraRequest]
+
 class PedidoResponse(BaseModel):
     nombre_producto: str
     precio_total: float
@@ -160,7 +490,16 @@ class Venta(BaseModel):
     total_compra: float
     fecha_venta: Optional[str]
 
-usuario_actual = {"tipo_usuario": None, "nombre_usuario": None, "cliente_id": None}
+USUARIO_ANONIMO = {"tipo_usuario": None, "nombre_usuario": None, "cliente_id": None}
+
+# Dependencia: usuario de la sesión de esta petición (anónimo si no hay sesión válida)
+async def obtener_usuario_actual(request: Request) -> dict:
+    usuario = getattr(request.state, "usuario", None)
+    if usuario is None:
+        datos = await sesiones.obtener(token_de_peticion(request))
+        usuario = {**USUARIO_ANONIMO, **datos} if datos else dict(USUARIO_ANONIMO)
+        request.state.usuario = usuario
+    return usuario
 
 
 
@@ -168,21 +507,21 @@ usuario_actual = {"tipo_usuario": None, "nombre_usuario": None, "cliente_id": No
 
 # Endpoint para obtener el rol del usuario
 @app.get("/user-role")
-def get_user_role():
+async def get_user_role(usuario_actual: dict = Depends(obtener_usuario_actual)):
     if not usuario_actual["nombre_usuario"]:
         raise HTTPException(status_code=401, detail="Not authenticated")
     return {"role": usuario_actual["tipo_usuario"]}
 
 # Endpoint para la página de usuario
 @app.get("/user-page")
-def user_page():
+async def user_page(usuario_actual: dict = Depends(obtener_usuario_actual)):
     if usuario_actual["tipo_usuario"] != "cliente":
         raise HTTPException(status_code=403, detail="Access forbidden: insufficient permissions")
     return {"message": "Access granted"}
 
 # Endpoint para la página de administrador
 @app.get("/admin-page")
-def admin_page():
+async def admin_page(usuario_actual: dict = Depends(obtener_usuario_actual)):
     if usuario_actual["tipo_usuario"] != "administrador":
         raise HTTPException(status_code=403, detail="Access forbidden: insufficient permissions")
     return {"message": "Access granted"}
@@ -191,121 +530,166 @@ def admin_page():
 async def registrar_cliente(cliente: ClienteCreate):
     try:
         # Cifrar la contraseña
-        hashed_password = bcrypt.hashpw(cliente.contrasena.encode('utf-8'), bcrypt.gensalt())
+        hashed_password = await servicio_hash.hashear(cliente.contrasena)
         
-        query = """
-        INSERT INTO Clientes (Nombre, Apellido, CorreoElectronico, NombreUsuario, Contrasena)
-        VALUES (?, ?, ?, ?, ?);
-        """
-        params = (cliente.nombre, cliente.apellido, cliente.correo_electronico, cliente.nombre_usuario, hashed_password.decode('utf-8'))
-        ejecutar_consulta(query, params)
+        params = (cliente.nombre, cliente.apellido, cliente.correo_electronico, cliente.nombre_usuario, hashed_password)
+        await bd.correr(consultas.insertar_cliente, params)
         return {"mensaje": "Cliente registrado exitosamente"}
+    except HashSaturado as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/login", response_model=LoginResponse)
-async def iniciar_sesion(login: LoginRequest, request: Request):
-    try:
-        # Verificar si el usuario es un cliente
-        query_cliente = """
-        SELECT ClienteID, Contrasena FROM Clientes WHERE NombreUsuario = ?;
-        """
-        params_cliente = (login.nombre_usuario,)
-        resultado_cliente = ejecutar_consulta(query_cliente, params_cliente)
-        
-        if resultado_cliente:
-            cliente_id, hashed_password = resultado_cliente[0]
-            if bcrypt.checkpw(login.contrasena.encode('utf-8'), hashed_password.encode('utf-8')):
-                usuario_actual["tipo_usuario"] = "cliente"
-                usuario_actual["nombre_usuario"] = login.nombre_usuario
-                usuario_actual["cliente_id"] = cliente_id
-
-                # Registrar o actualizar sesión del cliente
-                query_sesion = """
-                IF EXISTS (SELECT 1 FROM SesionesClientes WHERE ClienteID = ?)
-                    UPDATE SesionesClientes SET FechaInicio = GETDATE(), IP = ? WHERE ClienteID = ?
-                ELSE
-                    INSERT INTO SesionesClientes (ClienteID, FechaInicio, IP) VALUES (?, GETDATE(), ?);
-                """
-                client_ip = request.client.host
-                params_sesion = (usuario_actual["cliente_id"], client_ip, usuario_actual["cliente_id"], usuario_actual["cliente_id"], client_ip)
-                ejecutar_consulta(query_sesion, params_sesion)
-
-                return LoginResponse(mensaje="Inicio de sesión exitoso", tipo_usuario="cliente")
-
-        # Verificar si el usuario es un administrador
-        query_admin = """
-        SELECT AdministradorID, Contrasena FROM Administradores WHERE NombreUsuario = ?;
-        """
-        params_admin = (login.nombre_usuario,)
-        resultado_admin = ejecutar_consulta(query_admin, params_admin)
+async def abrir_sesion(response: Response, usuario, bearer=False):
+    token = await sesiones.crear(usuario)
+    if bearer:
+        return token
+    response.set_cookie(COOKIE_SESION, token, max_age=sesiones.almacen.ttl, httponly=True, secure=cookie_segura, samesite="lax")
+    return None
 
-        if resultado_admin:
-            administrador_id, contrasena = resultado_admin[0]
-            if login.contrasena == contrasena:
-                usuario_actual["tipo_usuario"] = "administrador"
-                usuario_actual["nombre_usuario"] = login.nombre_usuario
-                usuario_actual["administrador_id"] = administrador_id
-                return LoginResponse(mensaje="Inicio de sesión exitoso", tipo_usuario="administrador")
+def ip_cliente(request: Request):
+    return request.client.host if request.client else ""
+
+def limitar_intentos_login(request: Request, nombre_usuario: str):
+    espera = max(
+        limite_login_ip.consumir(ip_cliente(request)),
+        limite_login_usuario.consumir(nombre_usuario.lower()),
+    )
+    if espera:
+        raise HTTPException(
+            status_code=429, detail="Demasiados intentos de inicio de sesión",
+            headers={"Retry-After": str(math.ceil(espera))},
+        )
+
+@app.post("/login", response_model=LoginResponse, response_model_exclude_none=True)
+async def iniciar_sesion(login: LoginRequest, request: Request, response: Response):
+    limitar_intentos_login(request, login.nombre_usuario)
+    try:
+        identidades = await bd.correr(consultas.identidad, (login.nombre_usuario, login.nombre_usuario))
+
+        for identidad in identidades:
+            if identidad.TipoUsuario == "cliente":
+                if not await servicio_hash.verificar(login.contrasena, identidad.Contrasena):
+                    continue
+                usuario_actual = {"tipo_usuario": "cliente", "nombre_usuario": login.nombre_usuario, "cliente_id": identidad.UsuarioID}
+                # La bitácora de sesiones no retrasa la respuesta
+                cola_escrituras.encolar("inicio_sesion", identidad.UsuarioID, ip_cliente(request), ahora_iso())
+            else:
+                if login.contrasena != identidad.Contrasena:
+                    continue
+                usuario_actual = {"tipo_usuario": "administrador", "nombre_usuario": login.nombre_usuario, "administrador_id": identidad.UsuarioID}
+
+            token = await abrir_sesion(response, usuario_actual, bearer=login.bearer)
+            return LoginResponse(mensaje="Inicio de sesión exitoso", tipo_usuario=identidad.TipoUsuario, token=token)
 
         raise HTTPException(status_code=401, detail="Credenciales incorrectas")
+    except HTTPException:
+        raise
+    except HashSaturado as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
   
 @app.post("/logout", response_model=LoginResponse)
-def cerrar_sesion():
+async def cerrar_sesion(request: Request, response: Response, usuario_actual: dict = Depends(obtener_usuario_actual)):
     try:
         # Obtener el ClienteID automáticamente basado en la sesión activa
         cliente_id = usuario_actual.get("cliente_id")
 
         if cliente_id is not None:
-            # Actualizar la tabla SesionesClientes para marcar la sesión como cerrada
-            query = """
-            UPDATE SesionesClientes
-            SET FechaCierre = GETDATE()
-            WHERE ClienteID = ? AND FechaCierre IS NULL;
-            """
-            ejecutar_consulta(query, (cliente_id,))
+            # Marcar la sesión como cerrada en SesionesClientes (escritura diferida)
+            cola_escrituras.encolar("cierre_sesion", cliente_id, ahora_iso())
         
-        # Limpiar la información de sesión actual
-        usuario_actual["tipo_usuario"] = None
-        usuario_actual["nombre_usuario"] = None
-        usuario_actual["cliente_id"] = None
+        # Eliminar la sesión de esta petición
+        await sesiones.cerrar(token_de_peticion(request))
+        response.delete_cookie(COOKIE_SESION)
 
         return {"mensaje": "Sesión cerrada exitosamente"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/sesiones-clientes", response_model=List[dict])
-def obtener_sesiones_clientes():
+# Paginación: sin parámetros los listados responden como siempre (lista completa);
+# con cualquier parámetro (limit, after, filtros, orden) responden una página en el
+# sobre {"resultados", "siguiente", "limite"}, y `siguiente` se pasa como `after`.
+def limite_pagina(request: Request, limit: Optional[int]):
+    if not request.query_params:
+        return None
+    return limit or LIMITE_POR_DEFECTO
+
+def filtros_fecha(columna, desde: Optional[date], hasta: Optional[date]):
+    filtros = []
+    if desde:
+        filtros.append((f"{columna} >= ?", (desde,)))
+    if hasta:
+        # `hasta` es inclusivo: todo el día
+        filtros.append((f"{columna} < ?", (hasta + timedelta(days=1),)))
+    return filtros
+
+async def listar(consulta, filtros, orden, limite, after, mapeo, origen=bd):
     try:
-        query = """
-        SELECT sc.SesionID, sc.ClienteID, c.Nombre, c.NombreUsuario, sc.FechaInicio, sc.FechaCierre, sc.IP
-        FROM SesionesClientes sc
-        JOIN Clientes c ON sc.ClienteID = c.ClienteID;
-        """
-        sesiones = ejecutar_consulta(query)
-        lista_sesiones = [
-            {
-                "SesionID": sesion[0],
-                "ClienteID": sesion[1],
-                "NombreCliente": sesion[2],
-                "NombreUsuario": sesion[3],
-                "FechaInicio": sesion[4],
-                "FechaCierre": sesion[5],
-                "IP": sesion[6]
-            }
-            for sesion in sesiones
-        ]
-        return lista_sesiones
+        sql, params = consulta.construir(filtros, orden, limite, after)
+    except CursorInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filas = await origen.consultar(sql, params)
+    # Las filas se convierten por columnas y van directo al JSON, sin revalidar contra response_model
+    if limite is None:
+        return StreamingResponse(mapeo.bloques_json(filas), media_type="application/json")
+    return RespuestaJSON(consulta.pagina(filas, orden, limite, mapeo.objetos))
+
+# Exportación completa (?format=ndjson|csv): mismos filtros y orden que el listado,
+# sin límite, leída con fetchmany y enviada por partes mientras se lee
+async def exportar(consulta, filtros, orden, after, formato, mapeo, nombre, origen=bd):
+    try:
+        sql, params = consulta.construir(filtros, orden, None, after)
+    except CursorInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    lotes = origen.consultar_en_lotes(sql, params, tamano_lote=int(os.getenv('EXPORT_LOTE', '1000')))
+    return respuesta_exportacion(formato, lotes, mapeo, nombre)
+
+mapeo_sesiones = MapeoFilas([
+    ("SesionID", 0),
+    ("ClienteID", 1),
+    ("NombreCliente", 2),
+    ("NombreUsuario", 3),
+    ("FechaInicio", 4),
+    ("FechaCierre", 5),
+    ("IP", 6),
+])
+
+consulta_sesiones = ConsultaPaginada(
+    ["sc.SesionID", "sc.ClienteID", "c.Nombre", "c.NombreUsuario", "sc.FechaInicio", "sc.FechaCierre", "sc.IP"],
+    "SesionesClientes sc JOIN Clientes c ON sc.ClienteID = c.ClienteID",
+    "sc.SesionID",
+    {"id": "sc.SesionID", "inicio": "sc.FechaInicio"},
+    dialecto,
+    columnas_fecha=["sc.FechaInicio"],
+)
+
+@app.get("/sesiones-clientes", response_model=Union[List[dict], dict])
+async def obtener_sesiones_clientes(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=LIMITE_MAXIMO),
+    after: Optional[str] = None,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    activas: Optional[bool] = None,
+    orden: str = "id",
+):
+    filtros = filtros_fecha("sc.FechaInicio", desde, hasta)
+    if activas is not None:
+        filtros.append(("sc.FechaCierre IS NULL" if activas else "sc.FechaCierre IS NOT NULL", ()))
+    try:
+        return await listar(
+            consulta_sesiones, filtros, orden, limite_pagina(request, limit), after, mapeo_sesiones,
+            origen=lecturas.vista(DESFASE_REPORTES["sesiones"]),
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# Configura la carpeta 'imgs' para servir archivos estáticos
-app.mount("/imgs", StaticFiles(directory="imgs"), name="imgs")
-
 @app.post("/productos", response_model=Producto)
-def crear_producto(
+async def crear_producto(
     nombre: str = Form(...), 
     precio: float = Form(...), 
     stock: int = Form(...), 
@@ -314,126 +698,394 @@ def crear_producto(
     try:
         filename = None
         if (imagen):
-            # Guardar la imagen
-            filename = imagen.filename
-            filepath = f"imgs/{filename}"
-            with open(filepath, "wb") as buffer:
-                shutil.copyfileobj(imagen.file, buffer)
+            # Guardar la imagen por contenido; al terminar las variantes el catálogo se vuelve a armar
+            filename = await pipeline_imagenes.ingerir(imagen, al_terminar=cache_catalogo.invalidar)
         
-        query = """
-        INSERT INTO Productos (Nombre, Precio, Stock, Imagen)
-        VALUES (?, ?, ?, ?);
-        """
         params = (nombre, precio, stock, filename)
-        ejecutar_consulta(query, params)
+        producto_id = (await bd.correr(consultas.insertar_producto, params))[0].ProductoID
+        cache_catalogo.invalidar()
+        indice_productos.poner(producto_id, nombre, precio, stock, filename)
+        producto_creado = mapeo_productos((producto_id, nombre, precio, stock, filename))
+        bus_eventos.publicar("productos", "producto_creado", producto=producto_creado)
         
-        query = "SELECT TOP 1 ProductoID, Nombre, Precio, Stock, Imagen FROM Productos ORDER BY ProductoID DESC;"
-        producto_creado = ejecutar_consulta(query)[0]
-        
-        return Producto(
-            id=producto_creado[0], 
-            nombre=producto_creado[1], 
-            precio=producto_creado[2], 
-            stock=producto_creado[3], 
-            imagen=f"/imgs/{producto_creado[4]}" if producto_creado[4] else None
-        )
+        return Producto(**producto_creado)
+    except ImagenInvalida as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/productos", response_model=List[Producto])
-def obtener_productos():
-    query = "SELECT ProductoID, Nombre, Precio, Stock, Imagen FROM Productos;"
-    productos = ejecutar_consulta(query)
-    lista_productos = [
-        Producto(
-            id=producto[0], 
-            nombre=producto[1], 
-            precio=producto[2], 
-            stock=producto[3], 
-            imagen=f"/imgs/{producto[4]}" if producto[4] else None
-        )
-        for producto in productos
-    ]
-    return lista_productos
+def imagen_principal(imagenes, imagen):
+    if imagenes:
+        return imagenes["card_webp"]
+    return f"/imgs/{imagen}" if imagen else None
+
+# Columnas (ProductoID, Nombre, Precio, Stock, Imagen); la 5 son las variantes de la imagen
+mapeo_productos = MapeoFilas(
+    [
+        ("id", 0),
+        ("nombre", 1),
+        ("precio", a_float(2)),
+        ("stock", 3),
+        ("imagen", lambda columnas: map(imagen_principal, columnas[5], columnas[4])),
+        ("imagenes", 5),
+    ],
+    derivadas=[lambda columnas: list(map(pipeline_imagenes.urls, columnas[4]))],
+)
+
+importador_productos = ImportadorProductos(dialecto, tamano_lote=int(os.getenv('IMPORTACION_LOTE', '500')))
+
+@app.post("/productos/importar")
+async def importar_productos(
+    archivo: UploadFile = File(...),
+    imagenes: List[UploadFile] = File([]),
+    usuario_actual: dict = Depends(obtener_usuario_actual),
+):
+    """Alta y actualización masiva de productos desde CSV o JSON, con sus imágenes en la misma carga."""
+    if usuario_actual["tipo_usuario"] != "administrador":
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    try:
+        filas = leer_filas(await archivo.read(), archivo.filename or "", archivo.content_type)
+    except ArchivoInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    subidas = {imagen.filename: imagen for imagen in imagenes if imagen.filename}
+    validas, errores = validar(filas, subidas)
+
+    # Sólo se guardan las imágenes que usa alguna fila válida
+    usadas = sorted({fila[4] for fila in validas if fila[4]})
+    ingeridas = await asyncio.gather(
+        *[pipeline_imagenes.ingerir(subidas[nombre], al_terminar=cache_catalogo.invalidar) for nombre in usadas],
+        return_exceptions=True,
+    )
+    claves = dict(zip(usadas, ingeridas))
+    pendientes = []
+    for numero, nombre, precio, stock, imagen in validas:
+        clave = claves[imagen] if imagen else None
+        if isinstance(clave, Exception):
+            errores.append({"fila": numero, "nombre": nombre, "error": str(clave)})
+        else:
+            pendientes.append((numero, nombre, precio, stock, clave))
+
+    resultados = []
+    for lote in importador_productos.lotes(pendientes):
+        try:
+            resultados.extend(await bd.transaccion(lambda cursor: importador_productos.aplicar(cursor, lote)))
+        except Exception:
+            # Se repite fila por fila para reportar exactamente cuáles fallan
+            for fila in lote:
+                try:
+                    resultados.extend(await bd.transaccion(lambda cursor: importador_productos.aplicar(cursor, [fila])))
+                except Exception as e:
+                    errores.append({"fila": fila[0], "nombre": fila[1], "error": str(e)})
+    if resultados:
+        cache_catalogo.invalidar()
+    escritas = {fila[0]: fila for fila in pendientes}
+    for resultado in resultados:
+        _, nombre, precio, stock, imagen = escritas[resultado["fila"]]
+        anterior = indice_productos.por_id(resultado["id"])
+        if anterior is not None:
+            # El UPDATE conserva el nombre guardado y, sin imagen nueva, la anterior
+            nombre, imagen = anterior[1], imagen or anterior[4]
+        indice_productos.poner(resultado["id"], nombre, precio, stock, imagen)
+    insertados = sum(1 for resultado in resultados if resultado["accion"] == "insertado")
+    actualizados = len(resultados) - insertados
+    if resultados:
+        # Un solo aviso por carga: los clientes vuelven a pedir el catálogo
+        bus_eventos.publicar("productos", "productos_importados", insertados=insertados, actualizados=actualizados)
+    for resultado in resultados:
+        if resultado["accion"] == "actualizado":
+            await registrar_auditoria("UPDATE", "Productos", resultado["id"], usuario_actual["nombre_usuario"])
+
+    return {
+        "insertados": insertados,
+        "actualizados": actualizados,
+        "errores": sorted(errores, key=lambda error: error["fila"]),
+        "productos": sorted(resultados, key=lambda resultado: resultado["fila"]),
+    }
+
+async def cargar_productos():
+    return await bd.correr(consultas.todos_los_productos)
+
+async def cargar_catalogo():
+    productos = await cargar_productos()
+    return mapeo_productos.json(productos)
+
+# Descuento atómico de stock para las compras, con reintentos ante interbloqueos
+reservador_stock = ReservadorStock(bd, max_reintentos=int(os.getenv('STOCK_REINTENTOS', '5')))
+
+# Catálogo serializado en caché; se invalida en cada cambio de productos o stock
+cache_catalogo = CacheCatalogo(cargar_catalogo, ttl=float(os.getenv('CATALOGO_TTL', '30')))
+
+# Productos en memoria por ID, nombre y texto para /productos/buscar y las compras; las
+# mismas rutas que invalidan el catálogo lo actualizan y se recarga completo cada INDICE_PRODUCTOS_TTL
+indice_productos = IndiceProductos(cargar_productos, ttl=float(os.getenv('INDICE_PRODUCTOS_TTL', '300')))
+
+def publicar_stock(producto_id, nombre, stock):
+    """Stock confirmado de un producto: al índice en memoria y al tema `stock`."""
+    indice_productos.fijar_stock(producto_id, stock)
+    # Con la misma clave, un cliente atrasado sólo recibe el stock más reciente de cada producto
+    bus_eventos.publicar("stock", "stock", clave=("stock", producto_id), producto_id=producto_id, nombre=nombre, stock=stock)
+
+consulta_productos = ConsultaPaginada(
+    ["ProductoID", "Nombre", "Precio", "Stock", "Imagen"],
+    "Productos",
+    "ProductoID",
+    {"id": "ProductoID", "nombre": "Nombre", "precio": "Precio", "stock": "Stock"},
+    dialecto,
+)
+
+class PaginaProductos(BaseModel):
+    resultados: List[Producto]
+    siguiente: Optional[str]
+    limite: int
+
+@app.get("/productos", response_model=Union[List[Producto], PaginaProductos])
+async def obtener_productos(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=LIMITE_MAXIMO),
+    after: Optional[str] = None,
+    precio_min: Optional[float] = None,
+    precio_max: Optional[float] = None,
+    en_stock: Optional[bool] = None,
+    prefijo: Optional[str] = None,
+    orden: str = "id",
+):
+    limite = limite_pagina(request, limit)
+    if limite is not None:
+        filtros = []
+        if precio_min is not None:
+            filtros.append(("Precio >= ?", (precio_min,)))
+        if precio_max is not None:
+            filtros.append(("Precio <= ?", (precio_max,)))
+        if en_stock is not None:
+            filtros.append(("Stock > 0" if en_stock else "Stock <= 0", ()))
+        if prefijo:
+            filtros.append(filtro_prefijo("Nombre", prefijo))
+        return await listar(consulta_productos, filtros, orden, limite, after, mapeo_productos)
+
+    # Catálogo completo: desde la caché
+    cuerpo, etag = await cache_catalogo.obtener()
+    encabezados = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=encabezados)
+    return Response(content=cuerpo, media_type="application/json", headers=encabezados)
+
+@app.get("/productos/buscar", response_model=List[Producto])
+async def buscar_productos(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(LIMITE_POR_DEFECTO, ge=1, le=LIMITE_MAXIMO),
+):
+    """Búsqueda por nombre en el índice en memoria: prefijos de palabras y coincidencias aproximadas."""
+    await indice_productos.asegurar()
+    return RespuestaJSON(mapeo_productos.objetos(indice_productos.buscar(q, limit)))
 
 @app.put("/productos/{producto_id}", response_model=Producto)
-def actualizar_producto(producto_id: int, producto: ProductoCreateUpdate):
+async def actualizar_producto(producto_id: int, producto: ProductoCreateUpdate, usuario_actual: dict = Depends(obtener_usuario_actual)):
     try:
-        query = """
-        UPDATE Productos SET Nombre = ?, Precio = ?, Stock = ?
-        WHERE ProductoID = ?;
-        """
         params = (producto.nombre, producto.precio, producto.stock, producto_id)
-        ejecutar_consulta(query, params)
+        await bd.correr(consultas.actualizar_producto, params)
+        cache_catalogo.invalidar()
         
-        query = "SELECT ProductoID, Nombre, Precio, Stock FROM Productos WHERE ProductoID = ?;"
-        producto_actualizado = ejecutar_consulta(query, (producto_id,))[0]
+        producto_actualizado = await bd.correr(consultas.producto_por_id, (producto_id,))
+        indice_productos.poner(*producto_actualizado)
+        bus_eventos.publicar("productos", "producto_actualizado", producto=mapeo_productos(producto_actualizado))
+        publicar_stock(producto_id, producto_actualizado.Nombre, producto_actualizado.Stock)
         
-        registrar_auditoria("UPDATE", "Productos", producto_id, usuario_actual["nombre_usuario"])
+        await registrar_auditoria("UPDATE", "Productos", producto_id, usuario_actual["nombre_usuario"])
         
-        return Producto(id=producto_actualizado[0], nombre=producto_actualizado[1], precio=producto_actualizado[2], stock=producto_actualizado[3])
+        return Producto(
+            id=producto_actualizado.ProductoID, nombre=producto_actualizado.Nombre,
+            precio=producto_actualizado.Precio, stock=producto_actualizado.Stock,
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/productos/{producto_id}")
-def eliminar_producto(producto_id: int):
+async def eliminar_producto(producto_id: int, usuario_actual: dict = Depends(obtener_usuario_actual)):
     try:
         # Primero, verificar si el producto existe
-        query_verificar_producto = "SELECT ProductoID FROM Productos WHERE ProductoID = ?;"
         params_producto = (producto_id,)
-        producto = ejecutar_consulta(query_verificar_producto, params_producto)
+        producto = await bd.correr(consultas.existe_producto, params_producto)
         
-        if not producto:
+        if producto is None:
             raise HTTPException(status_code=404, detail="Producto no encontrado")
         
         # Eliminar el producto de la tabla Productos
-        query_eliminar_producto = "DELETE FROM Productos WHERE ProductoID = ?;"
-        ejecutar_consulta(query_eliminar_producto, params_producto)
+        await bd.correr(consultas.eliminar_producto, params_producto)
+        cache_catalogo.invalidar()
+        indice_productos.quitar(producto_id)
+        bus_eventos.publicar("productos", "producto_eliminado", producto_id=producto_id)
         
-        registrar_auditoria("DELETE", "Productos", producto_id, usuario_actual["nombre_usuario"])
+        await registrar_auditoria("DELETE", "Productos", producto_id, usuario_actual["nombre_usuario"])
 
         return {"mensaje": "Producto eliminado exitosamente"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+class ProductoRenombrado(Exception):
+    """El ID que dio el índice ya tiene otro nombre en la base."""
+
 @app.post("/comprar-producto")
-def comprar_producto(compra: CompraRequest):
+async def comprar_producto(compra: CompraRequest, usuario_actual: dict = Depends(obtener_usuario_actual)):
+    if compra.cantidad <= 0:
+        raise HTTPException(status_code=400, detail="Cantidad inválida")
     try:
-        # Verificar que el producto existe y obtener su stock y precio
-        query_producto = """
-        SELECT ProductoID, Nombre, Precio, Stock FROM Productos WHERE Nombre = ?;
-        """
-        params_producto = (compra.nombre_producto,)
-        producto = ejecutar_consulta(query_producto, params_producto)
+        cliente_id = usuario_actual.get("cliente_id")
+        if not cliente_id:
+            raise HTTPException(status_code=401, detail="Usuario no autenticado")
         
-        if not producto:
-            raise HTTPException(status_code=404, detail="Producto no encontrado")
+        # Buscar el producto en el índice en memoria; el stock lo valida la reserva en la base
+        await indice_productos.asegurar()
+        producto = indice_productos.por_nombre(compra.nombre_producto)
+        desde_indice = producto is not None
+        if producto is None:
+            # Puede ser un producto recién creado por otro worker
+            producto = await bd.correr(consultas.producto_por_nombre, (compra.nombre_producto,))
+            if producto is None:
+                raise HTTPException(status_code=404, detail="Producto no encontrado")
+            indice_productos.poner(*producto)
         
-        producto_id, nombre_producto, precio, stock_disponible = producto[0]
+        # Registrar el pedido y la venta en la misma transacción que descuenta el stock. El
+        # nombre y el precio se leen de la fila ya bloqueada por la reserva, no del índice (que
+        # puede estar atrasado): son los mismos con los que registrar_pedido escribe la venta
+        def registrar_en(producto_id, verificar_nombre):
+            def registrar(cursor):
+                fila = consultas.stock_producto.en(cursor, (producto_id,))
+                if verificar_nombre and fila.Nombre != compra.nombre_producto:
+                    # Otro worker renombró el producto (y quizá otro tomó su nombre): el ID del índice no es el pedido
+                    raise ProductoRenombrado(producto_id)
+                pedido_id = registrar_pedido(cursor, dialecto, cliente_id, producto_id, compra.cantidad, descontar_stock=False)
+                total_compra = fila.Precio * compra.cantidad
+                acumulados.registrar_ventas(cursor, dialecto, [(fila.Nombre, compra.cantidad, total_compra)])
+                return pedido_id, fila.Nombre, fila.Stock, total_compra
+            return registrar
         
-        # Verificar que hay suficiente stock para la compra
-        if stock_disponible < compra.cantidad:
+        producto_id = producto[0]
+        try:
+            try:
+                pedido_id, nombre_producto, stock_restante, total_compra = await reservador_stock.reservar(
+                    producto_id, compra.cantidad, registrar_en(producto_id, desde_indice)
+                )
+            except (ProductoRenombrado, ProductoNoEncontrado):
+                if not desde_indice:
+                    raise
+                # El índice de este worker está atrasado: se descarta la entrada y se busca el nombre en la base
+                indice_productos.quitar(producto_id)
+                producto = await bd.correr(consultas.producto_por_nombre, (compra.nombre_producto,))
+                if producto is None:
+                    raise HTTPException(status_code=404, detail="Producto no encontrado")
+                indice_productos.poner(*producto)
+                producto_id = producto[0]
+                pedido_id, nombre_producto, stock_restante, total_compra = await reservador_stock.reservar(
+                    producto_id, compra.cantidad, registrar_en(producto_id, False)
+                )
+        except StockInsuficiente:
             raise HTTPException(status_code=400, detail="Stock insuficiente")
-        
-        # Calcular el total de la compra
-        total_compra = precio * compra.cantidad
-        
-        # Llamar al procedimiento almacenado para registrar el pedido y la venta
-        query_registrar_pedido = """
-        EXEC RegistrarPedido @ClienteID = ?, @ProductoID = ?, @Cantidad = ?;
-        """
-        cliente_id = usuario_actual.get("cliente_id")
-        if not cliente_id:
-            raise HTTPException(status_code=401, detail="Usuario no autenticado")
-        params_registrar_pedido = (cliente_id, producto_id, compra.cantidad)
-        ejecutar_consulta(query_registrar_pedido, params_registrar_pedido)
+        except ProductoNoEncontrado:
+            indice_productos.quitar(producto_id)
+            raise HTTPException(status_code=404, detail="Producto no encontrado")
+        cache_catalogo.invalidar()
+        publicar_stock(producto_id, nombre_producto, stock_restante)
+        bus_eventos.publicar(
+            "pedidos", "pedido_creado",
+            pedido_id=pedido_id, cliente_id=cliente_id, producto_id=producto_id,
+            nombre_producto=nombre_producto, cantidad=compra.cantidad, total=float(total_compra),
+        )
         
         return {"mensaje": "Compra realizada exitosamente"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+class CarritoRechazado(Exception):
+    def __init__(self, lineas):
+        super().__init__("Carrito rechazado")
+        self.lineas = lineas
+
+@app.post("/checkout")
+async def checkout(carrito: CheckoutRequest, usuario_actual: dict = Depends(obtener_usuario_actual)):
+    cliente_id = usuario_actual.get("cliente_id")
+    if not cliente_id:
+        raise HTTPException(status_code=401, detail="Usuario no autenticado")
+    if not carrito.productos:
+        raise HTTPException(status_code=400, detail="El carrito está vacío")
+    if any(linea.cantidad <= 0 for linea in carrito.productos):
+        raise HTTPException(status_code=400, detail="Cantidad inválida")
+
+    nombres = list(dict.fromkeys(linea.nombre_producto for linea in carrito.productos))
+
+    # Todo el carrito en una transacción: una consulta para bloquear y leer los productos,
+    # un solo lote con un EXEC RegistrarPedido por línea (o su equivalente portable) y el commit
+    def registrar_carrito(cursor):
+        dialecto.iniciar_escritura(cursor)
+        marcadores = ", ".join("?" for _ in nombres)
+        query_productos = f"""
+        SELECT ProductoID, Nombre, Precio, Stock FROM {dialecto.bloquear("Productos")}
+        WHERE Nombre IN ({marcadores}){dialecto.para_actualizar()};
+        """
+        cursor.execute(query_productos, nombres)
+        productos = {fila[1]: fila for fila in cursor.fetchall()}
+
+        # Stock restante por producto, descontando líneas repetidas del mismo producto
+        restante = {nombre: fila[3] for nombre, fila in productos.items()}
+        lineas = []
+        for linea in carrito.productos:
+            producto = productos.get(linea.nombre_producto)
+            resultado = {"nombre_producto": linea.nombre_producto, "cantidad": linea.cantidad}
+            if producto is None:
+                resultado["estado"] = "Producto no encontrado"
+            elif restante[linea.nombre_producto] < linea.cantidad:
+                resultado["estado"] = "Stock insuficiente"
+            else:
+                restante[linea.nombre_producto] -= linea.cantidad
+                resultado["estado"] = "ok"
+                resultado["precio_total"] = float(producto[2]) * linea.cantidad
+            lineas.append(resultado)
+
+        if any(resultado["estado"] != "ok" for resultado in lineas):
+            raise CarritoRechazado(lineas)
+
+        if dialecto.procedimientos:
+            query_registrar = "SET NOCOUNT ON;\n" + "".join(
+                "EXEC RegistrarPedido @ClienteID = ?, @ProductoID = ?, @Cantidad = ?;\n" for _ in lineas
+            )
+            params_registrar = []
+            for linea in carrito.productos:
+                params_registrar.extend((cliente_id, productos[linea.nombre_producto][0], linea.cantidad))
+            cursor.execute(query_registrar, params_registrar)
+            # Recorrer todos los resultados del lote para que un error en cualquier EXEC se propague
+            while cursor.nextset():
+                pass
+        else:
+            for linea in carrito.productos:
+                registrar_pedido(cursor, dialecto, cliente_id, productos[linea.nombre_producto][0], linea.cantidad)
+        acumulados.registrar_ventas(
+            cursor, dialecto, [(linea["nombre_producto"], linea["cantidad"], linea["precio_total"]) for linea in lineas]
+        )
+        # Las filas siguen bloqueadas: el stock restante calculado es el que quedó en la base
+        return lineas, {productos[nombre][0]: (nombre, stock) for nombre, stock in restante.items()}
+
+    try:
+        lineas, stock_restante = await bd.transaccion(registrar_carrito)
+    except CarritoRechazado as e:
+        return JSONResponse(status_code=409, content={"mensaje": "No se pudo completar la compra", "lineas": e.lineas})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    cache_catalogo.invalidar()
+    total = sum(linea["precio_total"] for linea in lineas)
+    for producto_id, (nombre, stock) in stock_restante.items():
+        publicar_stock(producto_id, nombre, stock)
+    bus_eventos.publicar("pedidos", "checkout", cliente_id=cliente_id, lineas=lineas, total=total)
+    return {
+        "mensaje": "Compra realizada exitosamente",
+        "lineas": lineas,
+        "total": total,
+    }
+
 @app.delete("/pedido/{pedido_id}", response_model=dict)
-def cancelar_pedido(pedido_id: int):
+async def cancelar_pedido(pedido_id: int, usuario_actual: dict = Depends(obtener_usuario_actual)):
     logging.info(f"Intentando cancelar el pedido: {pedido_id}")
 
     if usuario_actual["tipo_usuario"] != "cliente":
@@ -442,123 +1094,131 @@ def cancelar_pedido(pedido_id: int):
     
     try:
         # Verificar que el pedido pertenece al cliente actual
-        query_verificar = """
-        SELECT PedidoID, ClienteID, ProductoID, Cantidad FROM Pedidos WHERE PedidoID = ?;
-        """
         params_verificar = (pedido_id,)
-        logging.debug(f"Ejecutando consulta de verificación: {query_verificar} con params: {params_verificar}")
-        resultado = ejecutar_consulta(query_verificar, params_verificar)
+        logging.debug(f"Ejecutando consulta de verificación: {consultas.pedido_por_id.nombre} con params: {params_verificar}")
+        pedido = await bd.correr(consultas.pedido_por_id, params_verificar)
         
-        if not resultado or resultado[0][1] != usuario_actual["cliente_id"]:
+        if pedido is None or pedido.ClienteID != usuario_actual["cliente_id"]:
             logging.error(f"Pedido no encontrado o no autorizado para el pedido: {pedido_id}")
             raise HTTPException(status_code=403, detail="Pedido no encontrado o no autorizado")
         
         # Obtener los detalles del pedido
-        pedido_id, cliente_id, producto_id, cantidad = resultado[0]
+        pedido_id, cliente_id, producto_id, cantidad = pedido
         logging.debug(f"Detalles del pedido obtenidos: PedidoID={pedido_id}, ClienteID={cliente_id}, ProductoID={producto_id}, Cantidad={cantidad}")
         
-        # Comenzar una transacción
-        with pyodbc.connect(get_connect_string()) as conn:
-            cursor = conn.cursor()
+        # Pasos de la cancelación; se ejecutan en una sola transacción
+        def cancelar(cursor):
+            logging.info(f"Insertando en PedidosCancelados: PedidoID={pedido_id}, ClienteID={cliente_id}, ProductoID={producto_id}, Cantidad={cantidad}")
+            # Insertar en PedidosCancelados
+            consultas.insertar_pedido_cancelado.en(cursor, (pedido_id, cliente_id, producto_id, cantidad))
             
-            try:
-                logging.info(f"Insertando en PedidosCancelados: PedidoID={pedido_id}, ClienteID={cliente_id}, ProductoID={producto_id}, Cantidad={cantidad}")
-                # Insertar en PedidosCancelados
-                query_insertar_cancelado = """
-                INSERT INTO PedidosCancelados (PedidoID, ClienteID, ProductoID, Cantidad, FechaCancelacion)
-                VALUES (?, ?, ?, ?, GETDATE());
-                """
-                cursor.execute(query_insertar_cancelado, (pedido_id, cliente_id, producto_id, cantidad))
-                
-                logging.info(f"Eliminando ventas relacionadas para el pedido: PedidoID={pedido_id}")
-                # Eliminar ventas relacionadas con el pedido
-                query_eliminar_ventas = """
-                DELETE FROM Ventas WHERE PedidoID = ?;
-                """
-                cursor.execute(query_eliminar_ventas, (pedido_id,))
-                
-                logging.info(f"Actualizando el stock para el producto: ProductoID={producto_id}, Cantidad={cantidad}")
-                # Actualizar el stock
-                query_actualizar_stock = """
-                UPDATE Productos
-                SET Stock = Stock + ?
-                WHERE ProductoID = ?;
-                """
-                cursor.execute(query_actualizar_stock, (cantidad, producto_id))
-                
-                logging.info(f"Eliminando de la tabla Pedidos: PedidoID={pedido_id}")
-                # Eliminar el pedido de la tabla Pedidos
-                query_eliminar_pedido = """
-                DELETE FROM Pedidos WHERE PedidoID = ?;
-                """
-                cursor.execute(query_eliminar_pedido, (pedido_id,))
-                
-                # Confirmar la transacción
-                conn.commit()
-                logging.info("Transacción confirmada")
-                
-                return {"mensaje": "Pedido cancelado exitosamente"}
-            except Exception as e:
-                logging.error(f"Error en la transacción, revirtiendo cambios para el pedido: {pedido_id}, error: {e}")
-                # Revertir la transacción en caso de error
-                conn.rollback()
-                raise HTTPException(status_code=500, detail=str(e))
+            # Descontar de los acumulados las ventas que se van a eliminar
+            ventas = [
+                (venta.NombreProducto, venta.Cantidad, venta.TotalCompra, venta.FechaVenta.date())
+                for venta in consultas.ventas_de_pedido.en(cursor, (pedido_id,))
+            ]
+            if ventas:
+                acumulados.revertir_ventas(cursor, dialecto, ventas)
+            
+            logging.info(f"Eliminando ventas relacionadas para el pedido: PedidoID={pedido_id}")
+            # Eliminar ventas relacionadas con el pedido
+            consultas.eliminar_ventas_de_pedido.en(cursor, (pedido_id,))
+            
+            logging.info(f"Actualizando el stock para el producto: ProductoID={producto_id}, Cantidad={cantidad}")
+            # Actualizar el stock
+            consultas.devolver_stock.en(cursor, (cantidad, producto_id))
+            
+            logging.info(f"Eliminando de la tabla Pedidos: PedidoID={pedido_id}")
+            # Eliminar el pedido de la tabla Pedidos
+            consultas.eliminar_pedido.en(cursor, (pedido_id,))
+            
+            # Stock resultante, para el índice y el flujo de eventos (None si el producto ya no existe)
+            return consultas.stock_producto.en(cursor, (producto_id,))
+        
+        try:
+            producto = await bd.transaccion(cancelar)
+            cache_catalogo.invalidar()
+            if producto is not None:
+                publicar_stock(producto_id, producto.Nombre, producto.Stock)
+            bus_eventos.publicar(
+                "pedidos", "pedido_cancelado",
+                pedido_id=pedido_id, cliente_id=cliente_id, producto_id=producto_id, cantidad=cantidad,
+            )
+            logging.info("Transacción confirmada")
+            return {"mensaje": "Pedido cancelado exitosamente"}
+        except Exception as e:
+            # bd.transaccion ya revirtió los cambios
+            logging.error(f"Error en la transacción, revirtiendo cambios para el pedido: {pedido_id}, error: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         logging.error(f"Error al procesar la cancelación del pedido: {pedido_id}, error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/mis-pedidos", response_model=List[dict])
-def obtener_mis_pedidos():
+async def obtener_mis_pedidos(usuario_actual: dict = Depends(obtener_usuario_actual)):
     try:
         cliente_id = usuario_actual["cliente_id"]
 
-        # Consulta para obtener los detalles de los pedidos del cliente
-        query_pedidos = """
-        SELECT p.PedidoID, p.Cantidad, p.FechaCompra, pr.Nombre, pr.Precio * p.Cantidad AS PrecioTotal
-        FROM Pedidos p
-        JOIN Productos pr ON p.ProductoID = pr.ProductoID
-        WHERE p.ClienteID = ?;
-        """
-        params_pedidos = (cliente_id,)
-        pedidos = ejecutar_consulta(query_pedidos, params_pedidos)
+        # Detalles de los pedidos del cliente
+        pedidos = await bd.correr(consultas.pedidos_de_cliente, (cliente_id,))
         
-        lista_pedidos = [
-            {
-                "pedido_id": pedido[0],
-                "nombre_producto": pedido[3],
-                "precio_total": float(pedido[4]),
-                "cantidad": pedido[1],
-                "fecha_pedido": pedido[2].strftime('%Y-%m-%d %H:%M:%S')
-            }
-            for pedido in pedidos
-        ]
-        return lista_pedidos
+        return Response(content=mapeo_mis_pedidos.json(pedidos), media_type="application/json")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/pedidos", response_model=List[dict])
-def obtener_todos_los_pedidos():
+# Columnas de consultas.pedidos_de_cliente
+mapeo_mis_pedidos = MapeoFilas([
+    ("pedido_id", 0),
+    ("nombre_producto", 3),
+    ("precio_total", a_float(4)),
+    ("cantidad", 1),
+    ("fecha_pedido", fecha_hora_texto(2)),
+])
+
+mapeo_pedidos = MapeoFilas([
+    ("pedido_id", 0),
+    ("cliente_nombre", 1),
+    ("producto_nombre", 2),
+    ("cantidad", 3),
+    ("fecha_compra", fecha_hora_texto(4)),
+])
+
+# Detalles de todos los pedidos
+consulta_pedidos = ConsultaPaginada(
+    ["p.PedidoID", "c.Nombre", "pr.Nombre", "p.Cantidad", "p.FechaCompra"],
+    "Pedidos p JOIN Clientes c ON p.ClienteID = c.ClienteID JOIN Productos pr ON p.ProductoID = pr.ProductoID",
+    "p.PedidoID",
+    {"id": "p.PedidoID", "fecha": "p.FechaCompra"},
+    dialecto,
+    columnas_fecha=["p.FechaCompra"],
+)
+
+@app.get("/pedidos", response_model=Union[List[dict], dict])
+async def obtener_todos_los_pedidos(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=LIMITE_MAXIMO),
+    after: Optional[str] = None,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    cliente_id: Optional[int] = None,
+    orden: str = "id",
+    formato: Optional[str] = Query(None, alias="format", pattern="^(ndjson|csv)$"),
+):
+    filtros = filtros_fecha("p.FechaCompra", desde, hasta)
+    if cliente_id is not None:
+        filtros.append(("p.ClienteID = ?", (cliente_id,)))
+    if formato:
+        return await exportar(
+            consulta_pedidos, filtros, orden, after, formato, mapeo_pedidos, "pedidos",
+            origen=lecturas.vista(DESFASE_REPORTES["pedidos"]),
+        )
     try:
-        # Consulta para obtener los detalles de todos los pedidos
-        query_pedidos = """
-        SELECT p.PedidoID, c.Nombre AS ClienteNombre, pr.Nombre AS ProductoNombre, p.Cantidad, p.FechaCompra
-        FROM Pedidos p
-        JOIN Clientes c ON p.ClienteID = c.ClienteID
-        JOIN Productos pr ON p.ProductoID = pr.ProductoID;
-        """
-        pedidos = ejecutar_consulta(query_pedidos)
-        
-        lista_pedidos = [
-            {
-                "pedido_id": pedido[0],
-                "cliente_nombre": pedido[1],
-                "producto_nombre": pedido[2],
-                "cantidad": pedido[3],
-                "fecha_compra": pedido[4].strftime('%Y-%m-%d %H:%M:%S')
-            }
-            for pedido in pedidos
-        ]
-        return lista_pedidos
+        return await listar(
+            consulta_pedidos, filtros, orden, limite_pagina(request, limit), after, mapeo_pedidos,
+            origen=lecturas.vista(DESFASE_REPORTES["pedidos"]),
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -567,113 +1227,338 @@ import logging
 logging.basicConfig(level=logging.INFO)
 
 @app.delete("/productos/{producto_id}")
-def eliminar_producto(producto_id: int):
+async def eliminar_producto(producto_id: int, usuario_actual: dict = Depends(obtener_usuario_actual)):
     try:
+        params_producto = (producto_id,)
         # Actualizar registros en Pedidos para establecer ProductoID a NULL
-        query_actualizar_pedidos = "UPDATE Pedidos SET ProductoID = NULL WHERE ProductoID = ?"
-        params_pedidos = (producto_id,)
-        ejecutar_consulta(query_actualizar_pedidos, params_pedidos)
+        await bd.correr(consultas.desvincular_pedidos, params_producto)
         
         # Actualizar registros en PedidosCancelados para establecer ProductoID a NULL
-        query_actualizar_pedidos_cancelados = "UPDATE PedidosCancelados SET ProductoID = NULL WHERE ProductoID = ?"
-        params_pedidos_cancelados = (producto_id,)
-        ejecutar_consulta(query_actualizar_pedidos_cancelados, params_pedidos_cancelados)
+        await bd.correr(consultas.desvincular_pedidos_cancelados, params_producto)
         
         # Finalmente, eliminar el producto
-        query_eliminar_producto = "DELETE FROM Productos WHERE ProductoID = ?;"
-        params_producto = (producto_id,)
-        ejecutar_consulta(query_eliminar_producto, params_producto)
+        await bd.correr(consultas.eliminar_producto, params_producto)
+        cache_catalogo.invalidar()
+        indice_productos.quitar(producto_id)
+        bus_eventos.publicar("productos", "producto_eliminado", producto_id=producto_id)
         
-        registrar_auditoria("DELETE", "Productos", producto_id, usuario_actual["nombre_usuario"])
+        await registrar_auditoria("DELETE", "Productos", producto_id, usuario_actual["nombre_usuario"])
         
         return {"mensaje": "Producto eliminado exitosamente"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/ganancia-total", response_model=dict)
-def obtener_ganancia_total():
+async def obtener_ganancia_total(usuario_actual: dict = Depends(obtener_usuario_actual)):
     if usuario_actual["tipo_usuario"] != "administrador":
         raise HTTPException(status_code=403, detail="Acceso denegado")
 
     try:
-        query = """
-        SELECT SUM(TotalCompra) AS GananciaTotal
-        FROM Ventas;
-        """
-        resultado = ejecutar_consulta(query)
-        ganancia_total = resultado[0][0] if resultado and resultado[0][0] else 0
+        # Suma de los acumulados por producto, no de toda la tabla Ventas
+        resultado = await lecturas.vista(DESFASE_REPORTES["acumulados"]).correr(consultas.ganancia_total)
+        ganancia_total = resultado.GananciaTotal if resultado and resultado.GananciaTotal else 0
         return {"GananciaTotal": ganancia_total}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/productos-mas-solicitados", response_model=List[dict])
-def obtener_productos_mas_solicitados():
+async def obtener_productos_mas_solicitados():
     try:
-        query = """
-        SELECT NombreProducto, SUM(Cantidad) AS TotalVendido
-        FROM Ventas
-        GROUP BY NombreProducto
-        ORDER BY TotalVendido DESC;
-        """
-        productos = ejecutar_consulta(query)
+        productos = await lecturas.vista(DESFASE_REPORTES["acumulados"]).correr(consultas.mas_solicitados)
         lista_productos = [
             {
-                "NombreProducto": producto[0],
-                "TotalVendido": producto[1]
+                "NombreProducto": producto.NombreProducto,
+                "TotalVendido": producto.TotalVendido
             }
             for producto in productos
         ]
-        return lista_productos
+        return RespuestaJSON(lista_productos)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/verificar-stock", response_model=List[dict])
-def verificar_stock_productos():
+@app.get("/ventas-por-dia", response_model=List[dict])
+async def obtener_ventas_por_dia(desde: Optional[date] = None, hasta: Optional[date] = None, usuario_actual: dict = Depends(obtener_usuario_actual)):
+    if usuario_actual["tipo_usuario"] != "administrador":
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    hasta = hasta or date.today()
+    desde = desde or hasta - timedelta(days=30)
     try:
-        query = """
-        SELECT ProductoID, Nombre, Stock
-        FROM Productos;
-        """
-        productos = ejecutar_consulta(query)
-        lista_productos = [
-            {
-                "ProductoID": producto[0],
-                "Nombre": producto[1],
-                "Stock": producto[2],
-                "Mensaje": "Favor de actualizar inventario" if producto[2] < 10 else ""
-            }
-            for producto in productos
-        ]
-        return lista_productos
+        dias = await lecturas.vista(DESFASE_REPORTES["acumulados"]).correr(consultas.ventas_por_dia, (desde, hasta))
+        return RespuestaJSON([{"Fecha": str(dia.Fecha), "Cantidad": dia.Cantidad, "Total": float(dia.Total)} for dia in dias])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/ventas", response_model=List[Venta])
-def obtener_ventas():
+@app.post("/acumulados/reconstruir", response_model=dict)
+async def reconstruir_acumulados(usuario_actual: dict = Depends(obtener_usuario_actual)):
+    if usuario_actual["tipo_usuario"] != "administrador":
+        raise HTTPException(status_code=403, detail="Acceso denegado")
     try:
-        query = """
-        SELECT VentaID, PedidoID, ClienteID, NombreUsuario, NombreProducto, Cantidad, TotalCompra, FechaVenta
-        FROM Ventas;
-        """
-        ventas = ejecutar_consulta(query)
-        
-        lista_ventas = [
-            Venta(
-                venta_id=venta[0],
-                pedido_id=venta[1],
-                cliente_id=venta[2],
-                nombre_usuario=venta[3],
-                nombre_producto=venta[4],
-                cantidad=venta[5],
-                total_compra=venta[6],
-                fecha_venta=venta[7].strftime('%Y-%m-%d %H:%M:%S')
-            )
-            for venta in ventas
-        ]
-        return lista_ventas
+        await bd.transaccion(lambda cursor: acumulados.reconstruir(cursor, dialecto))
+        return {"mensaje": "Acumulados reconstruidos"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+STOCK_MINIMO = 10
+
+def mensajes_stock(columnas):
+    return ["Favor de actualizar inventario" if stock < STOCK_MINIMO else "" for stock in columnas[2]]
+
+mapeo_stock = MapeoFilas([
+    ("ProductoID", 0),
+    ("Nombre", 1),
+    ("Stock", 2),
+    ("Mensaje", mensajes_stock),
+])
+
+consulta_stock = ConsultaPaginada(
+    ["ProductoID", "Nombre", "Stock"],
+    "Productos",
+    "ProductoID",
+    {"id": "ProductoID", "nombre": "Nombre", "stock": "Stock"},
+    dialecto,
+)
+
+@app.get("/verificar-stock", response_model=Union[List[dict], dict])
+async def verificar_stock_productos(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=LIMITE_MAXIMO),
+    after: Optional[str] = None,
+    bajo_stock: Optional[bool] = None,
+    prefijo: Optional[str] = None,
+    orden: str = "id",
+):
+    filtros = []
+    if bajo_stock is not None:
+        filtros.append(("Stock < ?" if bajo_stock else "Stock >= ?", (STOCK_MINIMO,)))
+    if prefijo:
+        filtros.append(filtro_prefijo("Nombre", prefijo))
+    try:
+        return await listar(consulta_stock, filtros, orden, limite_pagina(request, limit), after, mapeo_stock)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Mismos campos que Venta; sus claves son también las columnas de las exportaciones
+mapeo_ventas = MapeoFilas([
+    ("venta_id", 0),
+    ("pedido_id", 1),
+    ("cliente_id", 2),
+    ("nombre_usuario", 3),
+    ("nombre_producto", 4),
+    ("cantidad", 5),
+    ("total_compra", a_float(6)),
+    ("fecha_venta", fecha_hora_texto(7)),
+])
+
+consulta_ventas = ConsultaPaginada(
+    ["VentaID", "PedidoID", "ClienteID", "NombreUsuario", "NombreProducto", "Cantidad", "TotalCompra", "FechaVenta"],
+    "Ventas",
+    "VentaID",
+    {"id": "VentaID", "fecha": "FechaVenta", "total": "TotalCompra"},
+    dialecto,
+    columnas_fecha=["FechaVenta"],
+)
+
+class PaginaVentas(BaseModel):
+    resultados: List[Venta]
+    siguiente: Optional[str]
+    limite: int
+
+@app.get("/ventas", response_model=Union[List[Venta], PaginaVentas])
+async def obtener_ventas(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=LIMITE_MAXIMO),
+    after: Optional[str] = None,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    producto: Optional[str] = None,
+    cliente_id: Optional[int] = None,
+    orden: str = "id",
+    formato: Optional[str] = Query(None, alias="format", pattern="^(ndjson|csv)$"),
+):
+    filtros = filtros_fecha("FechaVenta", desde, hasta)
+    if producto:
+        filtros.append(("NombreProducto = ?", (producto,)))
+    if cliente_id is not None:
+        filtros.append(("ClienteID = ?", (cliente_id,)))
+    if formato:
+        return await exportar(
+            consulta_ventas, filtros, orden, after, formato, mapeo_ventas, "ventas",
+            origen=lecturas.vista(DESFASE_REPORTES["ventas"]),
+        )
+    try:
+        return await listar(
+            consulta_ventas, filtros, orden, limite_pagina(request, limit), after, mapeo_ventas,
+            origen=lecturas.vista(DESFASE_REPORTES["ventas"]),
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/estadisticas-pool", response_model=dict)
+async def obtener_estadisticas_pool(usuario_actual: dict = Depends(obtener_usuario_actual)):
+    if usuario_actual["tipo_usuario"] != "administrador":
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    return pool.estadisticas()
+
+TEMAS_EVENTOS = ("stock", "productos", "pedidos")
+
+def validar_temas(temas, usuario):
+    """Temas pedidos (lista o texto separado por comas) y el filtro que les toca al usuario.
+
+    `pedidos` es sólo para sesiones iniciadas: los administradores ven todos los
+    pedidos y los clientes sólo los suyos.
+    """
+    if isinstance(temas, str):
+        temas = temas.split(",")
+    if not isinstance(temas, list) or not all(isinstance(tema, str) for tema in temas):
+        raise HTTPException(status_code=400, detail="Temas inválidos")
+    temas = {tema.strip() for tema in temas if tema.strip()}
+    if not temas or not temas <= set(TEMAS_EVENTOS):
+        raise HTTPException(status_code=400, detail=f"Temas válidos: {', '.join(TEMAS_EVENTOS)}")
+    filtro = None
+    if "pedidos" in temas:
+        if usuario["tipo_usuario"] == "cliente":
+            cliente_id = usuario["cliente_id"]
+            filtro = lambda evento: evento.tema != "pedidos" or evento.datos.get("cliente_id") == cliente_id
+        elif usuario["tipo_usuario"] != "administrador":
+            raise HTTPException(status_code=403, detail="Acceso denegado")
+    return temas, filtro
+
+def id_evento(valor):
+    try:
+        return int(valor) if valor is not None else None
+    except ValueError:
+        return None
+
+@app.get("/eventos")
+async def eventos_sse(request: Request, temas: str = "stock,productos", usuario_actual: dict = Depends(obtener_usuario_actual)):
+    """Flujo Server-Sent Events; al reconectar, el navegador manda Last-Event-ID y recibe lo que se perdió."""
+    temas, filtro = validar_temas(temas, usuario_actual)
+    suscripcion = bus_eventos.suscribir(temas, filtro, desde=id_evento(request.headers.get("last-event-id")))
+
+    async def emitir():
+        fin = time.monotonic() + duracion_eventos
+        try:
+            yield b"retry: 3000\n\n"
+            while time.monotonic() < fin:
+                evento = await suscripcion.siguiente(min(latido_eventos, max(0.0, fin - time.monotonic())))
+                if evento is not None:
+                    yield evento.sse()
+                elif suscripcion.cerrada:
+                    break
+                else:
+                    # Comentario SSE: mantiene viva la conexión a través de proxies
+                    yield b": latido\n\n"
+        finally:
+            bus_eventos.cancelar(suscripcion)
+
+    return StreamingResponse(
+        emitir(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.websocket("/ws/eventos")
+async def eventos_websocket(websocket: WebSocket, temas: str = "stock,productos", desde: Optional[int] = None):
+    """Los mismos eventos por WebSocket; el cliente cambia sus temas mandando `{"temas": [...]}`
+    y, al reconectarse, pide con `desde` los eventos posteriores al último que recibió."""
+    usuario = await obtener_usuario_actual(websocket)
+    try:
+        temas, filtro = validar_temas(temas, usuario)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+    await websocket.accept()
+    suscripcion = bus_eventos.suscribir(temas, filtro, desde)
+
+    async def recibir():
+        try:
+            while True:
+                texto = await websocket.receive_text()
+                try:
+                    mensaje = json.loads(texto)
+                    suscripcion.temas, suscripcion.filtro = validar_temas(mensaje.get("temas"), usuario)
+                except (ValueError, AttributeError, HTTPException) as e:
+                    detalle = e.detail if isinstance(e, HTTPException) else "Mensaje inválido"
+                    suscripcion.entregar(Evento(0, "sistema", {"tipo": "error", "detalle": detalle}))
+        except (WebSocketDisconnect, KeyError):
+            # KeyError: el cliente mandó un marco binario; se cierra la conexión
+            pass
+        finally:
+            suscripcion.cerrar()
+
+    receptor = asyncio.create_task(recibir())
+    fin = time.monotonic() + duracion_eventos
+    try:
+        while time.monotonic() < fin:
+            evento = await suscripcion.siguiente(min(latido_eventos, max(0.0, fin - time.monotonic())))
+            if evento is not None:
+                await websocket.send_text(evento.json().decode())
+            elif suscripcion.cerrada:
+                break
+            else:
+                await websocket.send_text('{"tema":"sistema","tipo":"latido"}')
+    except (WebSocketDisconnect, RuntimeError):
+        # El cliente se fue mientras se le enviaba
+        pass
+    finally:
+        receptor.cancel()
+        bus_eventos.cancelar(suscripcion)
+        if websocket.client_state == WebSocketState.CONNECTED and websocket.application_state == WebSocketState.CONNECTED:
+            await websocket.close()
+
+# Valores del momento que se leen en cada scrape de /metrics
+metricas.registrar_colector("bd_pool_en_uso", "Conexiones prestadas", lambda: pool.estadisticas()["en_uso"])
+metricas.registrar_colector("bd_pool_inactivas", "Conexiones libres en el pool", lambda: pool.estadisticas()["inactivas"])
+metricas.registrar_colector("bd_pool_timeouts_total", "Esperas de conexión agotadas", lambda: pool.estadisticas()["timeouts"], tipo="counter")
+metricas.registrar_colector("catalogo_cache_aciertos_total", "Aciertos de la caché del catálogo", lambda: cache_catalogo.aciertos, tipo="counter")
+metricas.registrar_colector("catalogo_cache_fallos_total", "Fallos de la caché del catálogo", lambda: cache_catalogo.fallos, tipo="counter")
+metricas.registrar_colector("indice_productos_entradas", "Productos en el índice en memoria", lambda: len(indice_productos))
+metricas.registrar_colector("indice_productos_recargas_total", "Recargas completas del índice de productos", lambda: indice_productos.recargas, tipo="counter")
+metricas.registrar_colector("indice_productos_busquedas_total", "Búsquedas atendidas por el índice de productos", lambda: indice_productos.busquedas, tipo="counter")
+metricas.registrar_colector("eventos_suscripciones", "Conexiones abiertas al flujo de eventos", lambda: bus_eventos.estadisticas()["suscripciones"])
+metricas.registrar_colector("eventos_publicados_total", "Eventos publicados en el flujo de cambios", lambda: bus_eventos.estadisticas()["publicados"], tipo="counter")
+metricas.registrar_colector("eventos_descartados_total", "Eventos descartados por clientes atrasados", lambda: bus_eventos.estadisticas()["descartados"], tipo="counter")
+metricas.registrar_colector("bd_reportes_pool_en_uso", "Conexiones de reportes prestadas en la primaria", lambda: pool_reportes.estadisticas()["en_uso"])
+metricas.registrar_colector("replica_retraso_segundos", "Retraso medido de la réplica de lectura (NaN si no se pudo medir)", lambda: lecturas.retraso if lecturas.retraso is not None else float("nan"))
+metricas.registrar_colector("lecturas_replica_total", "Lecturas de reportes atendidas por la réplica", lambda: lecturas.estadisticas()["replica"], tipo="counter")
+metricas.registrar_colector("lecturas_primaria_total", "Lecturas de reportes atendidas por la primaria", lambda: lecturas.estadisticas()["primaria"], tipo="counter")
+metricas.registrar_colector("lecturas_respaldo_total", "Lecturas que fallaron en la réplica y se repitieron en la primaria", lambda: lecturas.estadisticas()["respaldos"], tipo="counter")
+metricas.registrar_colector("hash_pendientes", "Operaciones de bcrypt en curso o en cola", lambda: servicio_hash.estadisticas()["pendientes"])
+metricas.registrar_colector("hash_rechazadas_total", "Operaciones de bcrypt rechazadas por saturación", lambda: servicio_hash.estadisticas()["rechazadas"], tipo="counter")
+metricas.registrar_colector("login_cache_aciertos_total", "Logins verificados desde la caché", lambda: servicio_hash.estadisticas()["aciertos_cache"], tipo="counter")
+metricas.registrar_colector("escrituras_pendientes", "Escrituras diferidas aún no escritas en la base", cola_escrituras.profundidad)
+metricas.registrar_colector("escrituras_escritas_total", "Escrituras diferidas escritas en la base", lambda: cola_escrituras.estadisticas()["escritos"], tipo="counter")
+metricas.registrar_colector("escrituras_vaciados_total", "Lotes de escrituras diferidas escritos", lambda: cola_escrituras.estadisticas()["vaciados"], tipo="counter")
+metricas.registrar_colector("escrituras_vaciado_segundos_total", "Tiempo total escribiendo lotes diferidos", lambda: cola_escrituras.estadisticas()["segundos_vaciado"], tipo="counter")
+metricas.registrar_colector("escrituras_ultimo_vaciado_segundos", "Duración del último lote diferido", lambda: cola_escrituras.estadisticas()["ultimo_vaciado"])
+metricas.registrar_colector("escrituras_fallos_total", "Lotes diferidos que fallaron y se reintentarán", lambda: cola_escrituras.estadisticas()["fallos"], tipo="counter")
+metricas.registrar_colector("escrituras_apartadas_total", "Escrituras diferidas apartadas a un archivo .muerto", lambda: cola_escrituras.estadisticas()["apartados"], tipo="counter")
+metricas.registrar_colector("inventario_interbloqueos_total", "Interbloqueos al reservar stock", lambda: reservador_stock.estadisticas()["interbloqueos"], tipo="counter")
+
+# Formato de texto de Prometheus. Sólo para el scraper (`Authorization: Bearer <METRICAS_TOKEN>`)
+# o para una sesión de administrador; sin METRICAS_TOKEN sólo queda la sesión
+@app.get("/metrics", response_class=PlainTextResponse)
+async def exponer_metricas(request: Request):
+    token = os.getenv('METRICAS_TOKEN')
+    autorizado = bool(token) and secrets.compare_digest(request.headers.get("authorization", ""), f"Bearer {token}")
+    if not autorizado:
+        usuario_actual = await obtener_usuario_actual(request)
+        if not usuario_actual["nombre_usuario"]:
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        if usuario_actual["tipo_usuario"] != "administrador":
+            raise HTTPException(status_code=403, detail="Acceso denegado")
+    return PlainTextResponse(metricas.exponer(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/estadisticas-inventario", response_model=dict)
+async def obtener_estadisticas_inventario(usuario_actual: dict = Depends(obtener_usuario_actual)):
+    if usuario_actual["tipo_usuario"] != "administrador":
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    return reservador_stock.estadisticas()
+
 class DatosPanel(BaseModel):
     productos: int
     stock: int
@@ -686,55 +1571,22 @@ class DatosGraficas(BaseModel):
     pastel: List[int]
     categoriasPastel: List[str]
 
-meses_espanol = {
-    1: "Enero", 2: "Febrero", 3: "Marzo", 4: "Abril",
-    5: "Mayo", 6: "Junio", 7: "Julio", 8: "Agosto",
-    9: "Septiembre", 10: "Octubre", 11: "Noviembre", 12: "Diciembre"
-}
+# Panel y gráficas salen de la misma consulta en lote, cacheada unos segundos
+servicio_panel = ServicioPanel(lecturas.vista(DESFASE_REPORTES["panel"]), dialecto, ttl=float(os.getenv('PANEL_TTL', '10')))
 
 @app.get("/datos-panel", response_model=DatosPanel)
-def get_datos_panel():
+async def get_datos_panel():
     try:
-        query_productos = "SELECT COUNT(*) FROM Productos;"
-        query_stock = "SELECT SUM(Stock) FROM Productos;"
-        query_clientes = "SELECT COUNT(*) FROM Clientes;"
-        query_pedidos = "SELECT COUNT(*) FROM Pedidos;"
-
-        productos = ejecutar_consulta(query_productos)[0][0]
-        stock = ejecutar_consulta(query_stock)[0][0]
-        clientes = ejecutar_consulta(query_clientes)[0][0]
-        pedidos = ejecutar_consulta(query_pedidos)[0][0]
-
-        return DatosPanel(productos=productos, stock=stock, clientes=clientes, pedidos=pedidos)
+        datos = await servicio_panel.obtener()
+        return DatosPanel(**datos["panel"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/datos-graficas", response_model=DatosGraficas)
-def get_datos_graficas():
+async def get_datos_graficas():
     try:
-        query_barras = """
-        SELECT MONTH(FechaCompra) AS Mes, COUNT(*) AS Total
-        FROM Pedidos
-        GROUP BY MONTH(FechaCompra)
-        ORDER BY MONTH(FechaCompra);
-        """
-        query_pastel = """
-        SELECT Nombre, COUNT(*) AS Total
-        FROM Productos
-        JOIN Pedidos ON Productos.ProductoID = Pedidos.ProductoID
-        GROUP BY Nombre;
-        """
-
-        barras = ejecutar_consulta(query_barras)
-        pastel = ejecutar_consulta(query_pastel)
-
-        categorias_barras = [meses_espanol[row[0]] for row in barras]
-        data_barras = [row[1] for row in barras]
-
-        categorias_pastel = [row[0] for row in pastel]
-        data_pastel = [row[1] for row in pastel]
-
-        return DatosGraficas(barras=data_barras, categoriasBarras=categorias_barras, pastel=data_pastel, categoriasPastel=categorias_pastel)
+        datos = await servicio_panel.obtener()
+        return DatosGraficas(**datos["graficas"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
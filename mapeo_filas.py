@@ -0,0 +1,92 @@
+"""Conversión por columnas de filas de la base a los objetos JSON de los listados.
+
+En lugar de una función que arma un dict por fila, `MapeoFilas` transpone el lote,
+convierte cada columna con una sola llamada (`map(float, ...)`, las fechas de toda la
+columna con orjson) y arma los objetos con `dict(zip(claves, valores))`, que corre en
+C. El arreglo se codifica por bloques y `bloques_json` los entrega uno a uno a un
+StreamingResponse, así que de un listado grande sólo existe un bloque de dicts y de
+JSON a la vez.
+
+    mapeo = MapeoFilas([("venta_id", 0), ("total", a_float(6)), ("fecha", fecha_hora_texto(7))])
+    StreamingResponse(mapeo.bloques_json(filas), media_type="application/json")
+"""
+from itertools import repeat
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from respuestas import a_json
+
+
+def a_float(indice):
+    """Columna numérica (Decimal de pyodbc) como float."""
+    return lambda columnas: map(float, columnas[indice])
+
+
+def fecha_hora_texto(indice):
+    """Columna de datetime como texto "AAAA-MM-DD HH:MM:SS"; None queda como null."""
+    def convertir(columnas):
+        columna = columnas[indice]
+        if orjson is not None:
+            # orjson formatea la columna entera en C; en un datetime sin zona la única T es el separador
+            return orjson.loads(orjson.dumps(columna, option=orjson.OPT_OMIT_MICROSECONDS).replace(b"T", b" "))
+        return [None if valor is None else valor.isoformat(" ", "seconds") for valor in columna]
+    return convertir
+
+
+class MapeoFilas:
+    """Objetos JSON a partir de filas (tuplas, filas del driver o namedtuples).
+
+    `campos` es una lista `(clave, origen)`: `origen` es el índice de la columna, que
+    pasa sin cambios, o una función que recibe la lista de columnas del lote y devuelve
+    los valores ya convertidos de ese campo. Cada función de `derivadas` recibe esa
+    misma lista y devuelve una columna nueva que se agrega al final, para campos que
+    salen de un cálculo compartido.
+    """
+
+    def __init__(self, campos, derivadas=()):
+        self.claves = [clave for clave, _ in campos]
+        self._origenes = [origen for _, origen in campos]
+        self._derivadas = list(derivadas)
+        # Todas las columnas pasan en orden y sin cambios: se arma cada dict directo de la fila
+        self._directo = not self._derivadas and self._origenes == list(range(len(self._origenes)))
+
+    def columnas(self, filas):
+        """Valores convertidos por campo, en el orden de `claves`."""
+        columnas = list(zip(*filas))
+        for derivada in self._derivadas:
+            columnas.append(derivada(columnas))
+        return [columnas[origen] if isinstance(origen, int) else origen(columnas) for origen in self._origenes]
+
+    def valores(self, filas):
+        """Una tupla de valores convertidos por fila, en el orden de `claves` (para CSV)."""
+        if not filas:
+            return iter(())
+        return zip(*self.columnas(filas))
+
+    def objetos(self, filas):
+        valores = filas if self._directo else self.valores(filas)
+        return list(map(dict, map(zip, repeat(self.claves), valores)))
+
+    def __call__(self, fila):
+        """Objeto de una sola fila, para respuestas de un elemento."""
+        return self.objetos([fila])[0]
+
+    def bloques_json(self, filas, tamano_bloque=1000):
+        """Arreglo JSON de todas las filas en partes de `tamano_bloque` objetos."""
+        yield b"["
+        for inicio in range(0, len(filas), tamano_bloque):
+            bloque = a_json(self.objetos(filas[inicio:inicio + tamano_bloque]))
+            yield (b"," if inicio else b"") + bloque[1:-1]
+        yield b"]"
+
+    def json(self, filas, tamano_bloque=1000):
+        return b"".join(self.bloques_json(filas, tamano_bloque))
+
+    def ndjson(self, filas):
+        """Un objeto JSON por línea."""
+        if not filas:
+            return b""
+        return b"\n".join(map(a_json, self.objetos(filas))) + b"\n"
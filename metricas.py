@@ -0,0 +1,222 @@
+import logging
+import re
+import threading
+import time
+
+# Límites de los histogramas en segundos
+BUCKETS_PETICION = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BUCKETS_ADQUISICION = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+# Etiqueta de las consultas armadas en el momento (sin `Consulta.nombre`); el texto SQL
+# no se usa como etiqueta porque expone el esquema y cambia con cada IN (...) o TOP n
+SIN_NOMBRE = "sin_nombre"
+_ESPACIOS = re.compile(r"\s+")
+
+registro_lentas = logging.getLogger("consultas_lentas")
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(nombres, valores, extra=None):
+    pares = list(zip(nombres, valores))
+    if extra:
+        pares.append(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in pares) + "}"
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def forma_parametros(params):
+    """Tipos de los parámetros sin sus valores, para el log de consultas lentas."""
+    if params is None:
+        return "()"
+    if isinstance(params, (list, tuple)):
+        tipos = [type(p).__name__ for p in params]
+        if len(tipos) > 10:
+            return f"({', '.join(tipos[:10])}, ... {len(tipos)} en total)"
+        return f"({', '.join(tipos)})"
+    return type(params).__name__
+
+
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._candado = threading.Lock()
+
+    def incrementar(self, *valores_etiquetas, cantidad=1):
+        with self._candado:
+            self._valores[valores_etiquetas] = self._valores.get(valores_etiquetas, 0) + cantidad
+
+    def lineas(self):
+        with self._candado:
+            valores = sorted(self._valores.items())
+        for etiquetas, valor in valores:
+            yield f"{self.nombre}{_etiquetas(self.etiquetas, etiquetas)} {_numero(valor)}"
+
+
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_PETICION):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(buckets)
+        self._series = {}  # etiquetas -> [conteos por bucket..., suma, total]
+        self._candado = threading.Lock()
+
+    def observar(self, valor, *valores_etiquetas):
+        with self._candado:
+            serie = self._series.get(valores_etiquetas)
+            if serie is None:
+                serie = self._series[valores_etiquetas] = [0] * len(self.buckets) + [0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[i] += 1
+                    break
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def lineas(self):
+        with self._candado:
+            series = sorted((etiquetas, list(serie)) for etiquetas, serie in self._series.items())
+        for etiquetas, serie in series:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets, serie):
+                acumulado += conteo
+                yield f"{self.nombre}_bucket{_etiquetas(self.etiquetas, etiquetas, ('le', _numero(limite)))} {acumulado}"
+            # +Inf incluye las observaciones por encima del último límite
+            yield f"{self.nombre}_bucket{_etiquetas(self.etiquetas, etiquetas, ('le', '+Inf'))} {serie[-1]}"
+            yield f"{self.nombre}_sum{_etiquetas(self.etiquetas, etiquetas)} {_numero(serie[-2])}"
+            yield f"{self.nombre}_count{_etiquetas(self.etiquetas, etiquetas)} {serie[-1]}"
+
+
+class Metricas:
+    """Métricas de peticiones y del acceso a datos en formato de texto de Prometheus.
+
+    Los contadores son seguros entre hilos porque las consultas se miden en los
+    hilos de BaseDatosAsincrona. Con `umbral_lentas` (segundos) se registran en el
+    log `consultas_lentas` el texto y la forma de los parámetros de cada consulta
+    que lo supere; sin umbral el log queda apagado.
+    """
+
+    def __init__(self, umbral_lentas=None):
+        self.umbral_lentas = umbral_lentas
+        self.peticiones = Contador("http_peticiones_total", "Peticiones atendidas", ("metodo", "ruta", "estado"))
+        self.errores = Contador("http_errores_total", "Peticiones que terminaron en 5xx", ("metodo", "ruta"))
+        self.duracion = Histograma(
+            "http_duracion_segundos", "Latencia de las peticiones", ("metodo", "ruta"), BUCKETS_PETICION
+        )
+        self.consultas = Histograma(
+            "bd_consulta_duracion_segundos", "Duración de las consultas", ("operacion", "consulta"), BUCKETS_CONSULTA
+        )
+        self.filas = Contador("bd_consulta_filas_total", "Filas leídas o afectadas", ("operacion", "consulta"))
+        self.errores_consulta = Contador("bd_consulta_errores_total", "Consultas que fallaron", ("operacion", "consulta"))
+        self.adquisicion = Histograma(
+            "bd_adquisicion_conexion_segundos", "Espera para obtener una conexión del pool", (), BUCKETS_ADQUISICION
+        )
+        self._colectores = []
+
+    # Registro ------------------------------------------------------------
+
+    def observar_peticion(self, metodo, ruta, estado, duracion):
+        self.peticiones.incrementar(metodo, ruta, str(estado))
+        self.duracion.observar(duracion, metodo, ruta)
+        if estado >= 500:
+            self.errores.incrementar(metodo, ruta)
+
+    def observar_consulta(self, operacion, consulta, duracion, filas=None, params=None, error=False, nombre=None):
+        """`consulta` es el texto SQL (sólo va al log de lentas); la etiqueta es `nombre`."""
+        etiqueta = nombre or SIN_NOMBRE
+        self.consultas.observar(duracion, operacion, etiqueta)
+        # rowcount es -1 cuando el driver no conoce el número de filas
+        if filas and filas > 0:
+            self.filas.incrementar(operacion, etiqueta, cantidad=filas)
+        if error:
+            self.errores_consulta.incrementar(operacion, etiqueta)
+        if self.umbral_lentas is not None and duracion >= self.umbral_lentas:
+            registro_lentas.warning(
+                f"Consulta lenta ({duracion * 1000:.1f} ms, {operacion}): {_ESPACIOS.sub(' ', consulta).strip()} "
+                f"params={forma_parametros(params)}"
+            )
+
+    def observar_adquisicion(self, duracion):
+        self.adquisicion.observar(duracion)
+
+    def registrar_colector(self, nombre, ayuda, funcion, tipo="gauge"):
+        """Valor que se lee en cada exposición, como el tamaño actual del pool."""
+        self._colectores.append((nombre, ayuda, tipo, funcion))
+
+    # Exposición ----------------------------------------------------------
+
+    def exponer(self):
+        lineas = []
+        for metrica in (
+            self.peticiones, self.errores, self.duracion,
+            self.consultas, self.filas, self.errores_consulta, self.adquisicion,
+        ):
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            lineas.extend(metrica.lineas())
+        for nombre, ayuda, tipo, funcion in self._colectores:
+            try:
+                valor = funcion()
+            except Exception as e:
+                logging.warning(f"No se pudo leer la métrica {nombre}: {e}")
+                continue
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+            lineas.append(f"{nombre} {_numero(valor)}")
+        return "\n".join(lineas) + "\n"
+
+
+class MetricasMiddleware:
+    """Mide cada petición HTTP con la plantilla de la ruta (`/pedido/{pedido_id}`), no la URL concreta."""
+
+    def __init__(self, app, metricas):
+        self.app = app
+        self.metricas = metricas
+
+    @staticmethod
+    def _ruta(scope, root_path):
+        ruta = scope.get("route")
+        if ruta is not None and hasattr(ruta, "path"):
+            return ruta.path
+        if scope.get("root_path", "") != root_path:
+            # Dentro de un Mount (estáticos): se agrupa por el prefijo montado
+            return scope["root_path"][len(root_path):] + "/*"
+        return "sin_ruta"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.perf_counter()
+        root_path = scope.get("root_path", "")
+        estado = 500
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            self.metricas.observar_peticion(
+                scope["method"], self._ruta(scope, root_path), estado, time.perf_counter() - inicio
+            )
@@ -0,0 +1,139 @@
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+
+LIMITE_POR_DEFECTO = 100
+LIMITE_MAXIMO = 500
+
+# Índices que sostienen la paginación por llave: cada orden disponible termina en la
+# llave primaria, así que (columna, id) identifica una posición de forma única.
+# Cada uno es `(nombre, tabla, columnas)`; `esquema` los declara junto a las tablas.
+INDICES_RECOMENDADOS = [
+    ("IX_Productos_Precio", "Productos", ("Precio", "ProductoID")),
+    ("IX_Productos_Nombre", "Productos", ("Nombre", "ProductoID")),
+    ("IX_Productos_Stock", "Productos", ("Stock", "ProductoID")),
+    ("IX_Ventas_Fecha", "Ventas", ("FechaVenta", "VentaID")),
+    ("IX_Pedidos_Fecha", "Pedidos", ("FechaCompra", "PedidoID")),
+    ("IX_SesionesClientes_Inicio", "SesionesClientes", ("FechaInicio", "SesionID")),
+]
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def _valor_cursor(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        # Como texto para no perder precisión; la base lo convierte al comparar
+        return str(valor)
+    return valor
+
+
+def codificar_cursor(valores):
+    texto = json.dumps([_valor_cursor(v) for v in valores], separators=(",", ":"))
+    return base64.urlsafe_b64encode(texto.encode("utf-8")).rstrip(b"=").decode("ascii")
+
+
+def decodificar_cursor(cursor):
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+    except Exception:
+        raise CursorInvalido("Cursor inválido")
+    if not isinstance(valores, list) or len(valores) != 2:
+        raise CursorInvalido("Cursor inválido")
+    return valores
+
+
+def filtro_prefijo(columna, prefijo):
+    """Condición `LIKE 'prefijo%'` con los comodines del usuario escapados."""
+    escapado = prefijo.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_").replace("[", "\\[")
+    return f"{columna} LIKE ? ESCAPE '\\'", (escapado + "%",)
+
+
+class ConsultaPaginada:
+    """Arma consultas paginadas por llave (`WHERE (orden, id) > cursor ORDER BY orden, id`).
+
+    `columnas` es la lista de expresiones del SELECT, `desde_sql` el FROM/JOIN, y
+    `ordenes` asocia cada nombre de orden público con una expresión de `columnas`.
+    Filtros, orden y límite se resuelven en SQL; Python sólo recibe una página.
+    """
+
+    def __init__(self, columnas, desde_sql, columna_id, ordenes, dialecto, columnas_fecha=()):
+        self.columnas = columnas
+        self.desde_sql = desde_sql
+        self.columna_id = columna_id
+        self.ordenes = ordenes
+        self.dialecto = dialecto
+        self.columnas_fecha = set(columnas_fecha)
+        self._indice_id = columnas.index(columna_id)
+
+    def construir(self, filtros, orden, limite, after=None):
+        """Devuelve `(sql, params)` para una página de `limite` filas.
+
+        `filtros` es una lista de pares `(condicion_sql, params)`; `orden` es un nombre
+        de `self.ordenes`, con prefijo `-` para orden descendente. Con `limite=None`
+        se devuelven todas las filas que cumplan los filtros.
+        """
+        descendente = orden.startswith("-")
+        nombre_orden = orden.lstrip("-")
+        if nombre_orden not in self.ordenes:
+            raise CursorInvalido(f"Orden no soportado: {orden}")
+        columna_orden = self.ordenes[nombre_orden]
+
+        condiciones = [condicion for condicion, _ in filtros]
+        params = [p for _, valores in filtros for p in valores]
+
+        if after:
+            valor, ultimo_id = decodificar_cursor(after)
+            if columna_orden in self.columnas_fecha and valor is not None:
+                try:
+                    valor = datetime.fromisoformat(valor)
+                except (TypeError, ValueError):
+                    raise CursorInvalido("Cursor inválido")
+            comparador = "<" if descendente else ">"
+            if columna_orden == self.columna_id:
+                condiciones.append(f"{self.columna_id} {comparador} ?")
+                params.append(ultimo_id)
+            else:
+                condiciones.append(
+                    f"({columna_orden} {comparador} ? OR ({columna_orden} = ? AND {self.columna_id} {comparador} ?))"
+                )
+                params.extend([valor, valor, ultimo_id])
+
+        direccion = "DESC" if descendente else "ASC"
+        orden_sql = f"{columna_orden} {direccion}"
+        if columna_orden != self.columna_id:
+            orden_sql += f", {self.columna_id} {direccion}"
+
+        where = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        # Se pide una fila de más para saber si existe una página siguiente
+        primeras = self.dialecto.primeras(limite + 1) if limite is not None else ""
+        limite_sql = self.dialecto.limite(limite + 1) if limite is not None else ""
+        sql = (
+            f"SELECT {primeras}{', '.join(self.columnas)} "
+            f"FROM {self.desde_sql}{where} ORDER BY {orden_sql}{limite_sql};"
+        )
+        return sql, tuple(params)
+
+    def pagina(self, filas, orden, limite, convertir):
+        """Recorta la fila extra y arma el sobre `{resultados, siguiente, limite}`.
+
+        `convertir` recibe la lista de filas de la página y devuelve la de resultados.
+        """
+        hay_mas = len(filas) > limite
+        filas = filas[:limite]
+        siguiente = None
+        if hay_mas and filas:
+            ultima = filas[-1]
+            columna_orden = self.ordenes[orden.lstrip("-")]
+            valor = ultima[self.columnas.index(columna_orden)]
+            siguiente = codificar_cursor([valor, ultima[self._indice_id]])
+        return {
+            "resultados": convertir(filas),
+            "siguiente": siguiente,
+            "limite": limite,
+        }
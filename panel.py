@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+MESES_ESPANOL = {
+    1: "Enero", 2: "Febrero", 3: "Marzo", 4: "Abril",
+    5: "Mayo", 6: "Junio", 7: "Julio", 8: "Agosto",
+    9: "Septiembre", 10: "Octubre", 11: "Noviembre", 12: "Diciembre"
+}
+
+# Todas las métricas del panel y de las gráficas; en SQL Server van en un solo lote
+CONSULTAS_PANEL = [
+    """
+    SELECT
+        (SELECT COUNT(*) FROM Productos),
+        (SELECT SUM(Stock) FROM Productos),
+        (SELECT COUNT(*) FROM Clientes),
+        (SELECT COUNT(*) FROM Pedidos);
+    """,
+    """
+    SELECT {mes} AS Mes, COUNT(*) AS Total
+    FROM Pedidos
+    GROUP BY {mes}
+    ORDER BY {mes};
+    """,
+    """
+    SELECT Nombre, COUNT(*) AS Total
+    FROM Productos
+    JOIN Pedidos ON Productos.ProductoID = Pedidos.ProductoID
+    GROUP BY Nombre;
+    """,
+]
+
+
+class ServicioPanel:
+    """Métricas del panel de administración calculadas con una sola conexión (un solo lote en SQL Server).
+
+    El resultado se guarda `ttl` segundos y las peticiones que llegan mientras se
+    calcula esperan ese mismo cálculo en lugar de lanzar el suyo.
+    """
+
+    def __init__(self, bd, dialecto, ttl=10.0):
+        self.bd = bd
+        self.dialecto = dialecto
+        self._consultas = [consulta.format(mes=dialecto.mes("FechaCompra")) for consulta in CONSULTAS_PANEL]
+        self.ttl = ttl
+        self._datos = None
+        self._expira = 0.0
+        # Se crea en el primer uso, dentro del event loop que lo usa (ver `_candado_del_loop`)
+        self._candado = None
+        self._loop_candado = None
+
+    def _candado_del_loop(self):
+        # El servicio se construye al importar main; en Python 3.9 un asyncio.Lock creado ahí
+        # queda ligado a otro loop y falla al esperarlo desde el de uvicorn
+        loop = asyncio.get_running_loop()
+        if self._loop_candado is not loop:
+            self._candado = asyncio.Lock()
+            self._loop_candado = loop
+        return self._candado
+
+    def _vigente(self):
+        return self._datos is not None and time.monotonic() < self._expira
+
+    async def _calcular(self):
+        if self.dialecto.lotes:
+            lote = "SET NOCOUNT ON;\n" + "".join(self._consultas)
+            totales, barras, pastel = await self.bd.consultar_conjuntos(lote)
+        else:
+            totales, barras, pastel = await self.bd.consultar_varias(self._consultas)
+        productos, stock, clientes, pedidos = totales[0]
+        return {
+            "panel": {
+                "productos": productos,
+                "stock": stock or 0,
+                "clientes": clientes,
+                "pedidos": pedidos,
+            },
+            "graficas": {
+                "barras": [row[1] for row in barras],
+                "categoriasBarras": [MESES_ESPANOL[row[0]] for row in barras],
+                "pastel": [row[1] for row in pastel],
+                "categoriasPastel": [row[0] for row in pastel],
+            },
+        }
+
+    async def obtener(self):
+        if self._vigente():
+            return self._datos
+        async with self._candado_del_loop():
+            if not self._vigente():
+                self._datos = await self._calcular()
+                self._expira = time.monotonic() + self.ttl
+            return self._datos
+
+    def invalidar(self):
+        self._expira = 0.0
@@ -0,0 +1,31 @@
+"""Registro de pedidos sin depender del procedimiento RegistrarPedido de SQL Server."""
+
+
+def registrar_pedido(cursor, dialecto, cliente_id, producto_id, cantidad, descontar_stock=True):
+    """Inserta el pedido y su venta y descuenta el stock, igual que `EXEC RegistrarPedido`.
+
+    Corre dentro de la transacción del cursor. Con `descontar_stock=False` el stock
+    lo descuenta quien llama (por ejemplo ReservadorStock). Devuelve el PedidoID.
+    """
+    cursor.execute(
+        dialecto.insertar_devolviendo(
+            "Pedidos", ["ClienteID", "ProductoID", "Cantidad", "FechaCompra"], "PedidoID",
+            valores=["?", "?", "?", "CURRENT_TIMESTAMP"],
+        ),
+        (cliente_id, producto_id, cantidad),
+    )
+    pedido_id = cursor.fetchone()[0]
+    cursor.execute(
+        """
+        INSERT INTO Ventas (PedidoID, ClienteID, NombreUsuario, NombreProducto, Cantidad, TotalCompra, FechaVenta)
+        SELECT ?, c.ClienteID, c.NombreUsuario, p.Nombre, ?, p.Precio * ?, CURRENT_TIMESTAMP
+        FROM Clientes c CROSS JOIN Productos p
+        WHERE c.ClienteID = ? AND p.ProductoID = ?;
+        """,
+        (pedido_id, cantidad, cantidad, cliente_id, producto_id),
+    )
+    if descontar_stock:
+        cursor.execute(
+            "UPDATE Productos SET Stock = Stock - ? WHERE ProductoID = ?;", (cantidad, producto_id)
+        )
+    return pedido_id
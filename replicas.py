@@ -0,0 +1,179 @@
+"""Lecturas de reportes enrutadas a una réplica de sólo lectura.
+
+Cada reporte declara cuánto desfase tolera (`vista(desfase_maximo)`) y lee de la
+réplica mientras el retraso medido quepa en ese margen; si no hay réplica, si está
+atrasada o si falla, lee de la primaria. El retraso se mide con un latido: cada
+`intervalo` segundos se escribe la hora actual en `LatidoReplicacion` de la primaria
+y se lee la que ya llegó a la réplica. La diferencia es una cota superior del
+retraso real (le suma hasta un `intervalo`). Si la primaria no tiene la tabla del
+latido (bases anteriores a `esquema crear`) se crea en la primera medición y llega a
+la réplica por la misma replicación.
+"""
+import asyncio
+import logging
+import time
+
+DDL_LATIDO = "CREATE TABLE LatidoReplicacion (LatidoID INTEGER NOT NULL PRIMARY KEY, Marca FLOAT NOT NULL);"
+QUERY_LATIDO_SONDEO = "SELECT LatidoID FROM LatidoReplicacion WHERE 1 = 0;"
+QUERY_LATIDO_ACTUALIZAR = "UPDATE LatidoReplicacion SET Marca = ? WHERE LatidoID = 1;"
+QUERY_LATIDO_INSERTAR = "INSERT INTO LatidoReplicacion (LatidoID, Marca) VALUES (1, ?);"
+QUERY_LATIDO_LEER = "SELECT Marca FROM LatidoReplicacion WHERE LatidoID = 1;"
+
+
+class LecturasEnrutadas:
+    """Elige entre la réplica y la primaria para las lecturas de reportes.
+
+    `primaria` y `replica` son `BaseDatosAsincrona`; la primaria debería tener un pool
+    propio, separado del de las transacciones, para que los reportes que caen ahí
+    tampoco ocupen conexiones ni hilos de las compras. Tras un error de la réplica
+    se deja de usar `pausa_fallo` segundos.
+    """
+
+    def __init__(self, primaria, replica=None, intervalo=5.0, pausa_fallo=30.0):
+        self.primaria = primaria
+        self.replica = replica
+        self.intervalo = intervalo
+        self.pausa_fallo = pausa_fallo
+        self.retraso = None  # segundos; None mientras no se haya podido medir
+        self._pausada_hasta = 0.0
+        self._latido_listo = False
+        self._tarea = None
+        self._stats = {"replica": 0, "primaria": 0, "respaldos": 0, "fallos_replica": 0}
+
+    def vista(self, desfase_maximo):
+        """Objeto con la interfaz de lectura de `BaseDatosAsincrona` que tolera `desfase_maximo` segundos."""
+        return VistaLectura(self, desfase_maximo)
+
+    def _usar_replica(self, desfase_maximo):
+        return (
+            self.replica is not None
+            and self.retraso is not None
+            and self.retraso <= desfase_maximo
+            and time.monotonic() >= self._pausada_hasta
+        )
+
+    def _fallo_replica(self, error):
+        self._stats["fallos_replica"] += 1
+        self._pausada_hasta = time.monotonic() + self.pausa_fallo
+        logging.warning(f"La réplica de lectura falló, se usa la primaria por {self.pausa_fallo:.0f}s: {error}")
+
+    async def leer(self, desfase_maximo, operacion, *args, **kwargs):
+        """Ejecuta `operacion` (p. ej. "consultar") en la réplica si el desfase lo permite, si no en la primaria."""
+        if self._usar_replica(desfase_maximo):
+            try:
+                resultado = await getattr(self.replica, operacion)(*args, **kwargs)
+                self._stats["replica"] += 1
+                return resultado
+            except Exception as e:
+                # Si la primaria también falla el problema es la consulta, no la réplica
+                resultado = await getattr(self.primaria, operacion)(*args, **kwargs)
+                self._fallo_replica(e)
+                self._stats["respaldos"] += 1
+                return resultado
+        self._stats["primaria"] += 1
+        return await getattr(self.primaria, operacion)(*args, **kwargs)
+
+    async def leer_en_lotes(self, desfase_maximo, query, params=None, tamano_lote=1000):
+        """`consultar_en_lotes` con el mismo enrutamiento; sólo cambia a la primaria antes del primer lote."""
+        lotes = None
+        if self._usar_replica(desfase_maximo):
+            lotes = self.replica.consultar_en_lotes(query, params, tamano_lote)
+            try:
+                primero = await lotes.__anext__()
+            except StopAsyncIteration:
+                self._stats["replica"] += 1
+                return
+            except Exception as e:
+                self._fallo_replica(e)
+                self._stats["respaldos"] += 1
+                lotes = None
+            else:
+                self._stats["replica"] += 1
+                yield primero
+        if lotes is None:
+            self._stats["primaria"] += 1
+            lotes = self.primaria.consultar_en_lotes(query, params, tamano_lote)
+        try:
+            async for filas in lotes:
+                yield filas
+        finally:
+            # Devuelve la conexión en cuanto el consumidor deja de leer
+            await lotes.aclose()
+
+    # Latido --------------------------------------------------------------
+
+    async def asegurar_latido(self):
+        """Crea la tabla del latido en la primaria si no existe."""
+        if self._latido_listo:
+            return
+        try:
+            await self.primaria.consultar(QUERY_LATIDO_SONDEO)
+        except Exception:
+            try:
+                await self.primaria.ejecutar(DDL_LATIDO)
+            except Exception:
+                # Otro worker pudo crearla entre el sondeo y el CREATE; si no, el sondeo falla de nuevo
+                await self.primaria.consultar(QUERY_LATIDO_SONDEO)
+            logging.info("Tabla LatidoReplicacion creada en la primaria")
+        self._latido_listo = True
+
+    async def medir(self):
+        """Renueva el latido en la primaria y calcula el retraso con el que llegó a la réplica."""
+        await self.asegurar_latido()
+        marca = time.time()
+        if await self.primaria.ejecutar(QUERY_LATIDO_ACTUALIZAR, (marca,)) == 0:
+            await self.primaria.ejecutar(QUERY_LATIDO_INSERTAR, (marca,))
+        filas = await self.replica.consultar(QUERY_LATIDO_LEER)
+        self.retraso = time.time() - filas[0][0] if filas else None
+        return self.retraso
+
+    async def _ciclo(self):
+        while True:
+            try:
+                await self.medir()
+            except Exception as e:
+                self.retraso = None
+                logging.warning(f"No se pudo medir el retraso de la réplica: {e}")
+            await asyncio.sleep(self.intervalo)
+
+    def iniciar(self):
+        """Arranca la medición periódica del retraso; sin réplica no hace nada. Llamar dentro del event loop."""
+        if self.replica is not None:
+            self._tarea = asyncio.get_running_loop().create_task(self._ciclo())
+
+    async def cerrar(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+    def estadisticas(self):
+        return dict(self._stats, retraso=self.retraso, con_replica=self.replica is not None)
+
+
+class VistaLectura:
+    """Lecturas con un desfase máximo fijo; se pasa donde se esperaría una `BaseDatosAsincrona`."""
+
+    def __init__(self, lecturas, desfase_maximo):
+        self.lecturas = lecturas
+        self.desfase_maximo = desfase_maximo
+
+    async def consultar(self, query, params=None):
+        return await self.lecturas.leer(self.desfase_maximo, "consultar", query, params)
+
+    async def consultar_conjuntos(self, query, params=None):
+        return await self.lecturas.leer(self.desfase_maximo, "consultar_conjuntos", query, params)
+
+    async def consultar_varias(self, consultas):
+        return await self.lecturas.leer(self.desfase_maximo, "consultar_varias", consultas)
+
+    async def correr(self, consulta, params=None):
+        if consulta.escribe:
+            raise ValueError(f"La consulta {consulta.nombre} escribe y no puede ir a la réplica")
+        return await self.lecturas.leer(self.desfase_maximo, "correr", consulta, params)
+
+    def consultar_en_lotes(self, query, params=None, tamano_lote=1000):
+        return self.lecturas.leer_en_lotes(self.desfase_maximo, query, params, tamano_lote)
@@ -0,0 +1,159 @@
+import json
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import orjson
+except ImportError:  # Sin orjson se usa el módulo json de la biblioteca estándar
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from estaticos import codificaciones_aceptadas
+
+TIPOS_COMPRIMIBLES = ("application/json", "application/x-ndjson", "text/", "application/javascript", "image/svg+xml")
+# Flujos de eventos (SSE): proxies y EventSource pueden retener un cuerpo comprimido
+# hasta juntar un bloque, aunque cada evento se vacíe
+TIPOS_SIN_COMPRIMIR = ("text/event-stream",)
+
+
+def _por_defecto(valor):
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable a JSON: {type(valor).__name__}")
+
+
+def a_json(contenido):
+    """Serializa a bytes UTF-8; con orjson cuando está instalado."""
+    if orjson is not None:
+        return orjson.dumps(contenido, default=_por_defecto, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(contenido, ensure_ascii=False, separators=(",", ":"), default=_por_defecto).encode("utf-8")
+
+
+class RespuestaJSON(JSONResponse):
+    """JSONResponse con el serializador rápido.
+
+    Devolverla directamente desde una ruta evita que FastAPI vuelva a validar el
+    contenido contra `response_model` y lo pase por `jsonable_encoder`; conviene
+    hacerlo cuando las filas salen de la base ya convertidas.
+    """
+
+    def render(self, content):
+        return a_json(content)
+
+
+class _Compresor:
+    def __init__(self, codificacion, nivel_gzip, calidad_brotli):
+        self.codificacion = codificacion
+        if codificacion == "br":
+            self._brotli = brotli.Compressor(quality=calidad_brotli)
+        else:
+            # wbits=31: formato gzip con encabezado y CRC
+            self._zlib = zlib.compressobj(nivel_gzip, zlib.DEFLATED, 31)
+
+    def bloque(self, datos):
+        """Comprime un fragmento y lo vacía para que el cliente lo reciba ya."""
+        if self.codificacion == "br":
+            return self._brotli.process(datos) + self._brotli.flush()
+        return self._zlib.compress(datos) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def terminar(self, datos=b""):
+        if self.codificacion == "br":
+            return self._brotli.process(datos) + self._brotli.finish()
+        return self._zlib.compress(datos) + self._zlib.flush()
+
+
+class CompresionMiddleware:
+    """Comprime con brotli o gzip, según `Accept-Encoding`, las respuestas de texto.
+
+    Las respuestas completas por debajo de `minimo` bytes se envían tal cual; las
+    que van por partes (exportaciones) se comprimen fragmento a fragmento. No toca
+    respuestas que ya traen `Content-Encoding`, como los estáticos precomprimidos, ni
+    los flujos `text/event-stream`.
+    """
+
+    def __init__(self, app, minimo=1024, nivel_gzip=6, calidad_brotli=4):
+        self.app = app
+        self.minimo = minimo
+        self.nivel_gzip = nivel_gzip
+        self.calidad_brotli = calidad_brotli
+
+    def _codificacion(self, scope):
+        aceptadas = codificaciones_aceptadas(Headers(scope=scope).get("accept-encoding"))
+        if brotli is not None and "br" in aceptadas:
+            return "br"
+        if "gzip" in aceptadas:
+            return "gzip"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        codificacion = self._codificacion(scope) if scope["type"] == "http" else None
+        if codificacion is None:
+            await self.app(scope, receive, send)
+            return
+
+        inicio = None
+        compresor = None
+        directo = False
+
+        async def enviar(mensaje):
+            nonlocal inicio, compresor, directo
+            if directo:
+                await send(mensaje)
+                return
+            if mensaje["type"] == "http.response.start":
+                inicio = mensaje
+                return
+            if mensaje["type"] != "http.response.body":
+                await send(mensaje)
+                return
+
+            cuerpo = mensaje.get("body", b"")
+            hay_mas = mensaje.get("more_body", False)
+
+            if compresor is None:
+                headers = MutableHeaders(raw=inicio["headers"])
+                tipo = headers.get("content-type", "")
+                if (
+                    "content-encoding" in headers
+                    or inicio["status"] in (204, 304)
+                    or not tipo.startswith(TIPOS_COMPRIMIBLES)
+                    or tipo.startswith(TIPOS_SIN_COMPRIMIR)
+                    or (not hay_mas and len(cuerpo) < self.minimo)
+                ):
+                    directo = True
+                    await send(inicio)
+                    await send(mensaje)
+                    return
+
+                compresor = _Compresor(codificacion, self.nivel_gzip, self.calidad_brotli)
+                headers["Content-Encoding"] = codificacion
+                headers.add_vary_header("Accept-Encoding")
+                if "etag" in headers:
+                    # Otra representación, otro ETag: débil para no confundir cachés
+                    headers["ETag"] = "W/" + headers["etag"].replace("W/", "", 1)
+                if hay_mas:
+                    if "content-length" in headers:
+                        del headers["Content-Length"]
+                    await send(inicio)
+                    await send({"type": "http.response.body", "body": compresor.bloque(cuerpo), "more_body": True})
+                else:
+                    datos = compresor.terminar(cuerpo)
+                    headers["Content-Length"] = str(len(datos))
+                    await send(inicio)
+                    await send({"type": "http.response.body", "body": datos})
+                return
+
+            datos = compresor.bloque(cuerpo) if hay_mas else compresor.terminar(cuerpo)
+            await send({"type": "http.response.body", "body": datos, "more_body": hay_mas})
+
+        await self.app(scope, receive, enviar)
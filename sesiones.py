@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+COOKIE_SESION = "sesion"
+
+# Tabla que usa AlmacenSQL (también declarada en esquema); la misma sentencia sirve para
+# SQL Server y SQLite. AlmacenSQL la crea si falta, p. ej. en el archivo local de sesiones.
+DDL_SESIONES_WEB = """
+CREATE TABLE {tabla} (
+    Token VARCHAR(64) NOT NULL PRIMARY KEY,
+    Datos VARCHAR(1000) NOT NULL,
+    Expira FLOAT NOT NULL
+);
+"""
+
+
+class AlmacenMemoria:
+    """Sesiones en memoria del proceso: LRU acotado con expiración por TTL.
+
+    Sirve para un solo worker o para desarrollo; con varios procesos usar AlmacenSQL.
+    """
+
+    def __init__(self, max_sesiones=10000, ttl=8 * 3600):
+        self.max_sesiones = max_sesiones
+        self.ttl = ttl
+        self._sesiones = OrderedDict()  # token -> (datos, expira)
+        self._candado = threading.Lock()
+
+    async def obtener(self, token):
+        with self._candado:
+            entrada = self._sesiones.get(token)
+            if entrada is None:
+                return None
+            datos, expira = entrada
+            if expira < time.time():
+                del self._sesiones[token]
+                return None
+            self._sesiones.move_to_end(token)
+            return dict(datos)
+
+    async def guardar(self, token, datos):
+        with self._candado:
+            self._sesiones[token] = (dict(datos), time.time() + self.ttl)
+            self._sesiones.move_to_end(token)
+            while len(self._sesiones) > self.max_sesiones:
+                self._sesiones.popitem(last=False)
+
+    async def eliminar(self, token):
+        with self._candado:
+            self._sesiones.pop(token, None)
+
+    async def iniciar(self):
+        """Las expiradas se descartan al leerlas; no hay tarea de fondo."""
+
+    async def cerrar(self):
+        pass
+
+
+class AlmacenSQL:
+    """Sesiones en una tabla compartida, visibles para todos los workers y réplicas.
+
+    Usa cualquier BaseDatosAsincrona: la base principal en producción o un archivo
+    SQLite local como sustituto en desarrollo. La tabla se crea en el primer uso si
+    no existe, y las sesiones expiradas se borran cada `intervalo_purga` segundos.
+    """
+
+    def __init__(self, bd, ttl=8 * 3600, tabla="SesionesWeb", intervalo_purga=600.0):
+        self.bd = bd
+        self.ttl = ttl
+        self.tabla = tabla
+        self.intervalo_purga = intervalo_purga
+        self._tabla_lista = False
+        self._tarea = None
+
+    async def asegurar_tabla(self):
+        """Crea la tabla si no existe; después de la primera vez no consulta la base."""
+        if self._tabla_lista:
+            return
+        sondeo = f"SELECT Token FROM {self.tabla} WHERE 1 = 0;"
+        try:
+            await self.bd.consultar(sondeo)
+        except Exception:
+            try:
+                await self.bd.ejecutar(DDL_SESIONES_WEB.format(tabla=self.tabla))
+            except Exception:
+                # Otro worker pudo crearla entre el sondeo y el CREATE; si no, el sondeo falla de nuevo
+                await self.bd.consultar(sondeo)
+            logging.info(f"Tabla de sesiones {self.tabla} creada")
+        self._tabla_lista = True
+
+    async def obtener(self, token):
+        await self.asegurar_tabla()
+        filas = await self.bd.consultar(
+            f"SELECT Datos, Expira FROM {self.tabla} WHERE Token = ?;", (token,)
+        )
+        if not filas:
+            return None
+        datos, expira = filas[0]
+        if expira < time.time():
+            await self.eliminar(token)
+            return None
+        return json.loads(datos)
+
+    async def guardar(self, token, datos):
+        await self.asegurar_tabla()
+        expira = time.time() + self.ttl
+        datos = json.dumps(datos)
+
+        def upsert(cursor):
+            cursor.execute(f"UPDATE {self.tabla} SET Datos = ?, Expira = ? WHERE Token = ?;", (datos, expira, token))
+            if cursor.rowcount == 0:
+                cursor.execute(f"INSERT INTO {self.tabla} (Token, Datos, Expira) VALUES (?, ?, ?);", (token, datos, expira))
+
+        await self.bd.transaccion(upsert)
+
+    async def eliminar(self, token):
+        await self.asegurar_tabla()
+        await self.bd.ejecutar(f"DELETE FROM {self.tabla} WHERE Token = ?;", (token,))
+
+    async def purgar_expiradas(self):
+        await self.asegurar_tabla()
+        return await self.bd.ejecutar(f"DELETE FROM {self.tabla} WHERE Expira < ?;", (time.time(),))
+
+    async def _ciclo(self):
+        while True:
+            try:
+                borradas = await self.purgar_expiradas()
+                if borradas:
+                    logging.info(f"Se purgaron {borradas} sesiones expiradas")
+            except Exception as e:
+                logging.warning(f"No se pudieron purgar las sesiones expiradas: {e}")
+            await asyncio.sleep(self.intervalo_purga)
+
+    async def iniciar(self):
+        """Arranca la purga periódica de sesiones expiradas; llamar dentro del event loop."""
+        self._tarea = asyncio.get_running_loop().create_task(self._ciclo())
+
+    async def cerrar(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+
+class GestorSesiones:
+    """Emite y resuelve tokens de sesión firmados con HMAC.
+
+    El token que viaja al cliente es `id.firma`; una firma inválida se rechaza sin
+    consultar el almacén, así que tokens inventados no cuestan un viaje a la base.
+    """
+
+    def __init__(self, almacen, secreto):
+        if not secreto:
+            raise ValueError("Se requiere un secreto para firmar las sesiones")
+        self.almacen = almacen
+        self._secreto = secreto.encode("utf-8")
+
+    def _firmar(self, sesion_id):
+        return hmac.new(self._secreto, sesion_id.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+    def _sesion_id(self, token):
+        if not token or "." not in token:
+            return None
+        sesion_id, firma = token.rsplit(".", 1)
+        if not hmac.compare_digest(firma, self._firmar(sesion_id)):
+            return None
+        return sesion_id
+
+    async def crear(self, datos):
+        sesion_id = secrets.token_urlsafe(24)
+        await self.almacen.guardar(sesion_id, datos)
+        return f"{sesion_id}.{self._firmar(sesion_id)}"
+
+    async def obtener(self, token):
+        sesion_id = self._sesion_id(token)
+        if sesion_id is None:
+            return None
+        return await self.almacen.obtener(sesion_id)
+
+    async def iniciar(self):
+        await self.almacen.iniciar()
+
+    async def detener(self):
+        await self.almacen.cerrar()
+
+    async def cerrar(self, token):
+        sesion_id = self._sesion_id(token)
+        if sesion_id is not None:
+            await self.almacen.eliminar(sesion_id)
+
+
+def token_de_peticion(request):
+    """Token de sesión de la cookie o, para clientes de API, de `Authorization: Bearer`."""
+    token = request.cookies.get(COOKIE_SESION)
+    if token:
+        return token
+    autorizacion = request.headers.get("authorization", "")
+    if autorizacion.lower().startswith("bearer "):
+        return autorizacion[7:].strip()
+    return None
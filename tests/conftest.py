@@ -0,0 +1,39 @@
+"""Fixtures comunes: los módulos de la aplicación están en la raíz del repositorio y
+las pruebas usan archivos SQLite temporales en lugar de la base de producción.
+
+    pip install -r requirements-dev.txt
+    python -m pytest -q
+"""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from basedatos import BaseDatosAsincrona, PoolConexiones  # noqa: E402
+
+
+def conectar_sqlite(ruta):
+    return sqlite3.connect(ruta, check_same_thread=False, timeout=5)
+
+
+@pytest.fixture
+def crear_bd(tmp_path):
+    """Fábrica de `BaseDatosAsincrona` sobre un archivo SQLite nuevo en `tmp_path`."""
+    creadas = []
+
+    def crear(nombre="tienda.db", **opciones_pool):
+        ruta = str(tmp_path / nombre)
+        opciones_pool.setdefault("maximo", 2)
+        pool = PoolConexiones(lambda: conectar_sqlite(ruta), **opciones_pool)
+        bd = BaseDatosAsincrona(pool)
+        bd.ruta = ruta
+        creadas.append(bd)
+        return bd
+
+    yield crear
+    for bd in creadas:
+        bd.cerrar()
+        bd.pool.cerrar()
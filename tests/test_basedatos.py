@@ -0,0 +1,201 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from basedatos import PoolAgotado, PoolConexiones
+
+
+class CursorFalso:
+    def __init__(self, conexion):
+        self.conexion = conexion
+
+    def execute(self, sql, params=()):
+        if self.conexion.caida:
+            raise RuntimeError("conexión perdida")
+        self.conexion.consultas.append(sql)
+
+    def fetchall(self):
+        return [(1,)]
+
+
+class ConexionFalsa:
+    """Conexión DBAPI mínima que registra lo que le hacen."""
+
+    def __init__(self, numero):
+        self.numero = numero
+        self.caida = False
+        self.cerrada = False
+        self.rollbacks = 0
+        self.consultas = []
+
+    def cursor(self):
+        return CursorFalso(self)
+
+    def rollback(self):
+        if self.caida:
+            raise RuntimeError("conexión perdida")
+        self.rollbacks += 1
+
+    def close(self):
+        self.cerrada = True
+
+
+class Fabrica:
+    def __init__(self):
+        self.creadas = []
+
+    def __call__(self):
+        conexion = ConexionFalsa(len(self.creadas))
+        self.creadas.append(conexion)
+        return conexion
+
+
+def test_reutiliza_la_conexion_devuelta_y_hace_rollback():
+    fabrica = Fabrica()
+    pool = PoolConexiones(fabrica, minimo=0, maximo=2)
+    with pool.conexion() as conexion:
+        primera = conexion
+    with pool.conexion() as conexion:
+        assert conexion is primera
+    assert len(fabrica.creadas) == 1
+    assert primera.rollbacks == 2
+    stats = pool.estadisticas()
+    assert stats["prestamos"] == 2 and stats["en_uso"] == 0 and stats["inactivas"] == 1
+
+
+def test_presta_la_mas_reciente_primero():
+    pool = PoolConexiones(Fabrica(), minimo=0, maximo=3)
+    a, b = pool.adquirir(), pool.adquirir()
+    pool.liberar(a)
+    pool.liberar(b)
+    assert pool.adquirir() is b
+
+
+def test_precalentar_abre_el_minimo():
+    fabrica = Fabrica()
+    pool = PoolConexiones(fabrica, minimo=3, maximo=5)
+    pool.precalentar()
+    pool.precalentar()
+    assert len(fabrica.creadas) == 3
+    assert pool.estadisticas()["inactivas"] == 3
+
+
+def test_tamano_invalido():
+    with pytest.raises(ValueError):
+        PoolConexiones(Fabrica(), minimo=3, maximo=2)
+
+
+def test_sin_conexiones_libres_espera_y_agota():
+    pool = PoolConexiones(Fabrica(), minimo=0, maximo=1, timeout_espera=0.05)
+    ocupada = pool.adquirir()
+    inicio = time.monotonic()
+    with pytest.raises(PoolAgotado):
+        pool.adquirir()
+    assert time.monotonic() - inicio >= 0.05
+    stats = pool.estadisticas()
+    assert stats["timeouts"] == 1 and stats["esperas"] == 1
+    pool.liberar(ocupada)
+
+
+def test_la_espera_termina_cuando_se_devuelve_una_conexion():
+    pool = PoolConexiones(Fabrica(), minimo=0, maximo=1, timeout_espera=5)
+    ocupada = pool.adquirir()
+    threading.Timer(0.05, pool.liberar, (ocupada,)).start()
+    assert pool.adquirir(timeout=2) is ocupada
+
+
+def test_verifica_las_conexiones_inactivas_y_reemplaza_las_caidas():
+    fabrica = Fabrica()
+    pool = PoolConexiones(fabrica, minimo=0, maximo=2, intervalo_verificacion=0)
+    conexion = pool.adquirir()
+    pool.liberar(conexion)
+    conexion.caida = True
+    nueva = pool.adquirir()
+    assert nueva is not conexion and conexion.cerrada
+    stats = pool.estadisticas()
+    assert stats["verificaciones_fallidas"] == 1 and stats["descartadas"] == 1
+
+    # Una conexión sana pasa la verificación y se presta de nuevo
+    pool.liberar(nueva)
+    assert pool.adquirir() is nueva
+    assert "SELECT 1" in nueva.consultas
+
+
+def test_expulsa_inactivas_por_encima_del_minimo():
+    fabrica = Fabrica()
+    pool = PoolConexiones(fabrica, minimo=1, maximo=3, max_inactividad=0.01)
+    conexiones = [pool.adquirir() for _ in range(3)]
+    for conexion in conexiones:
+        pool.liberar(conexion)
+    time.sleep(0.03)
+    restante = pool.adquirir()
+    # Las dos más viejas salen; la que queda sigue cubriendo el mínimo
+    assert pool.estadisticas()["expulsadas"] == 2
+    assert sum(conexion.cerrada for conexion in conexiones) == 2
+    assert not restante.cerrada
+
+
+def test_descarta_la_conexion_si_el_rollback_falla():
+    fabrica = Fabrica()
+    pool = PoolConexiones(fabrica, minimo=0, maximo=1)
+    conexion = pool.adquirir()
+    conexion.caida = True
+    pool.liberar(conexion)
+    assert conexion.cerrada
+    assert pool.estadisticas()["inactivas"] == 0
+    assert pool.adquirir() is not conexion
+
+
+def test_un_error_al_crear_no_ocupa_lugar():
+    def fabrica():
+        raise RuntimeError("servidor no disponible")
+
+    pool = PoolConexiones(fabrica, minimo=0, maximo=1, timeout_espera=0.01)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            pool.adquirir()
+    assert pool.estadisticas()["en_uso"] == 0
+
+
+def test_pool_cerrado():
+    fabrica = Fabrica()
+    pool = PoolConexiones(fabrica, minimo=0, maximo=2)
+    conexion = pool.adquirir()
+    pool.liberar(pool.adquirir())
+    pool.cerrar()
+    assert fabrica.creadas[1].cerrada
+    with pytest.raises(PoolAgotado):
+        pool.adquirir()
+    # La que estaba prestada se cierra al volver
+    pool.liberar(conexion)
+    assert conexion.cerrada
+
+
+def test_base_asincrona_confirma_o_revierte_la_transaccion(crear_bd):
+    bd = crear_bd()
+    asyncio.run(bd.ejecutar("CREATE TABLE T (A INTEGER NOT NULL);"))
+
+    def insertar_y_fallar(cursor):
+        cursor.execute("INSERT INTO T VALUES (1);")
+        raise RuntimeError("falla a mitad")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(bd.transaccion(insertar_y_fallar))
+    assert asyncio.run(bd.consultar("SELECT COUNT(*) FROM T;"))[0][0] == 0
+
+    asyncio.run(bd.transaccion(lambda cursor: cursor.execute("INSERT INTO T VALUES (2);")))
+    assert asyncio.run(bd.consultar("SELECT A FROM T;")) == [(2,)]
+
+
+def test_base_asincrona_consulta_en_lotes(crear_bd):
+    bd = crear_bd()
+    asyncio.run(bd.ejecutar("CREATE TABLE T (A INTEGER NOT NULL);"))
+    asyncio.run(bd.transaccion(lambda cursor: cursor.executemany("INSERT INTO T VALUES (?);", [(i,) for i in range(25)])))
+
+    async def leer():
+        return [len(lote) async for lote in bd.consultar_en_lotes("SELECT A FROM T ORDER BY A;", tamano_lote=10)]
+
+    assert asyncio.run(leer()) == [10, 10, 5]
+    assert bd.pool.estadisticas()["en_uso"] == 0
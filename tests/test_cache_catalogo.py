@@ -0,0 +1,68 @@
+import asyncio
+
+from cache_catalogo import CacheCatalogo
+
+
+class Cargador:
+    def __init__(self):
+        self.cargas = 0
+
+    async def __call__(self):
+        self.cargas += 1
+        await asyncio.sleep(0.01)
+        return b'[{"id":%d}]' % self.cargas
+
+
+def fallos_concurrentes(cache, n=5):
+    async def todas():
+        return await asyncio.gather(*(cache.obtener() for _ in range(n)))
+    return asyncio.run(todas())
+
+
+def test_fallos_concurrentes_comparten_una_carga():
+    # Construida fuera del loop, como en main
+    cargar = Cargador()
+    cache = CacheCatalogo(cargar)
+    resultados = fallos_concurrentes(cache)
+    assert cargar.cargas == 1
+    assert len(set(resultados)) == 1
+    assert cache.fallos == 1 and cache.aciertos == 4
+
+
+def test_sirve_desde_otro_event_loop():
+    # Cada asyncio.run (o cada TestClient) es un loop nuevo; el candado no debe quedar ligado al primero
+    cargar = Cargador()
+    cache = CacheCatalogo(cargar)
+    fallos_concurrentes(cache)
+    cache.invalidar()
+    (cuerpo, _), *_ = fallos_concurrentes(cache)
+    assert cuerpo == b'[{"id":2}]'
+    assert cargar.cargas == 2
+
+
+def test_etag_cambia_con_el_contenido():
+    cache = CacheCatalogo(Cargador())
+    cuerpo, etag = asyncio.run(cache.obtener())
+    assert etag == CacheCatalogo.calcular_etag(cuerpo)
+    assert etag.startswith('"') and etag.endswith('"')
+    assert CacheCatalogo.calcular_etag(b"otro") != etag
+
+
+def test_expira_por_ttl():
+    cargar = Cargador()
+    cache = CacheCatalogo(cargar, ttl=0)
+    asyncio.run(cache.obtener())
+    asyncio.run(cache.obtener())
+    assert cargar.cargas == 2
+
+
+def test_una_invalidacion_durante_la_carga_no_guarda_el_resultado():
+    cache = None
+
+    async def cargar_e_invalidar():
+        cache.invalidar()
+        return b"[]"
+
+    cache = CacheCatalogo(cargar_e_invalidar)
+    assert asyncio.run(cache.obtener())[0] == b"[]"
+    assert cache._cuerpo is None
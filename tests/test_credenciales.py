@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+import credenciales
+from credenciales import HashSaturado, LimitadorIntentos, ServicioHash
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(credenciales.time, "monotonic", reloj)
+    return reloj
+
+
+@pytest.fixture
+def servicio():
+    servicio = ServicioHash(rondas=4, ttl_cache=60)
+    yield servicio
+    servicio.cerrar()
+
+
+def test_hashear_y_verificar(servicio):
+    async def escenario():
+        hash_guardado = await servicio.hashear("secreto")
+        return (
+            hash_guardado.startswith("$2"),
+            await servicio.verificar("secreto", hash_guardado),
+            await servicio.verificar("otro", hash_guardado),
+        )
+
+    assert asyncio.run(escenario()) == (True, True, False)
+
+
+def test_la_cache_evita_bcrypt_en_logins_repetidos(servicio, reloj):
+    async def escenario():
+        hash_guardado = await servicio.hashear("secreto")
+        hash_nuevo = await servicio.hashear("secreto")
+        assert await servicio.verificar("secreto", hash_guardado)
+        assert await servicio.verificar("secreto", hash_guardado)
+        assert servicio.estadisticas()["aciertos_cache"] == 1
+        # Otro hash (contraseña cambiada) no usa la entrada anterior
+        assert await servicio.verificar("secreto", hash_nuevo)
+        assert servicio.estadisticas()["aciertos_cache"] == 1
+        # Las verificaciones fallidas no se recuerdan
+        assert not await servicio.verificar("otro", hash_guardado)
+        assert not await servicio.verificar("otro", hash_guardado)
+        assert servicio.estadisticas()["aciertos_cache"] == 1
+        # Vencida la entrada se vuelve a pagar bcrypt
+        reloj.ahora += 61
+        assert await servicio.verificar("secreto", hash_guardado)
+        assert servicio.estadisticas()["aciertos_cache"] == 1
+        servicio.olvidar()
+        assert servicio.estadisticas()["en_cache"] == 0
+
+    asyncio.run(escenario())
+
+
+def test_la_cache_no_guarda_la_contrasena(servicio):
+    async def escenario():
+        hash_guardado = await servicio.hashear("secreto")
+        await servicio.verificar("secreto", hash_guardado)
+
+    asyncio.run(escenario())
+    (token,) = servicio._verificadas
+    assert b"secreto" not in token and len(token) == 32
+
+
+def test_rechaza_con_la_cola_llena():
+    servicio = ServicioHash(rondas=4, max_pendientes=0)
+    try:
+        with pytest.raises(HashSaturado):
+            asyncio.run(servicio.hashear("secreto"))
+        assert servicio.estadisticas()["rechazadas"] == 1
+    finally:
+        servicio.cerrar()
+
+
+def test_limitador_agota_y_repone_fichas(reloj):
+    limitador = LimitadorIntentos(capacidad=3, por_minuto=6)
+    assert [limitador.consumir("ana") for _ in range(3)] == [0, 0, 0]
+    # Una ficha cada 10 segundos
+    assert limitador.consumir("ana") == pytest.approx(10)
+    assert limitador.consumir("luis") == 0
+    reloj.ahora += 10
+    assert limitador.consumir("ana") == 0
+    assert limitador.consumir("ana") == pytest.approx(10)
+    # La cubeta no se llena por encima de la capacidad
+    reloj.ahora += 3600
+    assert [limitador.consumir("ana") for _ in range(4)][-1] > 0
+
+
+def test_limitador_olvida_las_llaves_menos_recientes(reloj):
+    limitador = LimitadorIntentos(capacidad=1, por_minuto=1, max_llaves=2)
+    limitador.consumir("a")
+    limitador.consumir("b")
+    limitador.consumir("a")  # "a" pasa a ser la más reciente
+    limitador.consumir("c")
+    assert list(limitador._cubetas) == ["a", "c"]
+    # "b" se olvidó: vuelve con la cubeta llena
+    assert limitador.consumir("b") == 0
@@ -0,0 +1,25 @@
+import sqlite3
+from datetime import date, datetime
+from decimal import Decimal
+
+from dialectos import SQLite
+
+
+def test_sqlite_convierte_fechas_y_decimales_por_conexion(tmp_path):
+    dialecto = SQLite()
+    adaptadores = dict(sqlite3.adapters)
+    conexion = dialecto.preparar(sqlite3.connect(str(tmp_path / "tienda.db"), **dialecto.opciones_conexion()))
+    conexion.execute("CREATE TABLE Ventas (Total NUMERIC, FechaVenta DATETIME, Fecha DATE, Nota TEXT);")
+    cursor = conexion.cursor()
+    cursor.execute(
+        "INSERT INTO Ventas VALUES (?, ?, ?, ?);",
+        (Decimal("10.50"), datetime(2024, 5, 1, 13, 30), date(2024, 5, 1), "2024-05-01"),
+    )
+    cursor.executemany("INSERT INTO Ventas VALUES (?, ?, ?, ?);", [(Decimal("1"), None, None, None)])
+
+    cursor.execute("SELECT Total, FechaVenta, Fecha, Nota FROM Ventas ORDER BY Total DESC;")
+    assert cursor.fetchone() == (10.5, datetime(2024, 5, 1, 13, 30), date(2024, 5, 1), "2024-05-01")
+    assert cursor.fetchall() == [(1, None, None, None)]
+    # Los adaptadores de sqlite3 son de todo el proceso: la conexión no los toca
+    assert dict(sqlite3.adapters) == adaptadores
+    conexion.close()
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+
+import pytest
+
+from escrituras import ColaEscrituras, _Segmento, insertar_filas
+
+
+@pytest.fixture
+def directorio(tmp_path):
+    return tmp_path / "spool"
+
+
+@pytest.fixture
+def bd(crear_bd):
+    bd = crear_bd()
+    with sqlite3.connect(bd.ruta) as conexion:
+        conexion.execute("CREATE TABLE Bitacora (Texto TEXT NOT NULL, Numero INTEGER);")
+    return bd
+
+
+def crear_cola(bd, directorio, **opciones):
+    opciones.setdefault("intervalo", 60)
+    cola = ColaEscrituras(bd, str(directorio), **opciones)
+    cola.registrar_tipo("bitacora", lambda cursor, filas: insertar_filas(cursor, "Bitacora", ["Texto", "Numero"], filas))
+    return cola
+
+
+def bitacora(bd):
+    return asyncio.run(bd.consultar("SELECT Texto, Numero FROM Bitacora ORDER BY rowid;"))
+
+
+def spool(directorio):
+    return sorted(os.listdir(directorio))
+
+
+def test_encola_en_disco_y_vacia_por_lotes(bd, directorio):
+    async def escenario():
+        cola = crear_cola(bd, directorio)
+        cola.iniciar()
+        for i in range(5):
+            cola.encolar("bitacora", f"evento {i}", i)
+        assert cola.profundidad() == 5
+        assert len(spool(directorio)) == 1
+        assert await cola.vaciar()
+        await cola.cerrar()
+        return cola.estadisticas()
+
+    stats = asyncio.run(escenario())
+    assert bitacora(bd) == [(f"evento {i}", i) for i in range(5)]
+    assert stats["escritos"] == 5 and stats["pendientes"] == 0
+    assert spool(directorio) == []
+
+
+def test_tipo_no_registrado(bd, directorio):
+    with pytest.raises(ValueError):
+        crear_cola(bd, directorio).encolar("desconocido", 1)
+
+
+def test_recupera_el_spool_de_un_proceso_terminado(bd, directorio):
+    # Segmento que dejó un proceso que murió a mitad de escribir la última línea
+    directorio.mkdir()
+    with open(directorio / "4242-0.spool", "w", encoding="utf-8") as archivo:
+        archivo.write(json.dumps(["bitacora", ["antes de morir", 1]]) + "\n")
+        archivo.write(json.dumps(["bitacora", ["también", 2]]) + "\n")
+        archivo.write('["bitacora", ["a me')
+
+    async def escenario():
+        cola = crear_cola(bd, directorio)
+        cola.iniciar()
+        recuperados = cola.estadisticas()["recuperados"]
+        await cola.cerrar()
+        return recuperados
+
+    assert asyncio.run(escenario()) == 2
+    assert bitacora(bd) == [("antes de morir", 1), ("también", 2)]
+    assert spool(directorio) == []
+
+
+def test_no_toma_el_spool_de_un_proceso_vivo(bd, directorio):
+    pytest.importorskip("fcntl")
+    directorio.mkdir()
+    vivo = _Segmento.nuevo(str(directorio / "1-0.spool"))
+    vivo.agregar(["bitacora", ["de otro worker", 1]])
+
+    async def escenario():
+        cola = crear_cola(bd, directorio)
+        cola.iniciar()
+        await cola.cerrar()
+        return cola.estadisticas()["recuperados"]
+
+    assert asyncio.run(escenario()) == 0
+    assert bitacora(bd) == []
+    assert spool(directorio) == ["1-0.spool"]
+    vivo.descartar()
+
+
+def test_si_la_base_falla_el_segmento_se_conserva(bd, directorio):
+    with sqlite3.connect(bd.ruta) as conexion:
+        conexion.execute("ALTER TABLE Bitacora RENAME TO Pausada;")
+
+    async def sin_tabla():
+        cola = crear_cola(bd, directorio)
+        cola.iniciar()
+        cola.encolar("bitacora", "pendiente", 1)
+        assert not await cola.vaciar()
+        await cola.cerrar()
+
+    asyncio.run(sin_tabla())
+    assert len(spool(directorio)) == 1
+
+    # Otro proceso (o el reinicio) lo escribe cuando la base vuelve
+    with sqlite3.connect(bd.ruta) as conexion:
+        conexion.execute("ALTER TABLE Pausada RENAME TO Bitacora;")
+
+    async def reinicio():
+        cola = crear_cola(bd, directorio)
+        cola.iniciar()
+        await cola.cerrar()
+
+    asyncio.run(reinicio())
+    assert bitacora(bd) == [("pendiente", 1)]
+    assert spool(directorio) == []
+
+
+def test_aparta_el_segmento_que_siempre_falla(bd, directorio):
+    async def escenario():
+        cola = crear_cola(bd, directorio, max_fallos=2)
+        cola.iniciar()
+        cola.encolar("bitacora", None, 1)  # viola NOT NULL
+        assert not await cola.vaciar()
+        cola.encolar("bitacora", "después", 2)
+        assert await cola.vaciar()
+        await cola.cerrar()
+        return cola.estadisticas()
+
+    stats = asyncio.run(escenario())
+    assert bitacora(bd) == [("después", 2)]
+    assert stats["apartados"] == 1
+    (muerto,) = spool(directorio)
+    assert muerto.endswith(".muerto")
+    with open(directorio / muerto, encoding="utf-8") as archivo:
+        assert [json.loads(linea) for linea in archivo] == [["bitacora", [None, 1]]]
+
+
+def test_fsync_en_un_hilo_agrupando_registros(bd, directorio, monkeypatch):
+    hilos = []
+
+    def fsync(fd):
+        hilos.append(threading.current_thread())
+
+    monkeypatch.setattr(os, "fsync", fsync)
+
+    async def escenario():
+        cola = crear_cola(bd, directorio, sincronizar=True)
+        cola.iniciar()
+        for i in range(5):
+            cola.encolar("bitacora", f"evento {i}", i)
+        # encolar no llama a fsync: queda para la tarea de fondo
+        assert hilos == []
+        await cola.vaciar()
+        await cola.cerrar()
+
+    asyncio.run(escenario())
+    assert bitacora(bd) == [(f"evento {i}", i) for i in range(5)]
+    assert len(hilos) == 1 and hilos[0] is not threading.main_thread()
+
+
+def test_insertar_filas_respeta_el_limite_de_parametros():
+    class CursorAnotador:
+        def __init__(self):
+            self.sentencias = []
+
+        def execute(self, sql, params):
+            self.sentencias.append(len(params))
+
+    cursor = CursorAnotador()
+    insertar_filas(cursor, "Bitacora", ["Texto", "Numero"], [("x", i) for i in range(25)], max_parametros=20)
+    assert cursor.sentencias == [20, 20, 10]
@@ -0,0 +1,15 @@
+import sqlite3
+
+import esquema
+
+
+def test_crear_se_puede_repetir(tmp_path):
+    ruta = tmp_path / "tienda.db"
+    esquema.crear(f"sqlite:///{ruta}")
+    with sqlite3.connect(ruta) as conexion:
+        conexion.execute("DROP INDEX IX_Productos_Precio;")
+    esquema.crear(f"sqlite:///{ruta}")
+
+    with sqlite3.connect(ruta) as conexion:
+        indices = {fila[0] for fila in conexion.execute("SELECT name FROM sqlite_master WHERE type = 'index';")}
+    assert {"IX_Productos_Precio", "IX_Pedidos_Fecha", "IX_Productos_NombreUnico"} <= indices
@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+from eventos import BusEventos, Evento, Suscripcion
+
+
+def pendientes(suscripcion):
+    """Vacía la suscripción sin esperar: `(id, tema, tipo)` de cada evento."""
+    async def leer():
+        eventos = []
+        while True:
+            evento = await suscripcion.siguiente(0.01)
+            if evento is None:
+                return eventos
+            eventos.append((evento.id, evento.tema, evento.datos["tipo"]))
+
+    return asyncio.run(leer())
+
+
+def test_evento_serializado():
+    evento = Evento(7, "stock", {"tipo": "cambio", "producto_id": 3, "stock": 9})
+    assert json.loads(evento.json()) == {"id": 7, "tema": "stock", "tipo": "cambio", "producto_id": 3, "stock": 9}
+    assert evento.sse().startswith(b"id: 7\nevent: stock\ndata: {")
+    assert evento.sse().endswith(b"}\n\n")
+
+
+def test_entrega_solo_los_temas_y_el_filtro_suscritos():
+    bus = BusEventos()
+    catalogo = bus.suscribir(["catalogo", "stock"])
+    mis_pedidos = bus.suscribir(["pedidos"], filtro=lambda evento: evento.datos.get("cliente_id") == 1)
+    bus.publicar("stock", "cambio", producto_id=1, stock=5)
+    bus.publicar("pedidos", "nuevo", cliente_id=2)
+    bus.publicar("pedidos", "nuevo", cliente_id=1)
+    bus.publicar("catalogo", "alta", producto_id=9)
+
+    assert pendientes(catalogo) == [(1, "stock", "cambio"), (4, "catalogo", "alta")]
+    assert pendientes(mis_pedidos) == [(3, "pedidos", "nuevo")]
+    assert bus.estadisticas()["publicados"] == 4
+
+
+def test_compacta_por_clave_antes_de_resincronizar():
+    suscripcion = Suscripcion(["stock"], maximo=3)
+    for i, producto in enumerate([1, 2, 1, 1], start=1):
+        suscripcion.entregar(Evento(i, "stock", {"tipo": "cambio", "producto_id": producto}, clave=("stock", producto)))
+    # Al llenarse se quita el evento del producto 1 que ya superó otro más nuevo
+    assert pendientes(suscripcion) == [(2, "stock", "cambio"), (3, "stock", "cambio"), (4, "stock", "cambio")]
+    assert suscripcion.descartados == 1
+
+
+def test_resincroniza_si_la_cola_no_cabe():
+    suscripcion = Suscripcion(["pedidos"], maximo=3)
+    for i in range(1, 5):
+        suscripcion.entregar(Evento(i, "pedidos", {"tipo": "nuevo"}))
+    assert pendientes(suscripcion) == [(4, "sistema", "resincronizar")]
+    assert suscripcion.descartados == 4
+
+
+def test_suscribir_desde_reenvia_lo_perdido():
+    bus = BusEventos(historial=3)
+    for producto in range(1, 6):
+        bus.publicar("stock", "cambio", producto_id=producto)
+
+    # Lo posterior al id 3 sigue en el historial (3, 4 y 5)
+    assert pendientes(bus.suscribir(["stock"], desde=3)) == [(4, "stock", "cambio"), (5, "stock", "cambio")]
+    assert pendientes(bus.suscribir(["stock"], desde=2)) == [(3, "stock", "cambio"), (4, "stock", "cambio"), (5, "stock", "cambio")]
+    # El historial ya no llega tan atrás
+    assert pendientes(bus.suscribir(["stock"], desde=1)) == [(5, "sistema", "resincronizar")]
+    # Id de otro proceso o de antes de un reinicio
+    assert pendientes(bus.suscribir(["stock"], desde=99)) == [(5, "sistema", "resincronizar")]
+    assert pendientes(bus.suscribir(["stock"], desde=5)) == []
+
+
+def test_cancelar_cierra_y_acumula_descartados():
+    bus = BusEventos(max_pendientes=1)
+    suscripcion = bus.suscribir(["stock"])
+    bus.publicar("stock", "cambio")
+    bus.publicar("stock", "cambio")
+    assert bus.estadisticas() == {"publicados": 2, "descartados": 2, "suscripciones": 1}
+    bus.cancelar(suscripcion)
+    assert suscripcion.cerrada
+    assert asyncio.run(suscripcion.siguiente(1)) is None
+    assert bus.estadisticas() == {"publicados": 2, "descartados": 2, "suscripciones": 0}
@@ -0,0 +1,103 @@
+import json
+import sqlite3
+from decimal import Decimal
+
+import pytest
+
+from dialectos import SQLite
+from importacion import ArchivoInvalido, ImportadorProductos, leer_filas, validar
+
+
+@pytest.fixture
+def conexion(tmp_path):
+    dialecto = SQLite()
+    conexion = dialecto.preparar(sqlite3.connect(str(tmp_path / "tienda.db"), **dialecto.opciones_conexion()))
+    conexion.execute(
+        "CREATE TABLE Productos (ProductoID INTEGER PRIMARY KEY, Nombre TEXT NOT NULL, "
+        "Precio NUMERIC NOT NULL, Stock INTEGER NOT NULL, Imagen TEXT);"
+    )
+    conexion.execute("INSERT INTO Productos VALUES (1, 'Taza', 50, 3, 'taza.webp');")
+    yield conexion
+    conexion.close()
+
+
+def test_leer_filas_csv():
+    contenido = "﻿Nombre, Precio ,stock\nTaza,10.5,3\n".encode("utf-8")
+    assert leer_filas(contenido, "catalogo.csv") == [{"nombre": "Taza", "precio": "10.5", "stock": "3"}]
+
+
+def test_leer_filas_json():
+    productos = [{"nombre": "Taza", "precio": 10, "stock": 3}]
+    assert leer_filas(json.dumps(productos).encode(), "catalogo.json") == productos
+    assert leer_filas(json.dumps({"productos": productos}).encode(), tipo_contenido="application/json") == productos
+
+
+@pytest.mark.parametrize("contenido, nombre_archivo", [
+    ("nombre,precio".encode("utf-16"), "catalogo.csv"),
+    (b"precio,stock\n1,2\n", "catalogo.csv"),
+    (b"{no es json", "catalogo.json"),
+    (b'{"productos": [1, 2]}', "catalogo.json"),
+])
+def test_leer_filas_invalidas(contenido, nombre_archivo):
+    with pytest.raises(ArchivoInvalido):
+        leer_filas(contenido, nombre_archivo)
+
+
+def test_validar_separa_errores_por_fila():
+    filas = [
+        {"nombre": " Taza ", "precio": "10.499", "stock": "3", "imagen": "taza.webp"},
+        {"nombre": "", "precio": "1", "stock": "1"},
+        {"nombre": "x" * 101, "precio": "1", "stock": "1"},
+        {"nombre": "TAZA", "precio": "1", "stock": "1"},
+        {"nombre": "Plato", "precio": "-1", "stock": "1"},
+        {"nombre": "Vaso", "precio": "NaN", "stock": "1"},
+        {"nombre": "Jarra", "precio": "1", "stock": "dos"},
+        {"nombre": "Cuchara", "precio": "1", "stock": "1", "imagen": "falta.webp"},
+        {"nombre": "Tenedor", "precio": 2, "stock": 0},
+    ]
+    validas, errores = validar(filas, imagenes_disponibles={"taza.webp"})
+    assert validas == [
+        (1, "Taza", Decimal("10.50"), 3, "taza.webp"),
+        (9, "Tenedor", Decimal("2.00"), 0, None),
+    ]
+    assert [(error["fila"], error["error"]) for error in errores] == [
+        (2, "Falta el nombre"),
+        (3, "El nombre excede 100 caracteres"),
+        (4, "Nombre repetido en la fila 1"),
+        (5, "Precio inválido"),
+        (6, "Precio inválido"),
+        (7, "Stock inválido"),
+        (8, "La imagen falta.webp no se incluyó en la carga"),
+    ]
+
+
+def test_aplicar_actualiza_e_inserta(conexion):
+    importador = ImportadorProductos(SQLite())
+    filas = [
+        (1, "Taza", Decimal("12.00"), 7, None),
+        (2, "Plato", Decimal("30.00"), 4, "plato.webp"),
+        (3, "Vaso", Decimal("8.50"), 0, None),
+    ]
+    resultados = importador.aplicar(conexion.cursor(), filas)
+    conexion.commit()
+
+    ids = {resultado["nombre"]: resultado["id"] for resultado in resultados}
+    assert [(r["fila"], r["accion"]) for r in sorted(resultados, key=lambda r: r["fila"])] == [
+        (1, "actualizado"), (2, "insertado"), (3, "insertado"),
+    ]
+    assert ids["Taza"] == 1
+    assert conexion.execute("SELECT ProductoID, Nombre, Precio, Stock, Imagen FROM Productos ORDER BY ProductoID;").fetchall() == [
+        (1, "Taza", 12, 7, "taza.webp"),
+        (ids["Plato"], "Plato", 30, 4, "plato.webp"),
+        (ids["Vaso"], "Vaso", 8.5, 0, None),
+    ]
+
+
+def test_lotes_respetan_el_limite_de_parametros():
+    # 4 parámetros por fila en el INSERT: 2000 // 4 = 500 filas por sentencia como máximo
+    assert ImportadorProductos(SQLite(), tamano_lote=5000).tamano_lote == 500
+    assert ImportadorProductos(SQLite(), tamano_lote=5000, max_parametros=20).tamano_lote == 5
+    assert ImportadorProductos(SQLite(), tamano_lote=0).tamano_lote == 1
+
+    importador = ImportadorProductos(SQLite(), tamano_lote=2000, max_parametros=20)
+    assert [len(lote) for lote in importador.lotes(list(range(12)))] == [5, 5, 2]
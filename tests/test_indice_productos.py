@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+from indice_productos import IndiceProductos, _Datos, normalizar
+
+PRODUCTOS = [
+    (1, "Teléfono Rojo", 100, 5, None),
+    (2, "Teléfono", 90, 3, None),
+    (3, "Funda para teléfono", 10, 50, "funda.webp"),
+    (4, "Cargador rápido", 25, 0, None),
+    (5, "Telefonía fija", 300, 1, None),
+]
+
+
+def crear_indice(filas=PRODUCTOS, **opciones):
+    async def cargar():
+        return list(filas)
+
+    indice = IndiceProductos(cargar, **opciones)
+    asyncio.run(indice.recargar())
+    return indice
+
+
+def ids(resultados):
+    return [fila[0] for fila in resultados]
+
+
+def test_normalizar():
+    assert normalizar("  Teléfono   ROJO ") == "telefono rojo"
+    assert normalizar("Ñandú") == "nandu"
+
+
+def test_por_id_y_por_nombre():
+    indice = crear_indice()
+    assert len(indice) == 5
+    assert indice.por_id(3) == PRODUCTOS[2]
+    assert indice.por_nombre("Cargador rápido") == PRODUCTOS[3]
+    assert indice.por_nombre("cargador rápido") is None
+    assert indice.por_id(99) is None
+
+
+def test_buscar_ordena_exacto_prefijo_y_palabras():
+    indice = crear_indice()
+    # Exacto, luego los que empiezan con el texto, los que lo tienen en otra palabra y
+    # al final los parecidos por trigramas
+    assert ids(indice.buscar("telefono")) == [2, 1, 3, 5]
+    assert ids(indice.buscar("TELÉF")) == [2, 1, 5, 3]
+    # Cada palabra buscada debe ser prefijo de alguna palabra del nombre, en cualquier orden
+    assert ids(indice.buscar("rojo tel")) == [1]
+    assert ids(indice.buscar("car ráp")) == [4]
+    assert indice.buscar("  ") == []
+    assert ids(indice.buscar("tel", limite=2)) == [2, 1]
+
+
+def test_buscar_tolera_errores_de_dedo():
+    indice = crear_indice()
+    assert ids(indice.buscar("cargdor rapido")) == [4]
+    assert indice.buscar("zzzz") == []
+
+
+def test_poner_y_quitar_actualizan_la_busqueda():
+    indice = crear_indice()
+    indice.poner(1, "Audífonos", 100, 5, None)
+    assert indice.por_nombre("Teléfono Rojo") is None
+    assert indice.por_nombre("Audífonos")[0] == 1
+    assert ids(indice.buscar("rojo")) == []
+    assert ids(indice.buscar("audi")) == [1]
+
+    indice.quitar(3)
+    assert indice.por_id(3) is None
+    assert ids(indice.buscar("funda")) == []
+    assert ids(indice.buscar("telefono")) == [2, 5]
+    indice.quitar(3)  # quitar dos veces no falla
+
+    indice.fijar_stock(2, 7)
+    assert indice.por_id(2)[3] == 7
+
+
+def test_los_cambios_incrementales_equivalen_a_construir():
+    incremental = _Datos()
+    for fila in PRODUCTOS:
+        incremental.poner(fila)
+    incremental.quitar(4)
+    completo = _Datos.construir([fila for fila in PRODUCTOS if fila[0] != 4])
+    assert incremental.palabras == completo.palabras
+    assert incremental.trigramas == completo.trigramas
+    assert incremental.por_nombre == completo.por_nombre
+
+
+def test_conserva_los_cambios_hechos_durante_una_recarga():
+    continuar = None
+
+    async def cargar():
+        await continuar.wait()
+        return list(PRODUCTOS)
+
+    async def escenario():
+        nonlocal continuar
+        continuar = asyncio.Event()
+        indice = IndiceProductos(cargar)
+        recarga = asyncio.get_running_loop().create_task(indice.recargar())
+        await asyncio.sleep(0)
+        # Llegan mientras la base todavía responde con la foto anterior
+        indice.poner(6, "Cable USB", 5, 10, None)
+        indice.quitar(4)
+        continuar.set()
+        await recarga
+        return indice
+
+    indice = asyncio.run(escenario())
+    assert indice.por_nombre("Cable USB")[0] == 6
+    assert indice.por_id(4) is None
+    assert len(indice) == 5
+
+
+@pytest.mark.parametrize("falla", [True, False])
+def test_asegurar_carga_una_vez(falla):
+    llamadas = []
+
+    async def cargar():
+        llamadas.append(1)
+        if falla:
+            raise RuntimeError("sin base")
+        return list(PRODUCTOS)
+
+    async def escenario():
+        indice = IndiceProductos(cargar, ttl=300)
+        await indice.asegurar()
+        await indice.asegurar()
+        return indice
+
+    indice = asyncio.run(escenario())
+    # Si la carga falla no se reintenta en cada petición; se espera un momento
+    assert len(llamadas) == 1
+    assert len(indice) == (0 if falla else 5)
@@ -0,0 +1,158 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from inventario import ProductoNoEncontrado, ReservadorStock, StockInsuficiente, es_reintentable
+
+
+@pytest.fixture
+def bd(crear_bd):
+    bd = crear_bd(maximo=8)
+    with sqlite3.connect(bd.ruta) as conexion:
+        conexion.execute("CREATE TABLE Productos (ProductoID INTEGER PRIMARY KEY, Stock INTEGER NOT NULL);")
+        conexion.execute("CREATE TABLE Pedidos (ProductoID INTEGER NOT NULL, Cantidad INTEGER NOT NULL);")
+        conexion.execute("INSERT INTO Productos VALUES (1, 10);")
+    return bd
+
+
+def registrar(producto_id, cantidad):
+    def insertar(cursor):
+        cursor.execute("INSERT INTO Pedidos VALUES (?, ?);", (producto_id, cantidad))
+        return "registrado"
+    return insertar
+
+
+def stock(bd):
+    return asyncio.run(bd.consultar("SELECT Stock FROM Productos WHERE ProductoID = 1;"))[0][0]
+
+
+def pedidos(bd):
+    return asyncio.run(bd.consultar("SELECT COUNT(*) FROM Pedidos;"))[0][0]
+
+
+def test_descuenta_y_registra_en_la_misma_transaccion(bd):
+    reservador = ReservadorStock(bd)
+    assert asyncio.run(reservador.reservar(1, 4, registrar(1, 4))) == "registrado"
+    assert stock(bd) == 6 and pedidos(bd) == 1
+    assert reservador.estadisticas()["reservas"] == 1
+
+
+def test_stock_insuficiente_no_registra_nada(bd):
+    reservador = ReservadorStock(bd)
+    with pytest.raises(StockInsuficiente):
+        asyncio.run(reservador.reservar(1, 11, registrar(1, 11)))
+    assert stock(bd) == 10 and pedidos(bd) == 0
+    assert reservador.estadisticas()["stock_insuficiente"] == 1
+
+
+def test_producto_inexistente(bd):
+    with pytest.raises(ProductoNoEncontrado):
+        asyncio.run(ReservadorStock(bd).reservar(99, 1, registrar(99, 1)))
+    assert pedidos(bd) == 0
+
+
+def test_si_registrar_falla_se_revierte_el_descuento(bd):
+    def fallar(cursor):
+        raise ValueError("cliente inexistente")
+
+    reservador = ReservadorStock(bd)
+    with pytest.raises(ValueError):
+        asyncio.run(reservador.reservar(1, 3, fallar))
+    assert stock(bd) == 10
+    assert reservador.estadisticas()["fallidas"] == 1
+
+
+def test_compradores_concurrentes_no_venden_de_mas(bd):
+    reservador = ReservadorStock(bd, max_reintentos=20, espera_base=0.001)
+
+    async def comprar():
+        try:
+            await reservador.reservar(1, 1, registrar(1, 1))
+            return True
+        except StockInsuficiente:
+            return False
+
+    async def todos():
+        return await asyncio.gather(*(comprar() for _ in range(25)))
+
+    resultados = asyncio.run(todos())
+    assert sum(resultados) == 10
+    assert stock(bd) == 0 and pedidos(bd) == 10
+
+
+class ErrorInterbloqueo(Exception):
+    def __init__(self):
+        super().__init__("40001", "[40001] Transaction was deadlocked (1205)")
+
+
+class BaseConInterbloqueos:
+    """Transacciones que fallan por interbloqueo las primeras `fallos` veces."""
+
+    def __init__(self, fallos):
+        self.fallos = fallos
+        self.intentos = 0
+
+    async def transaccion(self, funcion):
+        self.intentos += 1
+        if self.intentos <= self.fallos:
+            raise ErrorInterbloqueo()
+        return "registrado"
+
+
+def test_reintenta_los_interbloqueos():
+    base = BaseConInterbloqueos(fallos=2)
+    reservador = ReservadorStock(base, max_reintentos=5, espera_base=0.001)
+    assert asyncio.run(reservador.reservar(1, 1, registrar(1, 1))) == "registrado"
+    assert base.intentos == 3
+    stats = reservador.estadisticas()
+    assert stats["reintentos"] == 2 and stats["interbloqueos"] == 2 and stats["reservas"] == 1
+
+
+def test_deja_de_reintentar_tras_el_maximo():
+    base = BaseConInterbloqueos(fallos=10)
+    reservador = ReservadorStock(base, max_reintentos=3, espera_base=0.001)
+    with pytest.raises(ErrorInterbloqueo):
+        asyncio.run(reservador.reservar(1, 1, registrar(1, 1)))
+    assert base.intentos == 4
+    assert reservador.estadisticas()["fallidas"] == 1
+
+
+def test_no_reintenta_otros_errores():
+    class BaseRota:
+        intentos = 0
+
+        async def transaccion(self, funcion):
+            self.intentos += 1
+            raise sqlite3.IntegrityError("UNIQUE constraint failed")
+
+    base = BaseRota()
+    with pytest.raises(sqlite3.IntegrityError):
+        asyncio.run(ReservadorStock(base, espera_base=0.001).reservar(1, 1, registrar(1, 1)))
+    assert base.intentos == 1
+
+
+class ErrorODBC(Exception):
+    """Como pyodbc.Error: `args` es (SQLSTATE, mensaje)."""
+
+
+@pytest.mark.parametrize("error, reintentar", [
+    (ErrorODBC("40001", "[40001] [SQL Server]Transaction (Process ID 52) was deadlocked (1205) (SQLExecDirectW)"), True),
+    (ErrorODBC("HY000", "[HY000] [SQL Server]Transaction was deadlocked (1205) (SQLExecDirectW)"), True),
+    # Un valor que contiene 1205 no es un interbloqueo
+    (ErrorODBC("23000", "[23000] Cannot insert duplicate key. The duplicate key value is (1205). (2627) (SQLExecDirectW)"), False),
+    (ErrorODBC("HY000", "[HY000] Producto 1205 no encontrado (50000) (SQLExecDirectW)"), False),
+    (ErrorODBC("42S02", "[42S02] Invalid object name 'Deadlocks'. (208) (SQLExecDirectW)"), False),
+    (sqlite3.OperationalError("database is locked"), True),
+    (sqlite3.OperationalError("no such table: Pedidos_1205"), False),
+    (sqlite3.IntegrityError("UNIQUE constraint failed: Productos.Nombre"), False),
+    (ValueError("deadlock 1205"), False),
+])
+def test_es_reintentable(error, reintentar):
+    assert es_reintentable(error) is reintentar
+
+
+def test_es_reintentable_con_sqlstate_de_psycopg2():
+    error = Exception("could not serialize access")
+    error.pgcode = "40001"
+    assert es_reintentable(error)
@@ -0,0 +1,26 @@
+import asyncio
+import sqlite3
+
+from consultas import UNA, Consulta
+from metricas import Metricas
+
+
+def test_consultas_etiquetadas_por_nombre_y_no_por_sql(crear_bd):
+    metricas = Metricas()
+    bd = crear_bd()
+    bd.observador = metricas
+    with sqlite3.connect(bd.ruta) as conexion:
+        conexion.execute("CREATE TABLE Productos (ProductoID INTEGER PRIMARY KEY, Nombre TEXT);")
+    por_id = Consulta("producto_por_id", "SELECT Nombre FROM Productos WHERE ProductoID = ?;", [None], UNA)
+
+    async def escenario():
+        await bd.correr(por_id, (1,))
+        for limite in (5, 10, 20):
+            await bd.consultar(f"SELECT Nombre FROM Productos LIMIT {limite};")
+
+    asyncio.run(escenario())
+    texto = metricas.exponer()
+    assert 'bd_consulta_duracion_segundos_count{operacion="correr",consulta="producto_por_id"} 1' in texto
+    # Las consultas sin nombre comparten una sola serie por operación
+    assert 'bd_consulta_duracion_segundos_count{operacion="consultar",consulta="sin_nombre"} 3' in texto
+    assert "Productos" not in texto
@@ -0,0 +1,114 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from dialectos import SQLServer, SQLite
+from paginacion import ConsultaPaginada, CursorInvalido, codificar_cursor, decodificar_cursor, filtro_prefijo
+
+
+@pytest.fixture
+def conexion():
+    conexion = sqlite3.connect(":memory:", detect_types=sqlite3.PARSE_DECLTYPES)
+    conexion.execute(
+        "CREATE TABLE Productos (ProductoID INTEGER PRIMARY KEY, Nombre TEXT, Precio NUMERIC, Alta TIMESTAMP);"
+    )
+    inicio = datetime(2024, 1, 1)
+    # Precios y fechas repetidos: el desempate por ProductoID decide el orden
+    conexion.executemany(
+        "INSERT INTO Productos VALUES (?, ?, ?, ?);",
+        [(i, f"Producto {i:02d}", 10 + i % 4, (inicio + timedelta(days=i % 3)).isoformat(" ")) for i in range(1, 24)],
+    )
+    yield conexion
+    conexion.close()
+
+
+def consulta_productos():
+    return ConsultaPaginada(
+        ["ProductoID", "Nombre", "Precio", "Alta"],
+        "Productos",
+        "ProductoID",
+        {"id": "ProductoID", "nombre": "Nombre", "precio": "Precio", "alta": "Alta"},
+        SQLite(),
+        columnas_fecha=["Alta"],
+    )
+
+
+def recorrer(conexion, consulta, orden, limite, filtros=()):
+    """Todas las páginas siguiendo `siguiente`; devuelve los ids en orden y cuántas páginas hubo."""
+    ids, after, paginas = [], None, 0
+    while True:
+        sql, params = consulta.construir(list(filtros), orden, limite, after)
+        filas = conexion.execute(sql, params).fetchall()
+        pagina = consulta.pagina(filas, orden, limite, lambda filas: [fila[0] for fila in filas])
+        assert len(pagina["resultados"]) <= limite
+        ids.extend(pagina["resultados"])
+        paginas += 1
+        after = pagina["siguiente"]
+        if after is None:
+            return ids, paginas
+
+
+@pytest.mark.parametrize("orden", ["id", "-id", "nombre", "precio", "-precio", "alta", "-alta"])
+@pytest.mark.parametrize("limite", [1, 5, 23, 100])
+def test_las_paginas_cubren_todo_sin_repetir(conexion, orden, limite):
+    consulta = consulta_productos()
+    sql, params = consulta.construir([], orden, None)
+    esperado = [fila[0] for fila in conexion.execute(sql, params).fetchall()]
+    ids, paginas = recorrer(conexion, consulta, orden, limite)
+    assert ids == esperado
+    assert len(ids) == 23
+    assert paginas == max(1, -(-23 // limite))
+
+
+def test_empates_se_desempatan_por_id(conexion):
+    ids, _ = recorrer(conexion, consulta_productos(), "-precio", 3)
+    precios = dict(conexion.execute("SELECT ProductoID, Precio FROM Productos;").fetchall())
+    assert ids == sorted(ids, key=lambda producto_id: (-precios[producto_id], -producto_id))
+
+
+def test_filtros_se_combinan_con_el_cursor(conexion):
+    filtros = [("Precio >= ?", (12,)), filtro_prefijo("Nombre", "Producto 1")]
+    ids, _ = recorrer(conexion, consulta_productos(), "precio", 2, filtros)
+    assert sorted(ids) == [i for i in range(10, 20) if 10 + i % 4 >= 12]
+
+
+def test_filtro_prefijo_escapa_comodines(conexion):
+    conexion.execute("INSERT INTO Productos VALUES (100, 'Oferta 50%_x', 1, NULL);")
+    condicion, params = filtro_prefijo("Nombre", "Oferta 50%_")
+    filas = conexion.execute(f"SELECT ProductoID FROM Productos WHERE {condicion};", params).fetchall()
+    assert filas == [(100,)]
+    condicion, params = filtro_prefijo("Nombre", "%")
+    assert conexion.execute(f"SELECT ProductoID FROM Productos WHERE {condicion};", params).fetchall() == []
+
+
+def test_cursor_ida_y_vuelta():
+    fecha = datetime(2024, 5, 1, 12, 30)
+    assert decodificar_cursor(codificar_cursor([fecha, 7])) == [fecha.isoformat(), 7]
+
+
+@pytest.mark.parametrize("orden, cursor", [
+    ("precio", "no-es-base64!"),
+    ("precio", codificar_cursor([1, 2])[:-2] + "xx"),
+    ("precio", "WzEsMiwzXQ"),
+    # Cursores de fecha alterados: texto que no es fecha y un valor que no es texto
+    ("alta", codificar_cursor(["ayer", 3])),
+    ("-alta", codificar_cursor([20240101, 3])),
+    ("alta", codificar_cursor([["2024-01-01"], 3])),
+])
+def test_cursor_invalido(conexion, orden, cursor):
+    with pytest.raises(CursorInvalido):
+        consulta_productos().construir([], orden, 5, cursor)
+
+
+def test_orden_no_soportado():
+    with pytest.raises(CursorInvalido):
+        consulta_productos().construir([], "stock", 5)
+
+
+def test_limite_en_sql_server():
+    sql, _ = ConsultaPaginada(["ProductoID"], "Productos", "ProductoID", {"id": "ProductoID"}, SQLServer()).construir(
+        [], "id", 10
+    )
+    assert sql.startswith("SELECT TOP (11) ProductoID ")
+    assert "LIMIT" not in sql
@@ -0,0 +1,54 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from dialectos import SQLite
+from panel import ServicioPanel
+
+
+@pytest.fixture
+def bd(crear_bd):
+    bd = crear_bd()
+    with sqlite3.connect(bd.ruta) as conexion:
+        conexion.executescript("""
+            CREATE TABLE Productos (ProductoID INTEGER PRIMARY KEY, Nombre TEXT, Stock INTEGER);
+            CREATE TABLE Clientes (ClienteID INTEGER PRIMARY KEY);
+            CREATE TABLE Pedidos (PedidoID INTEGER PRIMARY KEY, ProductoID INTEGER, FechaCompra TEXT);
+            INSERT INTO Productos VALUES (1, 'Teclado', 5), (2, 'Ratón', 7);
+            INSERT INTO Clientes VALUES (1), (2), (3);
+            INSERT INTO Pedidos VALUES (1, 1, '2024-01-15 10:00:00'), (2, 1, '2024-03-02 09:00:00'),
+                                       (3, 2, '2024-03-20 18:30:00');
+        """)
+    return bd
+
+
+def varias_a_la_vez(servicio, n=4):
+    async def todas():
+        return await asyncio.gather(*(servicio.obtener() for _ in range(n)))
+    return asyncio.run(todas())
+
+
+def test_calcula_panel_y_graficas(bd):
+    datos = asyncio.run(ServicioPanel(bd, SQLite()).obtener())
+    assert datos["panel"] == {"productos": 2, "stock": 12, "clientes": 3, "pedidos": 3}
+    assert datos["graficas"]["categoriasBarras"] == ["Enero", "Marzo"]
+    assert datos["graficas"]["barras"] == [1, 2]
+    assert dict(zip(datos["graficas"]["categoriasPastel"], datos["graficas"]["pastel"])) == {"Teclado": 2, "Ratón": 1}
+
+
+def test_peticiones_concurrentes_comparten_un_calculo_en_cualquier_loop(bd):
+    # Construido fuera del loop, como en main; cada asyncio.run es un loop distinto
+    servicio = ServicioPanel(bd, SQLite())
+    calculos = []
+    calcular = servicio._calcular
+
+    async def contar():
+        calculos.append(1)
+        return await calcular()
+
+    servicio._calcular = contar
+    assert len({id(datos) for datos in varias_a_la_vez(servicio)}) == 1
+    servicio.invalidar()
+    varias_a_la_vez(servicio)
+    assert len(calculos) == 2
@@ -0,0 +1,122 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from replicas import LecturasEnrutadas
+
+QUERY_ORIGEN = "SELECT Origen FROM Datos;"
+
+
+def preparar(bd, origen):
+    conexion = sqlite3.connect(bd.ruta)
+    conexion.execute("CREATE TABLE Datos (Origen TEXT NOT NULL);")
+    conexion.execute("INSERT INTO Datos VALUES (?);", (origen,))
+    conexion.commit()
+    conexion.close()
+
+
+def atrasar_replica(replica, atraso):
+    """Deja en la réplica un latido de hace `atraso` segundos, como si la replicación fuera atrasada."""
+    with sqlite3.connect(replica.ruta) as conexion:
+        conexion.execute("CREATE TABLE IF NOT EXISTS LatidoReplicacion (LatidoID INTEGER PRIMARY KEY, Marca FLOAT);")
+        conexion.execute("INSERT OR REPLACE INTO LatidoReplicacion VALUES (1, ?);", (time.time() - atraso,))
+
+
+@pytest.fixture
+def bases(crear_bd):
+    primaria = crear_bd("primaria.db")
+    replica = crear_bd("replica.db")
+    preparar(primaria, "primaria")
+    preparar(replica, "replica")
+    return primaria, replica
+
+
+def leer(lecturas, desfase_maximo):
+    return asyncio.run(lecturas.vista(desfase_maximo).consultar(QUERY_ORIGEN))[0][0]
+
+
+def test_el_primer_latido_crea_la_tabla_en_la_primaria(bases):
+    primaria, replica = bases
+    lecturas = LecturasEnrutadas(primaria, replica)
+
+    # La réplica todavía no recibe la tabla: no hay retraso medible
+    with pytest.raises(sqlite3.OperationalError):
+        asyncio.run(lecturas.medir())
+    with sqlite3.connect(primaria.ruta) as conexion:
+        (marca,) = conexion.execute("SELECT Marca FROM LatidoReplicacion WHERE LatidoID = 1;").fetchone()
+    assert abs(marca - time.time()) < 5
+
+    # Cuando la tabla llega a la réplica se mide; el segundo latido actualiza la misma fila
+    atrasar_replica(replica, 0)
+    assert asyncio.run(lecturas.medir()) < 5
+    with sqlite3.connect(primaria.ruta) as conexion:
+        assert conexion.execute("SELECT COUNT(*) FROM LatidoReplicacion;").fetchone()[0] == 1
+
+
+def test_sin_medicion_lee_de_la_primaria(bases):
+    lecturas = LecturasEnrutadas(*bases)
+    assert lecturas.retraso is None
+    assert leer(lecturas, 3600) == "primaria"
+
+
+def test_respeta_el_desfase_de_cada_vista(bases):
+    primaria, replica = bases
+    lecturas = LecturasEnrutadas(primaria, replica)
+    atrasar_replica(replica, 30)
+    retraso = asyncio.run(lecturas.medir())
+    assert 30 <= retraso < 35
+
+    assert leer(lecturas, 60) == "replica"
+    assert leer(lecturas, 10) == "primaria"
+    stats = lecturas.estadisticas()
+    assert stats["replica"] == 1 and stats["primaria"] == 1
+
+
+def test_si_la_replica_falla_usa_la_primaria_y_la_pausa(bases):
+    primaria, replica = bases
+    lecturas = LecturasEnrutadas(primaria, replica, pausa_fallo=60)
+    atrasar_replica(replica, 0)
+    asyncio.run(lecturas.medir())
+    assert leer(lecturas, 10) == "replica"
+
+    with sqlite3.connect(replica.ruta) as conexion:
+        conexion.execute("DROP TABLE Datos;")
+    assert leer(lecturas, 10) == "primaria"
+    stats = lecturas.estadisticas()
+    assert stats["fallos_replica"] == 1 and stats["respaldos"] == 1
+
+    # Durante la pausa ni siquiera se intenta la réplica
+    assert leer(lecturas, 10) == "primaria"
+    assert lecturas.estadisticas()["fallos_replica"] == 1
+
+
+def test_leer_en_lotes_cambia_a_la_primaria_antes_del_primer_lote(bases):
+    primaria, replica = bases
+    lecturas = LecturasEnrutadas(primaria, replica)
+    lecturas.retraso = 0.0
+    with sqlite3.connect(replica.ruta) as conexion:
+        conexion.execute("DROP TABLE Datos;")
+
+    async def todas():
+        return [fila async for lote in lecturas.vista(10).consultar_en_lotes(QUERY_ORIGEN) for fila in lote]
+
+    assert [fila[0] for fila in asyncio.run(todas())] == ["primaria"]
+    assert lecturas.estadisticas()["respaldos"] == 1
+
+
+def test_fallo_al_medir_deja_el_retraso_sin_medir(bases):
+    primaria, replica = bases
+    lecturas = LecturasEnrutadas(primaria, replica, intervalo=0.01)
+    lecturas.retraso = 0.0
+
+    async def una_vuelta():
+        lecturas.iniciar()
+        await asyncio.sleep(0.2)
+        await lecturas.cerrar()
+
+    # La réplica no tiene LatidoReplicacion: el ciclo no puede medir y deja de usarla
+    asyncio.run(una_vuelta())
+    assert lecturas.retraso is None
+    assert leer(lecturas, 3600) == "primaria"
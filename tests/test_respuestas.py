@@ -0,0 +1,42 @@
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from respuestas import CompresionMiddleware
+
+TEXTO = "evento de prueba\n" * 200
+
+
+def cliente():
+    def ruta(tipo):
+        return lambda request: Response(TEXTO, media_type=tipo)
+
+    app = Starlette(routes=[
+        Route("/texto", ruta("text/plain")),
+        Route("/eventos", ruta("text/event-stream")),
+        Route("/corto", lambda request: Response("ok", media_type="text/plain")),
+    ])
+    app.add_middleware(CompresionMiddleware)
+    return TestClient(app)
+
+
+def test_comprime_texto_con_gzip_o_brotli():
+    with cliente() as cl:
+        for codificacion in ("gzip", "br"):
+            respuesta = cl.get("/texto", headers={"Accept-Encoding": codificacion})
+            assert respuesta.headers["content-encoding"] == codificacion
+            assert respuesta.text == TEXTO
+
+
+def test_no_comprime_flujos_de_eventos():
+    with cliente() as cl:
+        respuesta = cl.get("/eventos", headers={"Accept-Encoding": "gzip, br"})
+        assert "content-encoding" not in respuesta.headers
+        assert respuesta.text == TEXTO
+
+
+def test_no_comprime_respuestas_cortas():
+    with cliente() as cl:
+        respuesta = cl.get("/corto", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in respuesta.headers
@@ -0,0 +1,124 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from sesiones import AlmacenMemoria, AlmacenSQL, GestorSesiones
+
+
+def ejecutar(corrutina):
+    return asyncio.run(corrutina)
+
+
+def test_crea_y_resuelve_la_sesion():
+    gestor = GestorSesiones(AlmacenMemoria(), "secreto")
+    token = ejecutar(gestor.crear({"cliente_id": 7}))
+    assert ejecutar(gestor.obtener(token)) == {"cliente_id": 7}
+
+
+def test_sin_secreto():
+    with pytest.raises(ValueError):
+        GestorSesiones(AlmacenMemoria(), "")
+
+
+@pytest.mark.parametrize("alterar", [
+    lambda token: token[:-1] + ("0" if token[-1] != "0" else "1"),
+    lambda token: "otro" + token,
+    lambda token: token.split(".")[0],
+    lambda token: "",
+    lambda token: None,
+])
+def test_rechaza_tokens_alterados(alterar):
+    gestor = GestorSesiones(AlmacenMemoria(), "secreto")
+    token = ejecutar(gestor.crear({"cliente_id": 7}))
+    assert ejecutar(gestor.obtener(alterar(token))) is None
+
+
+def test_la_firma_no_consulta_el_almacen():
+    class AlmacenVigilado(AlmacenMemoria):
+        lecturas = 0
+
+        async def obtener(self, token):
+            self.lecturas += 1
+            return await super().obtener(token)
+
+    almacen = AlmacenVigilado()
+    gestor = GestorSesiones(almacen, "secreto")
+    ejecutar(gestor.obtener("inventado.0123456789abcdef0123456789abcdef"))
+    assert almacen.lecturas == 0
+
+
+def test_otro_secreto_no_valida_el_token():
+    almacen = AlmacenMemoria()
+    token = ejecutar(GestorSesiones(almacen, "secreto").crear({"cliente_id": 7}))
+    assert ejecutar(GestorSesiones(almacen, "otro secreto").obtener(token)) is None
+
+
+def test_cerrar_elimina_la_sesion():
+    gestor = GestorSesiones(AlmacenMemoria(), "secreto")
+    token = ejecutar(gestor.crear({"cliente_id": 7}))
+    ejecutar(gestor.cerrar(token))
+    assert ejecutar(gestor.obtener(token)) is None
+
+
+def test_expira_en_memoria(monkeypatch):
+    gestor = GestorSesiones(AlmacenMemoria(ttl=60), "secreto")
+    token = ejecutar(gestor.crear({"cliente_id": 7}))
+    ahora = time.time()
+    monkeypatch.setattr(time, "time", lambda: ahora + 61)
+    assert ejecutar(gestor.obtener(token)) is None
+
+
+def test_memoria_descarta_la_menos_usada():
+    almacen = AlmacenMemoria(max_sesiones=2)
+    ejecutar(almacen.guardar("a", {"n": 1}))
+    ejecutar(almacen.guardar("b", {"n": 2}))
+    ejecutar(almacen.obtener("a"))
+    ejecutar(almacen.guardar("c", {"n": 3}))
+    assert ejecutar(almacen.obtener("b")) is None
+    assert ejecutar(almacen.obtener("a")) == {"n": 1}
+
+
+def test_los_datos_guardados_no_se_comparten():
+    almacen = AlmacenMemoria()
+    datos = {"n": 1}
+    ejecutar(almacen.guardar("a", datos))
+    datos["n"] = 2
+    ejecutar(almacen.obtener("a"))["n"] = 3
+    assert ejecutar(almacen.obtener("a")) == {"n": 1}
+
+
+def test_almacen_sql_crea_la_tabla_y_expira(crear_bd, monkeypatch):
+    bd = crear_bd("sesiones.db")
+    almacen = AlmacenSQL(bd, ttl=60)
+    gestor = GestorSesiones(almacen, "secreto")
+    token = ejecutar(gestor.crear({"cliente_id": 7, "tipo": "cliente"}))
+    assert ejecutar(gestor.obtener(token)) == {"cliente_id": 7, "tipo": "cliente"}
+
+    # Renovar la sesión actualiza la fila en lugar de duplicarla
+    sesion_id = token.rsplit(".", 1)[0]
+    ejecutar(almacen.guardar(sesion_id, {"cliente_id": 8}))
+    with sqlite3.connect(bd.ruta) as conexion:
+        assert conexion.execute("SELECT COUNT(*) FROM SesionesWeb;").fetchone()[0] == 1
+
+    ahora = time.time()
+    monkeypatch.setattr(time, "time", lambda: ahora + 61)
+    assert ejecutar(gestor.obtener(token)) is None
+    with sqlite3.connect(bd.ruta) as conexion:
+        assert conexion.execute("SELECT COUNT(*) FROM SesionesWeb;").fetchone()[0] == 0
+
+
+def test_almacen_sql_purga_las_expiradas(crear_bd):
+    bd = crear_bd("sesiones.db")
+    almacen = AlmacenSQL(bd, ttl=60, intervalo_purga=0.01)
+    ejecutar(almacen.guardar("vigente", {"n": 1}))
+    ejecutar(bd.ejecutar("INSERT INTO SesionesWeb (Token, Datos, Expira) VALUES ('vieja', '{}', 1);"))
+
+    async def una_purga():
+        await almacen.iniciar()
+        await asyncio.sleep(0.1)
+        await almacen.cerrar()
+
+    ejecutar(una_purga())
+    assert ejecutar(bd.consultar("SELECT Token FROM SesionesWeb;")) == [("vigente",)]